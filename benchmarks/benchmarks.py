@@ -0,0 +1,169 @@
+"""Benchmarks of the pkmodel hot paths, for airspeed velocity (asv).
+
+Methods named time_* are timed, peakmem_* measure the peak memory of the
+process and track_* record the value they return. See asv.conf.json.
+
+"""
+import numpy
+import pkmodel as pk
+
+
+def make_model(delivery_mode, num_compartments):
+    """Returns a model with the given number of peripheral compartments.
+    """
+    model = pk.Model(delivery_mode, V_c=2.0, CL=0.5, Ka=1.5)
+    for i in range(num_compartments):
+        model.add_compartment(1.0 + i, 0.5)
+    return model
+
+
+class RightHandSide:
+    """The cost of one evaluation of the right-hand side of the ODE system,
+    against the number of peripheral compartments.
+    """
+    params = (['ode', 'compiled'], [0, 1, 2, 4, 8])
+    param_names = ['backend', 'compartments']
+
+    def setup(self, backend, num_compartments):
+        model = make_model('sc', num_compartments)
+        protocol = pk.Protocol(initial_dose=10.0)
+        solution = pk.Solution(backend=backend)
+        if backend == 'compiled':
+            self.system = solution.compiled_system(model, protocol)
+        else:
+            self.system = lambda t, q: solution.ode_system(
+                q, t, model, protocol)
+        self.q = numpy.ones(num_compartments + 2)
+
+    def time_rhs(self, backend, num_compartments):
+        self.system(0.5, self.q)
+
+
+class SingleSolve:
+    """The latency of solving one model and protocol pair.
+    """
+    params = (['iv', 'sc'], ['ode', 'compiled', 'analytic'])
+    param_names = ['delivery_mode', 'backend']
+
+    def setup(self, delivery_mode, backend):
+        self.model = make_model(delivery_mode, 1)
+        self.protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        self.time = numpy.linspace(0, 24, 1000)
+        self.solution = pk.Solution(backend=backend)
+
+    def time_solution(self, delivery_mode, backend):
+        self.solution.solution(self.model, self.protocol, self.time)
+
+    def time_regimen(self, delivery_mode, backend):
+        protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        protocol.add_bolus(10.0, time=4.0, interval=4.0, repeats=5)
+        self.solution.solution(self.model, protocol, self.time)
+
+
+class Population:
+    """The throughput of solving a population of subjects in one batch.
+    """
+    params = (['compiled', 'analytic'], [100, 1000, 10000])
+    param_names = ['backend', 'subjects']
+    timeout = 120
+
+    def setup(self, backend, num_subjects):
+        if backend == 'compiled' and num_subjects > 1000:
+            # a stacked ODE system this large takes minutes
+            raise NotImplementedError
+        rng = numpy.random.default_rng(0)
+        self.parameters = {
+            'V_c': rng.uniform(1.0, 3.0, num_subjects),
+            'CL': rng.uniform(0.2, 1.0, num_subjects),
+            'Ka': 1.5, 'V_p': [4.0], 'Q_p': [0.8]}
+        self.protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        self.time = numpy.linspace(0, 24, 1000)
+        self.solution = pk.Solution(backend=backend)
+
+    def time_solve_population(self, backend, num_subjects):
+        self.solution.solve_population('sc', self.protocol, self.time,
+                                       **self.parameters)
+
+    def track_subjects_per_second(self, backend, num_subjects):
+        import timeit
+        seconds = min(timeit.repeat(
+            lambda: self.time_solve_population(backend, num_subjects),
+            number=1, repeat=3))
+        return num_subjects / seconds
+
+    track_subjects_per_second.unit = 'subjects/s'
+
+
+class LongHorizon:
+    """The memory used by a 90 day daily regimen at minute resolution,
+    solved at once or streamed window by window.
+    """
+    params = ['analytic', 'compiled']
+    param_names = ['backend']
+    timeout = 300
+
+    def setup(self, backend):
+        self.model = make_model('sc', 1)
+        self.protocol = pk.Protocol(initial_dose=10.0, time_span=24 * 90)
+        self.protocol.add_bolus(10.0, time=24.0, interval=24.0, repeats=89)
+        self.time_res = 24 * 90 * 60 + 1
+        self.solution = pk.Solution(backend=backend)
+
+    def peakmem_solution(self, backend):
+        self.solution.solution(
+            self.model, self.protocol,
+            numpy.linspace(0, self.protocol.time_span, self.time_res),
+            full_output=True)
+
+    def peakmem_stream(self, backend):
+        for _ in self.solution.stream(self.model, self.protocol,
+                                      time_res=self.time_res, window=10000):
+            pass
+
+
+class Import:
+    """The time to import pkmodel in a new interpreter, as each worker
+    process of Solution.solve_all does.
+    """
+    def timeraw_import_pkmodel(self):
+        return 'import pkmodel'
+
+    def timeraw_import_plotting(self):
+        return 'import pkmodel.plotting'
+
+    def track_modules_loaded_on_import(self):
+        import subprocess
+        import sys
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; import pkmodel; print(len(sys.modules))'])
+        return int(output)
+
+    track_modules_loaded_on_import.unit = 'modules'
+
+
+class Plotting:
+    """Rendering already solved pairs headless to a file, as lines or as
+    percentile bands.
+    """
+    params = (['lines', 'bands'], [10, 1000])
+    param_names = ['style', 'num_pairs']
+
+    def setup(self, style, num_pairs):
+        import os
+        import tempfile
+        self.solution = pk.Solution(backend='analytic')
+        protocol = pk.Protocol(initial_dose=10.0, time_span=24.0)
+        for V_c in numpy.linspace(1.0, 3.0, num_pairs):
+            self.solution.add(pk.Model('iv', V_c=float(V_c)), protocol)
+        self.results = self.solution.solve_all(time_res=200, workers=1)
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'figure.png')
+
+    def teardown(self, style, num_pairs):
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def time_visualise(self, style, num_pairs):
+        self.solution.visualise(time_res=200, style=style,
+                                results=self.results, filename=self.filename)
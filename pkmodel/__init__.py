@@ -8,6 +8,13 @@ of Parmokinetic (PK) models
 from .version_info import VERSION_INT, VERSION  # noqa
 
 # Import main classes
-from .model import Model    # noqa
+from .model import Model, FrozenModel    # noqa
 from .protocol import Protocol    # noqa
 from .solution import Solution     # noqa
+from .trajectory import Trajectory     # noqa
+from .cache import ResultCache     # noqa
+from .store import ResultStore     # noqa
+from .instrumentation import Instrumentation     # noqa
+from .sweep import Sweep     # noqa
+from .dense import DenseSolution     # noqa
+from .population import Population     # noqa
@@ -0,0 +1,335 @@
+"""Closed-form solutions of the linear ODE systems built by pkmodel Models.
+
+The central and peripheral compartments of a Model exchange drug through
+symmetric clearances, so their rate matrix is similar to a symmetric matrix
+and has real, non-positive eigenvalues. The solution is then a sum of
+exponential modes, which can be evaluated on a whole time grid, and for a
+whole batch of parameter sets, in a few vectorised NumPy operations.
+
+"""
+import numpy
+
+# number of (subject, time) elements evaluated at once by LinearModes
+BLOCK_SIZE = 16384
+
+
+def exp_difference(lam, mu, t):
+    """Returns (exp(lam t) - exp(mu t)) / (lam - mu), the response of a mode
+    with rate lam to an exponential input with rate mu. Evaluated stably,
+    including the limit t exp(lam t) when lam == mu.
+
+    Args:
+        lam, mu (array-like): the two rates [/h], broadcastable with t
+        t (array-like): non-negative times [hours]
+
+    Returns:
+        numpy (ndarray): the broadcast result
+    """
+    hi = numpy.maximum(lam, mu)
+    z = (numpy.minimum(lam, mu) - hi) * t
+    # expm1(z) / z is accurate for small z and tends to 1 as z -> 0
+    nonzero = z != 0
+    ratio = numpy.ones_like(z)
+    numpy.divide(numpy.expm1(z), z, out=ratio, where=nonzero)
+    return numpy.exp(hi * t) * t * ratio
+
+
+def _exp_difference(exp_lam, exp_mu, lam, mu, t):
+    """Returns exp_difference(lam, mu, t) given exp(lam t) and exp(mu t),
+    taking the quotient of differences directly wherever it is accurate.
+    """
+    d = lam - mu
+    out = numpy.subtract(exp_lam, exp_mu)
+    shape = out.shape
+    # the quotient loses precision as (lam - mu) t -> 0
+    close = numpy.abs(d * t) < 1e-3
+    out /= numpy.where(d == 0, 1.0, d)
+    if numpy.any(close):
+        close = numpy.broadcast_to(close, shape)
+        out[close] = exp_difference(numpy.broadcast_to(lam, shape)[close],
+                                    numpy.broadcast_to(mu, shape)[close],
+                                    numpy.broadcast_to(t, shape)[close])
+    return out
+
+
+def _ramp_response(free, lam, t):
+    """Returns the response of a mode with rate lam to a unit ramp input,
+    the integral of exp(lam (t - s)) s from 0 to t, given free, its response
+    exp_difference(lam, 0, t) to a constant input.
+    """
+    z = lam * t
+    shape = numpy.broadcast(free, z).shape
+    out = numpy.empty(shape)
+    # the quotient loses precision as lam t -> 0, where the series is used
+    close = numpy.broadcast_to(numpy.abs(z) < 1e-3, shape)
+    numpy.divide(free - t, numpy.where(z == 0, 1.0, lam), out=out)
+    if numpy.any(close):
+        z = numpy.broadcast_to(z, shape)[close]
+        out[close] = (0.5 * numpy.broadcast_to(t, shape)[close] ** 2
+                      * (1 + z / 3 + z ** 2 / 12 + z ** 3 / 60))
+    return out
+
+
+def _mode_response(t, lam, z, g, rate, slope, absorption=None):
+    """Returns the amplitude over time of one mode, with rate lam, of the
+    disposition state, for LinearModes._evaluate: the decay of its initial
+    projection z, plus its responses, with weight g, to a dose rate
+    rate + slope t and, for 'sc' models, to the absorption of the depot
+    q_0, given as the tuple (ka, exp(-ka t), q_0).
+    """
+    exp_lam = numpy.exp(lam * t)
+    coef = z * exp_lam
+    if absorption is not None:
+        ka, exp_ka, q_0 = absorption
+        absorbed = _exp_difference(exp_lam, exp_ka, lam, -ka, t)
+        coef += g * ka * q_0 * absorbed
+    infusion = numpy.any(rate != 0)
+    ramp = numpy.any(slope != 0)
+    if not (infusion or ramp):
+        return coef
+    free = _exp_difference(exp_lam, 1.0, lam, 0.0, t)
+    if ramp:
+        ramped = _ramp_response(free, lam, t)
+    if absorption is not None:
+        free -= absorbed
+    if infusion:
+        coef += g * rate * free
+    if ramp:
+        # for 'sc', the ramp is first absorbed from q_0
+        if absorption is not None:
+            ramped -= free / ka
+        coef += g * slope * ramped
+    return coef
+
+
+def _depot_response(t, rate, slope, ka, exp_ka, q_0):
+    """Returns the depot q_0 of an 'sc' model over time, for
+    LinearModes._evaluate, given exp(-ka t).
+    """
+    out = q_0 * exp_ka
+    ramp = numpy.any(slope != 0)
+    if numpy.any(rate != 0) or ramp:
+        free = _exp_difference(exp_ka, 1.0, -ka, 0.0, t)
+        out += rate * free
+        if ramp:
+            out += slope * _ramp_response(free, -ka, t)
+    return out
+
+
+def _parameters(V_c, CL, Ka, V_p, Q_p):
+    """Broadcasts model parameters to arrays with a leading subject axis.
+
+    Returns:
+        V_c, CL, Ka (numpy ndarray): shape (N,)
+        V_p, Q_p (numpy ndarray): shape (N, k)
+    """
+    V_c = numpy.atleast_1d(numpy.asarray(V_c, dtype=float))
+    CL = numpy.atleast_1d(numpy.asarray(CL, dtype=float))
+    Ka = numpy.atleast_1d(numpy.asarray(Ka, dtype=float))
+    if V_p is None or Q_p is None:
+        V_p = Q_p = numpy.zeros((1, 0))
+    V_p = numpy.atleast_2d(numpy.asarray(V_p, dtype=float))
+    Q_p = numpy.atleast_2d(numpy.asarray(Q_p, dtype=float))
+    # the leading axes of V_p and Q_p, which may have no columns
+    N = numpy.broadcast(V_c, CL, Ka, numpy.broadcast_to(0.0, V_p.shape[:1]),
+                        numpy.broadcast_to(0.0, Q_p.shape[:1])).shape[0]
+    k = numpy.broadcast(V_p, Q_p).shape[1]
+    return (numpy.broadcast_to(V_c, (N,)), numpy.broadcast_to(CL, (N,)),
+            numpy.broadcast_to(Ka, (N,)), numpy.broadcast_to(V_p, (N, k)),
+            numpy.broadcast_to(Q_p, (N, k)))
+
+
+def rate_matrices(delivery_mode: str, V_c, CL, Ka, V_p=None, Q_p=None):
+    """Builds the rate matrices of a batch of models, as returned for a
+    single model by Model.linear_system.
+
+    Args:
+        delivery_mode (str): 'iv' or 'sc'
+        V_c, CL, Ka (array-like): shape (N,) or scalars
+        V_p, Q_p (array-like): shape (N, k) or (k,) for k peripheral
+            compartments, None for no peripheral compartments
+
+    Returns:
+        numpy (ndarray): shape (N, n, n)
+    """
+    if delivery_mode not in ['iv', 'sc']:
+        raise ValueError('delivery_mode must be "iv" or "sc"')
+    V_c, CL, Ka, V_p, Q_p = _parameters(V_c, CL, Ka, V_p, Q_p)
+    N, k = V_p.shape
+    c = 0 if delivery_mode == 'iv' else 1
+    A = numpy.zeros((N, k + c + 1, k + c + 1))
+    if delivery_mode == 'sc':
+        A[:, 0, 0] = -Ka
+        A[:, 1, 0] = Ka
+    peripheral = numpy.arange(c + 1, c + k + 1)
+    A[:, c, c] = -(CL + numpy.sum(Q_p, axis=1)) / V_c
+    A[:, c, peripheral] = Q_p / V_p
+    A[:, peripheral, c] = Q_p / V_c[:, None]
+    A[:, peripheral, peripheral] = -Q_p / V_p
+    return A
+
+
+def rate_matrix_derivatives(delivery_mode: str, V_c, CL, Ka, V_p=None,
+                            Q_p=None):
+    """Builds the derivatives of the rate matrices of a batch of models with
+    respect to their parameters, ordered V_c, CL, Ka, V_p[0], ..., V_p[k-1],
+    Q_p[0], ..., Q_p[k-1].
+
+    Args:
+        as for rate_matrices
+
+    Returns:
+        numpy (ndarray): shape (N, 3 + 2 k, n, n)
+    """
+    if delivery_mode not in ['iv', 'sc']:
+        raise ValueError('delivery_mode must be "iv" or "sc"')
+    V_c, CL, Ka, V_p, Q_p = _parameters(V_c, CL, Ka, V_p, Q_p)
+    N, k = V_p.shape
+    c = 0 if delivery_mode == 'iv' else 1
+    dA = numpy.zeros((N, 3 + 2 * k, k + c + 1, k + c + 1))
+    peripheral = numpy.arange(c + 1, c + k + 1)
+    p_V = numpy.arange(3, 3 + k)
+    p_Q = numpy.arange(3 + k, 3 + 2 * k)
+    # V_c
+    dA[:, 0, c, c] = (CL + numpy.sum(Q_p, axis=1)) / V_c ** 2
+    dA[:, 0, peripheral, c] = -Q_p / V_c[:, None] ** 2
+    # CL
+    dA[:, 1, c, c] = -1 / V_c
+    # Ka
+    if delivery_mode == 'sc':
+        dA[:, 2, 0, 0] = -1
+        dA[:, 2, 1, 0] = 1
+    # V_p and Q_p of each peripheral compartment
+    dA[:, p_V, c, peripheral] = -Q_p / V_p ** 2
+    dA[:, p_V, peripheral, peripheral] = Q_p / V_p ** 2
+    dA[:, p_Q, c, c] = -1 / V_c[:, None]
+    dA[:, p_Q, c, peripheral] = 1 / V_p
+    dA[:, p_Q, peripheral, c] = 1 / V_c[:, None]
+    dA[:, p_Q, peripheral, peripheral] = -1 / V_p
+    return dA
+
+
+class LinearModes:
+    """The exponential modes of one model, or of a batch of N models with the
+    same delivery mode and number of compartments. Parameters are given as
+    arrays with a leading subject axis of length N.
+    """
+    def __init__(self, delivery_mode: str, V_c, CL, Ka, V_p=None, Q_p=None):
+        """Computes the modes from the model parameters.
+
+        Args:
+            delivery_mode (str): 'iv' or 'sc'
+            V_c, CL, Ka (array-like): shape (N,) or scalars
+            V_p, Q_p (array-like): shape (N, k) or (k,) for k peripheral
+                compartments, None for no peripheral compartments
+        """
+        if delivery_mode not in ['iv', 'sc']:
+            raise ValueError('delivery_mode must be "iv" or "sc"')
+        V_c, CL, Ka, V_p, Q_p = _parameters(V_c, CL, Ka, V_p, Q_p)
+        N, k = V_p.shape
+        # volumes (N, m) of the central and peripheral compartments
+        volumes = numpy.empty((N, k + 1))
+        volumes[:, 0] = V_c
+        volumes[:, 1:] = V_p
+        if numpy.any(volumes <= 0):
+            raise ValueError('Compartment volumes must be positive')
+        # dq/dt = -K (q / V) with K the symmetric clearance matrix
+        K = numpy.zeros((N, k + 1, k + 1))
+        K[:, 0, 0] = CL + numpy.sum(Q_p, axis=1)
+        diag = numpy.arange(1, k + 1)
+        K[:, 0, diag] = -Q_p
+        K[:, diag, 0] = -Q_p
+        K[:, diag, diag] = Q_p
+        root = numpy.sqrt(volumes)
+        S = K / root[:, :, None] / root[:, None, :]
+        eigenvalues, U = numpy.linalg.eigh(S)
+        self.delivery_mode = delivery_mode
+        self.ka = Ka
+        # rates lam (N, m) and A = P diag(lam) P^-1 for the disposition block
+        self.lam = -eigenvalues
+        self.P = root[:, :, None] * U
+        self.P_inv = numpy.swapaxes(U, 1, 2) / root[:, None, :]
+
+    @classmethod
+    def from_model(cls, model):
+        """Returns the modes of a single pkmodel Model (N = 1).
+        """
+        compartments = numpy.array(model.list_compartments(),
+                                   dtype=float).reshape(-1, 2)
+        return cls(model.delivery_mode, model.v_c, model.cl, model.ka,
+                   compartments[:, 0], compartments[:, 1])
+
+    @property
+    def num_variables(self) -> int:
+        """int: the length of the state vector q, as in Solution.ode_system
+        """
+        return self.lam.shape[1] + (self.delivery_mode == 'sc')
+
+    def evaluate(self, t, q0, rate=0.0, rows=None, slope=0.0):
+        """Evaluates the state at times t after starting from the state q0
+        at t = 0, with a dose rate into q_0 of rate + slope t throughout.
+
+        Args:
+            t (array-like): non-negative times, shape (T,) shared by all
+                subjects or (N, T) per subject [hours]
+            q0 (array-like): initial states, shape (n,) or (N, n)
+            rate (array-like): dose rate into q_0, scalar or shape (N,)
+                [ng/h]
+            rows (list of int): indices of the state variables to return,
+                defaults to all of them
+            slope (array-like): rate of change of the dose rate, scalar or
+                shape (N,) [ng/h^2]
+
+        Returns:
+            numpy (ndarray): shape (N, len(rows), T)
+        """
+        t = numpy.asarray(t, dtype=float)
+        t = t.reshape(1, -1) if t.ndim <= 1 else t
+        q0 = numpy.atleast_2d(numpy.asarray(q0, dtype=float))
+        rate = numpy.asarray(rate, dtype=float).reshape(-1, 1)
+        slope = numpy.asarray(slope, dtype=float).reshape(-1, 1)
+        if rows is None:
+            rows = range(self.num_variables)
+        rows = list(rows)
+        N = numpy.broadcast(q0[:, 0:1], rate, slope, t[:, 0:1],
+                            self.lam[:, 0:1]).shape[0]
+        out = numpy.empty((N, len(rows), t.shape[1]))
+        if t.shape[1] == 0:
+            # a segment between events with no time points in it
+            return out
+        # work through the subjects in blocks so that the temporary
+        # (subjects, time) arrays stay small enough to remain in cache
+        block = max(1, BLOCK_SIZE // t.shape[1])
+        for start in range(0, N, block):
+            subjects = slice(start, start + block)
+            select = lambda a: a if len(a) == 1 else a[subjects]
+            out[subjects] = self._evaluate(
+                select(t), select(q0), select(rate), rows,
+                select(self.lam), select(self.P), select(self.P_inv),
+                select(self.ka[:, None]), select(slope))
+        return out
+
+    def _evaluate(self, t, q0, rate, rows, lam, P, P_inv, ka, slope):
+        """Evaluates one block of subjects for LinearModes.evaluate.
+        """
+        sc = self.delivery_mode == 'sc'
+        # projection of the initial disposition state onto the modes, and
+        # the weights with which an input into q_c excites each mode
+        z = (P_inv @ q0[:, sc:, None])[..., 0]
+        g = P_inv[:, :, 0]
+        N = numpy.broadcast(z[:, 0:1], rate, slope, t[:, 0:1], ka).shape[0]
+        out = numpy.zeros((N, len(rows), t.shape[1]))
+        absorption = None
+        if sc:
+            absorption = (ka, numpy.exp(-ka * t), q0[:, 0:1])
+        for j in range(lam.shape[1]):
+            coef = _mode_response(t, lam[:, j, None], z[:, j, None],
+                                  g[:, j, None], rate, slope, absorption)
+            for i, row in enumerate(rows):
+                if sc and row == 0:
+                    continue
+                out[:, i, :] += P[:, row - sc, j, None] * coef
+        for i, row in enumerate(rows):
+            if sc and row == 0:
+                out[:, i, :] = _depot_response(t, rate, slope, *absorption)
+        return out
@@ -0,0 +1,89 @@
+import collections
+import numpy
+
+
+class ResultCache:
+    """The ResultCache class memoizes solutions in memory, keyed by the
+    parameters they were solved with (see Solution.cache_key). The least
+    recently used solutions are evicted once the cache holds more than its
+    memory budget.
+    """
+    def __init__(self, max_bytes: int = 256 * 2 ** 20,
+                 cache_dose_functions: bool = True):
+        """Initialises an empty cache.
+
+        Args:
+            max_bytes (int): the memory budget for the cached arrays,
+                defaults to 256 MiB
+            cache_dose_functions (bool): whether to cache solutions of
+                protocols with a dose function. These are keyed by the
+                identity of the function, so a function which is changed
+                in place (e.g. through a global it reads) after being
+                added to a protocol must not be cached
+        """
+        if type(max_bytes) != int or max_bytes < 0:
+            raise ValueError('max_bytes must be a non-negative integer')
+        self.max_bytes = max_bytes
+        self.cache_dose_functions = cache_dose_functions
+        self.hits = 0
+        self.misses = 0
+        self.__Entries = collections.OrderedDict()
+        self.__Nbytes = 0
+
+    def __len__(self) -> int:
+        """Returns the number of cached solutions.
+        """
+        return len(self.__Entries)
+
+    def __contains__(self, key) -> bool:
+        """Returns whether a solution is cached for the key.
+        """
+        return key in self.__Entries
+
+    @property
+    def nbytes(self) -> int:
+        """int: the memory held by the cached arrays [bytes]
+        """
+        return self.__Nbytes
+
+    def get(self, key):
+        """Returns a copy of the cached solution for the key, marking it as
+        most recently used, or None if it is not cached.
+
+        Args:
+            key (tuple): the key, as from Solution.cache_key
+        """
+        value = self.__Entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__Entries.move_to_end(key)
+        return value.copy()
+
+    def put(self, key, value):
+        """Caches a copy of a solution, evicting the least recently used
+        solutions to stay within the memory budget. Solutions larger than
+        the whole budget are not cached.
+
+        Args:
+            key (tuple): the key, as from Solution.cache_key
+            value (numpy ndarray or Trajectory): the solution
+        """
+        value = numpy.array(value) if isinstance(
+            value, (list, numpy.ndarray)) else value.copy()
+        if value.nbytes > self.max_bytes:
+            return
+        if key in self.__Entries:
+            self.__Nbytes -= self.__Entries.pop(key).nbytes
+        self.__Entries[key] = value
+        self.__Nbytes += value.nbytes
+        while self.__Nbytes > self.max_bytes:
+            _, evicted = self.__Entries.popitem(last=False)
+            self.__Nbytes -= evicted.nbytes
+
+    def clear(self):
+        """Removes all cached solutions.
+        """
+        self.__Entries.clear()
+        self.__Nbytes = 0
@@ -0,0 +1,309 @@
+"""Batch runs of pkmodel from spec files on the command line.
+
+A spec is a JSON file, or a YAML file with PyYAML installed, describing
+(model, protocol) pairs and populations to solve:
+
+    {
+        "solution": {"backend": "analytic"},
+        "time_res": 1000,
+        "pairs": [
+            {"model": {"delivery_mode": "iv", "V_c": 2.0, "CL": 0.5,
+                       "compartments": [{"V_p": 4.0, "Q_p": 0.8}]},
+             "protocol": {"initial_dose": 10.0, "time_span": 24,
+                          "boluses": [{"amount": 5.0, "time": 12.0}]}}
+        ],
+        "populations": [
+            {"model": {"delivery_mode": "sc"},
+             "protocol": {"time_span": 24},
+             "omega": [0.09, 0.04], "parameters": ["CL", "V_c"],
+             "num_subjects": 10000, "seed": 1}
+        ]
+    }
+
+"solution" holds the arguments of Solution (backend, method, rtol and
+atol). A model holds the arguments of Model and a list of peripheral
+compartments. A protocol holds the arguments of Protocol and lists of the
+arguments of Protocol.add_bolus, add_infusion, add_schedule and
+add_rate_table, as "boluses", "infusions", "schedules" and "rate_tables".
+A population holds a model and protocol, and the arguments of Population
+and Population.run. "time_res" is the number of time points over each
+protocol's time span, and "percentiles" those of the population summaries.
+
+The solutions of the pairs are written to the output file by
+Solution.export, and the summaries of the populations to a second file.
+Solutions are kept in a ResultStore next to the output as they are solved,
+so running the same command again after an interruption solves only what
+is missing. The store is removed once the outputs are written, unless it
+was given with --store or --keep-store is used.
+
+    python -m pkmodel spec.json -o results.parquet --workers 8
+
+"""
+import argparse
+import json
+import os
+import shutil
+import numpy
+import pkmodel as pk
+from .export import write_table
+
+SPEC_KEYS = ['solution', 'time_res', 'percentiles', 'pairs', 'populations']
+MODEL_KEYS = ['delivery_mode', 'V_c', 'CL', 'Ka', 'compartments']
+PROTOCOL_KEYS = ['initial_dose', 'time_span', 'boluses', 'infusions',
+                 'schedules', 'rate_tables']
+POPULATION_KEYS = ['model', 'protocol', 'omega', 'parameters',
+                   'num_subjects', 'seed', 'concentration', 'batch_size',
+                   'relative_accuracy']
+
+
+def _check_keys(entry, keys, what):
+    """Raises a ValueError unless entry is a dict with only the given keys.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError('A {} must be a mapping'.format(what))
+    unknown = set(entry) - set(keys)
+    if unknown:
+        raise ValueError('Unknown keys {} in a {}; the keys are {}'
+                         .format(sorted(unknown), what, keys))
+
+
+def load_spec(path: str) -> dict:
+    """Reads a spec from a JSON file, or a YAML file (.yaml or .yml).
+
+    Args:
+        path (str): the file
+
+    Returns:
+        dict: the spec
+    """
+    with open(path) as f:
+        if os.path.splitext(path)[1].lower() in ['.yaml', '.yml']:
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('YAML specs need PyYAML, which can be '
+                                  'installed with "pip install pyyaml"')
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    _check_keys(spec, SPEC_KEYS, 'spec')
+    return spec
+
+
+def build_model(entry: dict):
+    """Returns the Model described by a spec entry.
+
+    Args:
+        entry (dict): the arguments of Model, and a list of "compartments",
+            each with the V_p and Q_p of a peripheral compartment
+    """
+    _check_keys(entry, MODEL_KEYS, 'model')
+    entry = dict(entry)
+    compartments = entry.pop('compartments', [])
+    model = pk.Model(**entry)
+    for compartment in compartments:
+        _check_keys(compartment, ['V_p', 'Q_p'], 'compartment')
+        model.add_compartment(compartment['V_p'], compartment['Q_p'])
+    return model
+
+
+def build_protocol(entry: dict):
+    """Returns the Protocol described by a spec entry.
+
+    Args:
+        entry (dict): the arguments of Protocol, and lists of the
+            arguments of Protocol.add_bolus, add_infusion, add_schedule and
+            add_rate_table, as "boluses", "infusions", "schedules" and
+            "rate_tables"
+    """
+    _check_keys(entry, PROTOCOL_KEYS, 'protocol')
+    protocol = pk.Protocol(**{name: entry[name] for name in
+                              ['initial_dose', 'time_span'] if name in entry})
+    for name, add in [('boluses', protocol.add_bolus),
+                      ('infusions', protocol.add_infusion),
+                      ('schedules', protocol.add_schedule),
+                      ('rate_tables', protocol.add_rate_table)]:
+        for arguments in entry.get(name, []):
+            if not isinstance(arguments, dict):
+                raise ValueError('The {} of a protocol must be mappings'
+                                 .format(name))
+            add(**arguments)
+    return protocol
+
+
+def _population(solution, entry, time_res, percentiles, workers, store):
+    """Runs a population of a spec, or reads its summary from the store.
+
+    Returns:
+        numpy (ndarray): the time points, the mean and the percentiles of
+        the population, in rows
+    """
+    _check_keys(entry, POPULATION_KEYS, 'population')
+    for name in ['omega', 'num_subjects']:
+        if name not in entry:
+            raise ValueError('A population needs "{}"'.format(name))
+    key = ('population', json.dumps(entry, sort_keys=True), time_res,
+           tuple(percentiles), solution.backend, solution.method,
+           solution.rtol, solution.atol)
+    summary = None if store is None else store.get(key)
+    if summary is not None:
+        return numpy.array(summary)
+    protocol = build_protocol(entry.get('protocol', {}))
+    population = pk.Population(
+        build_model(entry.get('model', {})), entry['omega'],
+        parameters=entry.get('parameters'), solution=solution,
+        batch_size=entry.get('batch_size', 1024),
+        concentration=entry.get('concentration', False))
+    result = population.run(
+        protocol, numpy.linspace(0, protocol.time_span, time_res),
+        entry['num_subjects'], seed=entry.get('seed'),
+        percentiles=percentiles, workers=workers,
+        relative_accuracy=entry.get('relative_accuracy', 0.005))
+    summary = numpy.vstack([result['time'], result['mean'], result['bands']])
+    if store is not None:
+        store.put(key, summary, {'population': entry})
+    return summary
+
+
+def _settings(spec, backend, time_res):
+    """Returns the arguments of Solution and the number of time points of a
+    spec, overridden by those given.
+    """
+    settings = dict(spec.get('solution', {}))
+    _check_keys(settings, ['backend', 'method', 'rtol', 'atol'], 'solution')
+    if backend is not None:
+        settings['backend'] = backend
+    if time_res is None:
+        time_res = spec.get('time_res', 1000)
+    if type(time_res) != int or time_res < 2:
+        raise ValueError('time_res must be an integer of at least 2')
+    return settings, time_res
+
+
+def _populations(solution, entries, time_res, percentiles, workers, store):
+    """Runs the populations of a spec and returns their summaries as the
+    columns of a table, with a row for each time point of each population,
+    or an empty dict if there are none.
+    """
+    columns = {}
+    for i, entry in enumerate(entries):
+        rows = _population(solution, entry, time_res, percentiles, workers,
+                           store)
+        columns.setdefault('population', []).append(
+            numpy.full(rows.shape[1], i))
+        columns.setdefault('time', []).append(rows[0])
+        columns.setdefault('mean', []).append(rows[1])
+        for percentile, band in zip(percentiles, rows[2:]):
+            columns.setdefault('p{:g}'.format(percentile), []).append(band)
+    return {name: numpy.concatenate(value)
+            for name, value in columns.items()}
+
+
+def run(spec: dict, output: str, populations=None, backend=None,
+        workers: int = 1, time_res=None, full_output: bool = False,
+        group_size: int = 64, file_format=None, store=None,
+        keep_store: bool = False) -> dict:
+    """Solves the pairs and populations of a spec and writes them out.
+
+    Args:
+        spec (dict): the spec, as from load_spec
+        output (str): the file of the solutions of the pairs, whose
+            extension gives its format, as for Solution.export
+        populations (str): the file of the summaries of the populations,
+            with a row for each time point of each population. Defaults to
+            output with '.populations' before the extension
+        backend (str): the backend of Solution, overriding the spec
+        workers (int): the number of worker processes
+        time_res (int): the number of time points, overriding the spec
+        full_output (bool): whether to write every compartment of the pairs
+        group_size (int): the number of pairs written together
+        file_format (str): the format of both files, if not given by the
+            extension of output
+        store (str): the directory of the ResultStore from which a run
+            resumes, which is kept. Defaults to output with '.store'
+            appended, which is removed once the outputs are written
+        keep_store (bool): whether to keep the default store
+
+    Returns:
+        dict: the number of 'pairs' and 'populations', and the 'rows'
+        written for each
+    """
+    settings, time_res = _settings(spec, backend, time_res)
+    percentiles = spec.get('percentiles', [5, 50, 95])
+    pairs = [(build_model(entry.get('model', {})),
+              build_protocol(entry.get('protocol', {})))
+             for entry in spec.get('pairs', [])]
+    if populations is None:
+        stem, extension = os.path.splitext(output)
+        populations = stem + '.populations' + extension
+    remove_store = store is None and not keep_store
+    if store is None:
+        store = output + '.store'
+    results = pk.ResultStore(store)
+    solution = pk.Solution(store=results, **settings)
+    for model, protocol in pairs:
+        solution.add(model, protocol)
+
+    summary = {'pairs': len(pairs),
+               'populations': len(spec.get('populations', [])), 'rows': {}}
+    if pairs:
+        summary['rows'][output] = solution.export(
+            output, time_res, full_output, group_size, workers, file_format)
+    columns = _populations(solution, spec.get('populations', []),
+                           time_res, percentiles, workers, results)
+    if columns:
+        write_table(populations, columns, file_format)
+        summary['rows'][populations] = len(columns['time'])
+    if remove_store:
+        shutil.rmtree(store)
+    return summary
+
+
+def main(argv=None) -> int:
+    """Runs the command line interface, as described in the module.
+
+    Args:
+        argv (list of str): the arguments, defaulting to sys.argv
+
+    Returns:
+        int: the exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog='pkmodel', description='Solves the pharmacokinetic models, '
+        'protocols and populations of a JSON or YAML spec and writes the '
+        'results to .npz, Parquet or Arrow files.')
+    parser.add_argument('spec', help='the JSON or YAML spec file')
+    parser.add_argument('-o', '--output', required=True,
+                        help='the file of the solutions of the pairs')
+    parser.add_argument('--populations',
+                        help='the file of the summaries of the populations')
+    parser.add_argument('--backend', choices=['ode', 'compiled', 'analytic'],
+                        help='the backend, overriding the spec')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='the number of worker processes')
+    parser.add_argument('--time-res', type=int,
+                        help='the number of time points, overriding the spec')
+    parser.add_argument('--full-output', action='store_true',
+                        help='write every compartment of the pairs')
+    parser.add_argument('--group-size', type=int, default=64,
+                        help='the number of pairs written at once')
+    parser.add_argument('--format', dest='file_format',
+                        choices=['npz', 'parquet', 'arrow'],
+                        help='the file format, if not given by the extension')
+    parser.add_argument('--store',
+                        help='the directory of results kept for resuming')
+    parser.add_argument('--keep-store', action='store_true',
+                        help='keep the store once the outputs are written')
+    args = parser.parse_args(argv)
+    try:
+        summary = run(load_spec(args.spec), args.output, args.populations,
+                      args.backend, args.workers, args.time_res,
+                      args.full_output, args.group_size, args.file_format,
+                      args.store, args.keep_store)
+    except (ValueError, TypeError, KeyError, OSError, ImportError) as e:
+        parser.exit(1, 'pkmodel: error: {}\n'.format(e))
+    print('Solved {} pairs and {} populations'.format(
+        summary['pairs'], summary['populations']))
+    for path, rows in summary['rows'].items():
+        print('Wrote {} rows to {}'.format(rows, path))
+    return 0
@@ -0,0 +1,122 @@
+import numpy
+
+
+class ModalPiece:
+    """The closed-form solution of a model over one segment between the
+    events of a regimen, as used by DenseSolution.
+    """
+    def __init__(self, modes, start: float, q0, rate: float,
+                 slope: float = 0.0):
+        """Initialises the piece from the state at its start.
+
+        Args:
+            modes (LinearModes object): the modes of the model (N = 1)
+            start (float): the start of the segment [hours]
+            q0 (numpy ndarray): the state at start, after any bolus then
+            rate (float): the dose rate into q_0 at start [ng/h]
+            slope (float): the constant rate of change of the dose rate
+                [ng/h^2]
+        """
+        self.modes = modes
+        self.start = start
+        self.q0 = q0
+        self.rate = rate
+        self.slope = slope
+
+    def __call__(self, t):
+        """Returns the state at times t in the segment, shape (n, len(t)).
+        """
+        return self.modes.evaluate(numpy.asarray(t) - self.start, self.q0,
+                                   self.rate, slope=self.slope)[0]
+
+
+class ConstantPiece:
+    """The state over an empty segment, such as that of a bolus at the end
+    of the time span, as used by DenseSolution.
+    """
+    def __init__(self, q0):
+        """Initialises the piece from its state.
+
+        Args:
+            q0 (numpy ndarray): the state, after any bolus at the segment
+        """
+        self.q0 = numpy.array(q0, dtype=float)
+
+    def __call__(self, t):
+        """Returns the state at times t, shape (n, len(t)).
+        """
+        return numpy.repeat(self.q0[:, None], numpy.size(t), axis=1)
+
+
+class DenseSolution:
+    """The DenseSolution class holds the solution of a model and protocol
+    pair as a function of time, which can be evaluated at any times within
+    its time span after solving, rather than at a grid chosen in advance.
+    It is made of one piece per segment between the events of the
+    protocol's regimen: the solver's dense output (a SciPy OdeSolution) or
+    the closed-form solution of the 'analytic' backend. It can be pickled,
+    and only holds the interpolants, not the solution on a grid.
+    """
+    def __init__(self, delivery_mode: str, starts, stop: float, pieces):
+        """Initialises the solution from its pieces.
+
+        Args:
+            delivery_mode (str): the delivery mode of the model, 'iv' or 'sc'
+            starts (array-like): the increasing start times of the pieces
+                [hours]
+            stop (float): the end of the last piece [hours]
+            pieces (list): callables which return the state at times within
+                their segment, with shape (n, len(t))
+        """
+        if delivery_mode not in ['iv', 'sc']:
+            raise ValueError('delivery_mode must be "iv" or "sc"')
+        if len(starts) != len(pieces) or len(pieces) == 0:
+            raise ValueError('There must be one start time for each piece')
+        self.delivery_mode = delivery_mode
+        self.starts = numpy.asarray(starts, dtype=float)
+        self.stop = stop
+        self.pieces = list(pieces)
+
+    @property
+    def t_span(self):
+        """tuple: the first and last time at which the solution can be
+        evaluated [hours]
+        """
+        return self.starts[0], self.stop
+
+    def __call__(self, t):
+        """Evaluates every state variable at the times t. At the time of a
+        bolus, the state includes the bolus.
+
+        Args:
+            t (array-like): times within t_span, in any order [hours]
+
+        Returns:
+            numpy (ndarray): shape (n, len(t)) for an array of times, or
+            (n,) for a scalar time
+        """
+        t = numpy.asarray(t, dtype=float)
+        flat = t.ravel()
+        if numpy.any(flat < self.starts[0]) or numpy.any(flat > self.stop):
+            raise ValueError('Times must be within the time span {}'
+                             .format(self.t_span))
+        index = numpy.searchsorted(self.starts, flat, side='right') - 1
+        out = None
+        for k in numpy.unique(index):
+            points = index == k
+            y = self.pieces[k](flat[points])
+            if out is None:
+                out = numpy.empty((len(y), len(flat)))
+            out[:, points] = y
+        if out is None:
+            return numpy.empty((0, 0))
+        return out.reshape((-1,) + t.shape)
+
+    def central(self, t):
+        """Evaluates the central compartment at the times t, as returned by
+        Solution.solution.
+
+        Args:
+            t (array-like): times within t_span [hours]
+        """
+        return self(t)[1 if self.delivery_mode == 'sc' else 0]
@@ -0,0 +1,136 @@
+"""Fewer time points for plotting and exporting solutions.
+
+Profiles on a fixed, evenly spaced grid have more points than needed where
+they are flat, such as the elimination tail, and too few where they bend
+sharply, such as around an absorption peak. lttb picks the points of a
+dense profile which best keep its shape, and adaptive_grid places points
+by the error of linear interpolation between them, evaluating a
+DenseSolution only where it is needed.
+
+"""
+import numpy
+
+
+def lttb(x, y, num_points: int):
+    """Selects points of a series by Largest-Triangle-Three-Buckets
+    downsampling: the first and last points are kept, the rest are split
+    into num_points - 2 buckets, and from each bucket the point forming the
+    largest triangle with the point kept before it and the average of the
+    next bucket is kept.
+
+    Args:
+        x (array-like): the increasing x values, such as times, shape (T,)
+        y (array-like): the y values, shape (T,)
+        num_points (int): the number of points to keep, at least 3
+
+    Returns:
+        numpy (ndarray): the increasing indices of the kept points
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    if x.shape != y.shape or x.ndim != 1:
+        raise ValueError('x and y must be 1-D with the same length')
+    if type(num_points) != int or num_points < 3:
+        raise ValueError('num_points must be an integer of at least 3')
+    n = len(x)
+    if num_points >= n:
+        return numpy.arange(n)
+    # bucket i holds the points edges[i] up to edges[i + 1], and the last
+    # point forms a bucket of its own
+    edges = (numpy.arange(num_points - 1) * (n - 2) / (num_points - 2)
+             ).astype(int) + 1
+    edges[-1] = n - 1
+    edges = numpy.append(edges, n)
+    # the averages of the buckets do not depend on the points chosen
+    counts = numpy.diff(edges)
+    mean_x = numpy.add.reduceat(x, edges[:-1]) / counts
+    mean_y = numpy.add.reduceat(y, edges[:-1]) / counts
+    kept = numpy.empty(num_points, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(num_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        area = numpy.abs((x[a] - mean_x[i + 1]) * (y[start:stop] - y[a])
+                         - (x[a] - x[start:stop]) * (mean_y[i + 1] - y[a]))
+        a = start + int(numpy.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def adaptive_grid(dense, rtol: float = 1e-3, atol: float = 1e-9,
+                  max_points: int = 10000, initial_points: int = 17):
+    """Places time points over the span of a DenseSolution so that linear
+    interpolation between them is within the tolerances. Each piece of the
+    solution, between the events of the regimen, starts from a few evenly
+    spaced points, and every interval whose midpoint is not within the
+    tolerances of the line between its ends is split, until none is or
+    there are max_points points. Where a bolus makes the state jump, the
+    event time appears twice: before and after the bolus. If the pieces
+    alone need more than max_points points, as for long regimens of many
+    doses, the grid is reduced to max_points by lttb of the central
+    compartment, and the tolerances are not met.
+
+    Args:
+        dense (DenseSolution): the solution
+        rtol (float): the tolerance relative to each state variable
+        atol (float): the absolute tolerance [ng]
+        max_points (int): the most time points, at least 3
+        initial_points (int): the most points of each piece before
+            refining
+
+    Returns:
+        t (numpy ndarray): the non-decreasing time points [hours]
+        y (numpy ndarray): the state at those times, shape (n, len(t))
+    """
+    if type(max_points) != int or max_points < 3:
+        raise ValueError('max_points must be an integer of at least 3')
+    if type(initial_points) != int or initial_points < 2:
+        raise ValueError('initial_points must be an integer of at least 2')
+    ends = numpy.append(dense.starts, dense.stop)
+    pieces = list(dense.pieces)
+    # share the points among the pieces, each of which needs its ends; an
+    # empty piece, as for a bolus at the end of the span, has one point
+    num_points = max(2, min(initial_points, max_points // len(pieces)))
+    times = [numpy.linspace(ends[k], ends[k + 1],
+                            num_points if ends[k + 1] > ends[k] else 1)
+             for k in range(len(pieces))]
+    states = [numpy.atleast_2d(piece(t)) for piece, t in zip(pieces, times)]
+    refine = [True] * len(pieces)
+    while any(refine):
+        for k, piece in enumerate(pieces):
+            if not refine[k]:
+                continue
+            t, y = times[k], states[k]
+            middle = 0.5 * (t[:-1] + t[1:])
+            y_middle = numpy.atleast_2d(piece(middle))
+            error = numpy.abs(y_middle - 0.5 * (y[:, :-1] + y[:, 1:]))
+            split = numpy.any(error > rtol * numpy.abs(y_middle) + atol,
+                              axis=0)
+            # stop at max_points, or where intervals can be split no more
+            split &= middle > t[:-1]
+            room = max_points - sum(len(times_k) for times_k in times)
+            split[numpy.flatnonzero(split)[max(room, 0):]] = False
+            if not numpy.any(split):
+                refine[k] = False
+                continue
+            order = numpy.argsort(numpy.concatenate([t, middle[split]]),
+                                  kind='stable')
+            times[k] = numpy.concatenate([t, middle[split]])[order]
+            states[k] = numpy.concatenate([y, y_middle[:, split]],
+                                          axis=1)[:, order]
+    # join the pieces, keeping an event time twice only at a jump
+    t, y = [times[0]], [states[0]]
+    for k in range(1, len(times)):
+        before, after = y[-1][:, -1], states[k][:, 0]
+        jump = numpy.any(numpy.abs(after - before)
+                         > rtol * numpy.abs(after) + atol)
+        first = 0 if jump else 1
+        t.append(times[k][first:])
+        y.append(states[k][:, first:])
+    t, y = numpy.concatenate(t), numpy.concatenate(y, axis=1)
+    if len(t) > max_points:
+        kept = lttb(t, y[1 if dense.delivery_mode == 'sc' else 0],
+                    max_points)
+        t, y = t[kept], y[:, kept]
+    return t, y
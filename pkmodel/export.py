@@ -0,0 +1,368 @@
+"""Bulk export and import of solutions in columnar files.
+
+The solutions of all the (model, protocol) pairs of a Solution are written
+as one table in long format: a row for every time point of every pair,
+with the parameters of the pair's model and protocol alongside, so that
+the table can be filtered and grouped directly by data frame libraries.
+The columns are
+
+    pair, model, protocol, delivery_mode, V_c, CL, Ka, V_p[i], Q_p[i],
+    initial_dose, time_span, time, q_c
+
+where model and protocol are their names, there are V_p[i] and Q_p[i]
+columns for every peripheral compartment i of the largest model, NaN for
+models with fewer, and q_c is the amount in the central compartment [ng].
+With full_output, the q_c column is followed by q_0 (NaN for 'iv' models)
+and q_p[i], the amounts in the other compartments.
+
+Three formats are supported, chosen by the file extension: compressed
+NumPy .npz files, with one member per column, and, with pyarrow
+installed, Parquet (.parquet) and Arrow IPC (.arrow or .feather) files.
+Pairs are written in groups, one row group or record batch each, as they
+are solved over a single process pool, so the whole table is never held
+in memory. In .npz files the
+columns of the model and protocol parameters, from model to time_span,
+hold one value per pair rather than per row, and are expanded by
+read_results.
+
+"""
+import itertools
+import os
+import shutil
+import tempfile
+import zipfile
+import numpy
+import numpy.lib.format
+
+FORMATS = {'.npz': 'npz', '.parquet': 'parquet', '.arrow': 'arrow',
+           '.feather': 'arrow'}
+
+
+def _pyarrow():
+    """Imports pyarrow, which is only needed for Parquet and Arrow files.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet and Arrow files need pyarrow, which can '
+                          'be installed with "pip install pyarrow"')
+    return pyarrow
+
+
+def _format(path, file_format):
+    """Returns the format of a file, 'npz', 'parquet' or 'arrow', from its
+    extension unless it is given.
+    """
+    if file_format is None:
+        file_format = FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format not in FORMATS.values():
+        raise ValueError('The file format must be one of {}, or given by '
+                         'the extensions {}'.format(
+                             sorted(set(FORMATS.values())), sorted(FORMATS)))
+    return file_format
+
+
+def _per_pair(name) -> bool:
+    """Returns whether a column holds a parameter of the pairs, which has
+    the same value in every row of a pair.
+    """
+    return name not in ['pair', 'time'] and not name.startswith('q_')
+
+
+def _columns(pairs, full_output):
+    """Returns the dtypes of the columns of a table of pairs, keyed by
+    name in order.
+    """
+    peripheral = max([len(model.v_p) for model, protocol in pairs] + [0])
+    width = max([len(model.name) for model, protocol in pairs]
+                + [len(protocol.name) for model, protocol in pairs] + [1])
+    dtypes = {'pair': numpy.int64, 'model': '<U{}'.format(width),
+              'protocol': '<U{}'.format(width), 'delivery_mode': '<U2',
+              'V_c': float, 'CL': float, 'Ka': float}
+    for name in ['V_p', 'Q_p']:
+        for i in range(peripheral):
+            dtypes['{}[{}]'.format(name, i)] = float
+    for name in ['initial_dose', 'time_span', 'time', 'q_c']:
+        dtypes[name] = float
+    if full_output:
+        dtypes['q_0'] = float
+        for i in range(peripheral):
+            dtypes['q_p[{}]'.format(i)] = float
+    return {name: numpy.dtype(dtype) for name, dtype in dtypes.items()}
+
+
+def _parameters(pairs, dtypes):
+    """Returns the parameter columns of the pairs, with one value per pair.
+    """
+    parameters = {name: numpy.full(len(pairs), numpy.nan)
+                  for name in dtypes if _per_pair(name)}
+    parameters.update(
+        model=[model.name for model, protocol in pairs],
+        protocol=[protocol.name for model, protocol in pairs],
+        delivery_mode=[model.delivery_mode for model, protocol in pairs],
+        V_c=[model.v_c for model, protocol in pairs],
+        CL=[model.cl for model, protocol in pairs],
+        Ka=[model.ka for model, protocol in pairs],
+        initial_dose=[protocol.initial_dose for model, protocol in pairs],
+        time_span=[protocol.time_span for model, protocol in pairs])
+    for j, (model, protocol) in enumerate(pairs):
+        for i in range(len(model.v_p)):
+            parameters['V_p[{}]'.format(i)][j] = model.v_p[i]
+            parameters['Q_p[{}]'.format(i)][j] = model.q_p[i]
+    return {name: numpy.asarray(value, dtype=dtypes[name])
+            for name, value in parameters.items()}
+
+
+def _rows(index, model, trajectory, dtypes):
+    """Returns the solution columns of one pair, with a row per time point.
+    """
+    num_times = len(trajectory.t)
+    rows = {name: numpy.full(num_times, numpy.nan) for name in dtypes
+            if not _per_pair(name)}
+    rows.update(pair=numpy.full(num_times, index, dtype=numpy.int64),
+                time=trajectory.t, q_c=trajectory.central)
+    if 'q_0' in dtypes:
+        if model.delivery_mode == 'sc':
+            rows['q_0'] = trajectory.data[1]
+        for i, q_p in enumerate(trajectory.peripheral):
+            rows['q_p[{}]'.format(i)] = q_p
+    return rows
+
+
+class _NpzWriter:
+    """Writes a table to an .npz file. The solution columns are spooled to
+    temporary files until the number of rows, needed by the .npy headers,
+    is known.
+    """
+    def __init__(self, temporary, dtypes, parameters):
+        self.temporary = temporary
+        self.dtypes = dtypes
+        self.parameters = parameters
+        self.directory = tempfile.TemporaryDirectory(
+            dir=os.path.dirname(temporary))
+        self.files = {name: open(os.path.join(self.directory.name, str(i)),
+                                 'wb')
+                      for i, name in enumerate(dtypes) if not _per_pair(name)}
+        self.num_rows = 0
+
+    def write(self, columns):
+        for name, f in self.files.items():
+            f.write(numpy.ascontiguousarray(
+                columns[name], dtype=self.dtypes[name]).tobytes())
+        self.num_rows += len(columns['pair'])
+
+    def discard(self):
+        for f in self.files.values():
+            f.close()
+        self.directory.cleanup()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        try:
+            with zipfile.ZipFile(self.temporary, 'w', zipfile.ZIP_DEFLATED,
+                                 allowZip64=True) as archive:
+                for name, dtype in self.dtypes.items():
+                    with archive.open(name + '.npy', 'w',
+                                      force_zip64=True) as member:
+                        if _per_pair(name):
+                            numpy.lib.format.write_array(
+                                member, self.parameters[name])
+                            continue
+                        numpy.lib.format.write_array_header_1_0(member, {
+                            'descr': numpy.lib.format.dtype_to_descr(dtype),
+                            'fortran_order': False,
+                            'shape': (self.num_rows,)})
+                        with open(self.files[name].name, 'rb') as spool:
+                            shutil.copyfileobj(spool, member)
+        finally:
+            self.directory.cleanup()
+
+
+class _ArrowWriter:
+    """Writes a table to a Parquet or Arrow IPC file with pyarrow, one row
+    group or record batch per write.
+    """
+    def __init__(self, temporary, dtypes, parameters, file_format):
+        pyarrow = _pyarrow()
+        self.parameters = parameters
+        self.schema = pyarrow.schema([
+            (name, pyarrow.string() if dtype.kind == 'U'
+             else pyarrow.from_numpy_dtype(dtype))
+            for name, dtype in dtypes.items()])
+        self.parquet = file_format == 'parquet'
+        if self.parquet:
+            self.writer = pyarrow.parquet.ParquetWriter(temporary,
+                                                        self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(temporary, self.schema)
+
+    def write(self, columns):
+        pyarrow = _pyarrow()
+        pair = columns['pair']
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(self.parameters[field.name][pair]
+                           if _per_pair(field.name)
+                           else columns[field.name], type=field.type)
+             for field in self.schema], schema=self.schema)
+        if self.parquet:
+            self.writer.write_table(table, row_group_size=len(table))
+        else:
+            self.writer.write_table(table)
+
+    def discard(self):
+        self.writer.close()
+
+    def close(self):
+        self.writer.close()
+
+
+def _group_columns(group, results, start, dtypes):
+    """Returns the solution columns of a group of pairs, the first of which
+    is pair start, from their results.
+    """
+    rows = []
+    for i, ((model, protocol), result) in enumerate(zip(group, results)):
+        if isinstance(result, Exception):
+            raise result
+        rows.append(_rows(start + i, model, result, dtypes))
+    return {name: numpy.concatenate([row[name] for row in rows])
+            for name in rows[0]}
+
+
+def _write_groups(writer, solution, time_res, group_size, workers, dtypes):
+    """Solves the pairs of a Solution, over a single process pool, and
+    writes them in groups in turn, returning the number of rows written.
+    """
+    pairs = solution.list_compartments
+    results = solution._iter_pairs(pairs, time_res, workers, group_size)
+    num_rows = 0
+    try:
+        for start in range(0, len(pairs), group_size):
+            group = pairs[start:start + group_size]
+            columns = _group_columns(
+                group, itertools.islice(results, len(group)), start, dtypes)
+            writer.write(columns)
+            num_rows += len(columns['pair'])
+    finally:
+        results.close()
+    return num_rows
+
+
+def write_results(solution, path: str, time_res: int = 1000,
+                  full_output: bool = False, group_size: int = 64,
+                  workers: int = 1, file_format=None) -> int:
+    """Solves all the (model, protocol) pairs of a Solution and writes
+    their solutions to a columnar file, as described in the module. The
+    file is written under a temporary name and then renamed, so it is
+    never seen partially written.
+
+    Args:
+        solution (Solution object): the pairs, and how they are solved
+        path (str): the file
+        time_res (int): the number of time points of each pair, between 0
+            and its protocol time span
+        full_output (bool): whether to write every compartment, rather
+            than the central compartment only
+        group_size (int): the number of pairs written together, as one row
+            group or record batch, and the most sent to a worker at once
+        workers (int): the number of worker processes, as for
+            Solution.solve_all, which are started once and kept busy
+            across the groups
+        file_format (str): 'npz', 'parquet' or 'arrow', if not given by
+            the extension of path
+
+    Returns:
+        int: the number of rows written
+    """
+    file_format = _format(path, file_format)
+    if type(group_size) != int or group_size < 1:
+        raise ValueError('group_size must be a positive integer')
+    pairs = solution.list_compartments
+    dtypes = _columns(pairs, full_output)
+    parameters = _parameters(pairs, dtypes)
+    fd, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    os.close(fd)
+    try:
+        if file_format == 'npz':
+            writer = _NpzWriter(temporary, dtypes, parameters)
+        else:
+            writer = _ArrowWriter(temporary, dtypes, parameters, file_format)
+        try:
+            num_rows = _write_groups(writer, solution, time_res, group_size,
+                                     workers, dtypes)
+        except BaseException:
+            writer.discard()
+            raise
+        writer.close()
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return num_rows
+
+
+def write_table(path: str, columns, file_format=None):
+    """Writes a table held in memory, such as the summaries of populations,
+    to a file in one of the formats of write_results.
+
+    Args:
+        path (str): the file
+        columns (dict): the columns, as arrays of the same length keyed by
+            name
+        file_format (str): 'npz', 'parquet' or 'arrow', if not given by
+            the extension of path
+    """
+    file_format = _format(path, file_format)
+    columns = {name: numpy.asarray(value) for name, value in columns.items()}
+    fd, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if file_format == 'npz':
+                numpy.savez_compressed(f, **columns)
+            else:
+                pyarrow = _pyarrow()
+                table = pyarrow.table(columns)
+                if file_format == 'parquet':
+                    pyarrow.parquet.write_table(table, f)
+                else:
+                    with pyarrow.ipc.new_file(f, table.schema) as writer:
+                        writer.write_table(table)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def read_results(path: str, file_format=None) -> dict:
+    """Reads a file written by write_results or write_table.
+
+    Args:
+        path (str): the file
+        file_format (str): 'npz', 'parquet' or 'arrow', if not given by
+            the extension of path
+
+    Returns:
+        dict: the columns, as numpy arrays with a value per row, keyed by
+        name in order
+    """
+    file_format = _format(path, file_format)
+    if file_format == 'npz':
+        with numpy.load(path) as data:
+            if 'pair' not in data.files:
+                return {name: data[name] for name in data.files}
+            pair = data['pair']
+            return {name: data[name][pair] if _per_pair(name)
+                    else data[name] for name in data.files}
+    pyarrow = _pyarrow()
+    if file_format == 'parquet':
+        table = pyarrow.parquet.read_table(path)
+    else:
+        with pyarrow.ipc.open_file(path) as reader:
+            table = reader.read_all()
+    return {name: table.column(name).to_numpy() for name in table.column_names}
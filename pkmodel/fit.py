@@ -0,0 +1,178 @@
+"""Estimation of model parameters from observed concentrations.
+
+"""
+import numpy
+import scipy.optimize
+import pkmodel as pk
+from .sweep import Sweep
+
+
+def _parameters(model) -> dict:
+    """Returns the parameters of a Model as a single sample, keyed by the
+    names used by Sweep.sensitivities.
+    """
+    compartments = numpy.array(model.list_compartments(),
+                               dtype=float).reshape(-1, 2)
+    values = {'V_c': model.v_c, 'CL': model.cl, 'Ka': model.ka}
+    for i, (V_p, Q_p) in enumerate(compartments):
+        values['V_p[{}]'.format(i)] = V_p
+        values['Q_p[{}]'.format(i)] = Q_p
+    return values
+
+
+def _samples(values: dict, k: int) -> dict:
+    """Returns parameter values, as from _parameters, as the samples of a
+    Sweep.
+    """
+    samples = {name: numpy.array([values[name]])
+               for name in ['V_c', 'CL', 'Ka']}
+    for name in ['V_p', 'Q_p']:
+        samples[name] = numpy.array(
+            [[values['{}[{}]'.format(name, i)] for i in range(k)]])
+    return samples
+
+
+def _model(delivery_mode: str, values: dict, k: int):
+    """Returns a new Model with the given parameter values.
+    """
+    model = pk.Model(delivery_mode, V_c=float(values['V_c']),
+                     CL=float(values['CL']), Ka=float(values['Ka']))
+    for i in range(k):
+        model.add_compartment(float(values['V_p[{}]'.format(i)]),
+                              float(values['Q_p[{}]'.format(i)]))
+    return model
+
+
+def _data(times, observations, sigma):
+    """Returns the observation times, the observations and their standard
+    deviations as arrays of the same shape, checking the times increase.
+    """
+    times = numpy.asarray(times, dtype=float)
+    observations = numpy.asarray(observations, dtype=float)
+    if times.shape != observations.shape or times.ndim != 1:
+        raise ValueError('times and observations must be 1D arrays of the '
+                         'same length')
+    if numpy.any(numpy.diff(times) <= 0) or times[0] < 0:
+        raise ValueError('times must be non-negative and increasing')
+    sigma = numpy.broadcast_to(
+        numpy.ones(1) if sigma is None else numpy.asarray(sigma, float),
+        times.shape)
+    return times, observations, sigma
+
+
+def _fitted(model, values: dict, parameters, num_observations: int) -> list:
+    """Returns the names of the parameters to fit, defaulting to all those
+    of the model except Ka for 'iv' models.
+    """
+    if parameters is None:
+        parameters = [name for name in values
+                      if name != 'Ka' or model.delivery_mode == 'sc']
+    unknown = set(parameters) - set(values)
+    if unknown:
+        raise ValueError('Unknown parameters {}; the model has {}'
+                         .format(sorted(unknown), list(values)))
+    if len(parameters) > num_observations:
+        raise ValueError('There are more parameters than observations')
+    return parameters
+
+
+def _covariance(result, num_observations: int, log: bool):
+    """Returns the covariance of the fitted parameters from the
+    Gauss-Newton approximation of the Hessian, scaled by the residual
+    variance, and mapped to the parameters if fitted in their logarithms.
+    """
+    dof = max(num_observations - len(result.x), 1)
+    variance = 2 * result.cost / dof
+    covariance = numpy.linalg.pinv(result.jac.T @ result.jac) * variance
+    if log:
+        scale = numpy.exp(result.x)
+        covariance = covariance * scale[:, None] * scale[None, :]
+    return covariance
+
+
+def fit(model, protocol, times, observations, parameters=None, sigma=None,
+        solution=None, log: bool = True, **options) -> dict:
+    """Fits the parameters of a model to observed concentrations in the
+    central compartment, by weighted nonlinear least squares. The model is
+    solved only at the observation times, and the Jacobian of the residuals
+    comes from the forward sensitivity equations (see Sweep.sensitivities)
+    rather than finite differences.
+
+    Args:
+        model (Model object): the model, whose parameter values are the
+            starting point of the fit. Pass the model returned by a previous
+            fit to warm start from its estimates
+        protocol (Protocol object): the protocol, with the initial dose
+            given at time 0
+        times (array-like): the observation times, increasing [hours]
+        observations (array-like): the observed concentrations [ng/mL]
+        parameters (list of str): the parameters to fit, from 'V_c', 'CL',
+            'Ka', 'V_p[i]' and 'Q_p[i]'. Defaults to all the parameters of
+            the model, except Ka for 'iv' models
+        sigma (array-like): the standard deviations of the observations,
+            by which the residuals are weighted; defaults to 1
+        solution (Solution object): solves the model, giving the backend
+            and solver settings. Defaults to the 'analytic' backend with
+            tight tolerances for the sensitivities
+        log (bool): whether to fit the logarithms of the parameters, which
+            keeps them positive
+        options: further keyword arguments for scipy.optimize.least_squares
+
+    Returns:
+        dict: 'model', a new Model with the fitted parameters;
+        'parameters' and 'standard_errors', dicts keyed by the fitted
+        parameters; 'covariance', their covariance matrix; 'residuals', the
+        weighted residuals; 'cost', half their sum of squares; and
+        'success', 'nfev' and 'message' from the optimiser
+    """
+    if not isinstance(model, pk.Model):
+        raise TypeError('The model must be a pkmodel Model')
+    if type(protocol) != pk.Protocol:
+        raise TypeError('The protocol must be a pkmodel Protocol')
+    times, observations, sigma = _data(times, observations, sigma)
+    values = _parameters(model)
+    parameters = _fitted(model, values, parameters, len(times))
+    if solution is None:
+        solution = pk.Solution(backend='analytic', rtol=1e-8, atol=1e-10)
+    k = len(model.list_compartments())
+    # the initial dose is given at the first time point
+    start = int(times[0] > 0)
+    grid = numpy.concatenate([[0.0], times]) if start else times
+    sweep = Sweep(model.delivery_mode, protocol, grid, solution=solution,
+                  concentration=True)
+
+    def unpack(x):
+        fitted = dict(values)
+        fitted.update(zip(parameters, numpy.exp(x) if log else x))
+        return fitted
+
+    def residuals(x):
+        samples = _samples(unpack(x), k)
+        output = sweep.run(samples)['profiles'][0, start:]
+        return (output - observations) / sigma
+
+    def jacobian(x):
+        fitted = unpack(x)
+        sensitivities = sweep.sensitivities(_samples(fitted, k))
+        J = numpy.stack([sensitivities[name][0, start:] / sigma
+                         for name in parameters], axis=1)
+        if log:
+            J *= numpy.array([fitted[name] for name in parameters])
+        return J
+
+    x0 = numpy.array([values[name] for name in parameters], dtype=float)
+    if log:
+        if numpy.any(x0 <= 0):
+            raise ValueError('Log fitting needs positive starting values')
+        x0 = numpy.log(x0)
+    result = scipy.optimize.least_squares(residuals, x0, jac=jacobian,
+                                          **options)
+    fitted = unpack(result.x)
+    covariance = _covariance(result, len(times), log)
+    errors = numpy.sqrt(numpy.diag(covariance))
+    return {'model': _model(model.delivery_mode, fitted, k),
+            'parameters': {name: float(fitted[name]) for name in parameters},
+            'standard_errors': dict(zip(parameters, errors.tolist())),
+            'covariance': covariance, 'residuals': result.fun,
+            'cost': result.cost, 'success': result.success,
+            'nfev': result.nfev, 'message': result.message}
@@ -0,0 +1,173 @@
+import collections
+import contextlib
+import time
+import numpy
+
+# the right-hand side evaluations per step of the explicit Runge-Kutta
+# methods of .solve_ivp(), and the extra evaluations per step for the
+# interpolant of DOP853
+_STAGES = {'RK23': (3, 0), 'RK45': (6, 0), 'DOP853': (12, 3)}
+
+
+class Instrumentation:
+    """The Instrumentation class records where the time goes when a Solution
+    solves model and protocol pairs. Give one to a Solution to switch it on;
+    without one, nothing is recorded and the solver is not slowed down.
+
+    For every pair solved by Solution.solution or Solution.solve_all, a
+    record is kept, as a dict with: 'model' and 'protocol', their names;
+    'backend' and 'method', the solver settings; 'cached', whether it was
+    read from the cache or store; 'seconds', the wall time of the call;
+    'rhs_calls' and 'rhs_seconds', the evaluations of the right-hand side
+    and the time spent in them; 'dose_calls' and 'dose_seconds', likewise
+    for the dose function (included in the right-hand side time); 'nfev',
+    'njev' and 'nlu', the solver statistics (zero if cached); 'steps' and
+    'rejected_steps', the accepted and rejected solver steps (None where the
+    method does not allow counting rejections); and 'status' and 'message',
+    the solver outcome, or the exception raised.
+    """
+    def __init__(self, callback=None):
+        """Initialises the instrumentation with no records.
+
+        Args:
+            callback (function): called with each record as it is completed,
+                for example to log pairs which were slow to solve
+        """
+        if callback is not None and not callable(callback):
+            raise TypeError('callback must be callable')
+        self.callback = callback
+        self.records = []
+        self.timings = collections.defaultdict(float)
+        self.__Current = None
+
+    def __getstate__(self):
+        """Pickles the records and timings, but not the callback, for
+        solving in worker processes.
+        """
+        return {'records': self.records, 'timings': dict(self.timings)}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.records = state['records']
+        self.timings.update(state['timings'])
+
+    def begin(self, model, protocol, backend: str, method: str):
+        """Starts the record of solving a model and protocol pair.
+        """
+        self.__Current = {
+            'model': model.name, 'protocol': protocol.name,
+            'backend': backend, 'method': method, 'cached': False,
+            'seconds': 0.0, 'rhs_calls': 0, 'rhs_seconds': 0.0,
+            'dose_calls': 0, 'dose_seconds': 0.0, 'nfev': 0, 'njev': 0,
+            'nlu': 0, 'steps': 0, 'rejected_steps': 0, 'status': 0,
+            'message': '', 'start': time.perf_counter()}
+
+    def end(self, result=None, cached: bool = False, error=None):
+        """Completes the current record.
+
+        Args:
+            result (Trajectory): the solution, for its solver statistics
+            cached (bool): whether the solution was read from the cache or
+                the store rather than solved
+            error (Exception): the exception raised by the solve, if any
+        """
+        record = self.__Current
+        if record is None:
+            return
+        self.__Current = None
+        record['seconds'] = time.perf_counter() - record.pop('start')
+        record['cached'] = cached
+        if result is not None and not cached:
+            record.update(result.stats, message=result.message)
+        if error is not None:
+            record.update(status=-1, message=repr(error))
+        self.add(record)
+
+    def add(self, record: dict):
+        """Adds a completed record, such as one made in a worker process.
+        """
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def count(self, function, name: str):
+        """Returns a wrapper of a function which counts its calls, and the
+        time spent in them, in the '<name>_calls' and '<name>_seconds' of
+        the current record.
+
+        Args:
+            function (function): the function to wrap
+            name (str): 'rhs' or 'dose'
+        """
+        calls, seconds = name + '_calls', name + '_seconds'
+
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                record = self.__Current
+                if record is not None:
+                    record[calls] += 1
+                    record[seconds] += time.perf_counter() - start
+
+        return wrapper
+
+    def add_steps(self, numerical_solution, method: str):
+        """Adds the steps of a .solve_ivp() call, made with dense output, to
+        the current record. Rejected steps are counted from the number of
+        right-hand side evaluations for the explicit Runge-Kutta methods.
+        """
+        record = self.__Current
+        if record is None:
+            return
+        steps = len(numerical_solution.sol.ts) - 1
+        record['steps'] += steps
+        if method in _STAGES and record['rejected_steps'] is not None:
+            stages, extra = _STAGES[method]
+            attempts = (numerical_solution.nfev - 2 - extra * steps) // stages
+            record['rejected_steps'] += attempts - steps
+        else:
+            record['rejected_steps'] = None
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        """Adds the wall time of a block of code to timings[name].
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def report(self, slowest: int = 5) -> dict:
+        """Returns a summary of the records.
+
+        Args:
+            slowest (int): the number of slowest records to include
+
+        Returns:
+            dict: 'solves', 'cached' and 'failed', the numbers of records;
+            the totals of 'seconds', 'rhs_calls', 'rhs_seconds',
+            'dose_calls', 'dose_seconds', 'nfev' and 'steps' over all the
+            records; 'timings', the times of other operations such as
+            plotting; and 'slowest', the slowest records
+        """
+        summary = {
+            'solves': len(self.records),
+            'cached': sum(record['cached'] for record in self.records),
+            'failed': sum(record['status'] < 0 for record in self.records)}
+        for name in ['seconds', 'rhs_calls', 'rhs_seconds', 'dose_calls',
+                     'dose_seconds', 'nfev', 'steps']:
+            summary[name] = sum(record[name] for record in self.records)
+        summary['timings'] = dict(self.timings)
+        order = numpy.argsort([-record['seconds'] for record in self.records],
+                              kind='stable')
+        summary['slowest'] = [self.records[i] for i in order[:slowest]]
+        return summary
+
+    def clear(self):
+        """Removes all the records and timings.
+        """
+        self.records = []
+        self.timings.clear()
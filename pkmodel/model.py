@@ -1,9 +1,35 @@
+import numpy
+
+
+def _read_only(values):
+    """Returns a read-only float array of the values.
+    """
+    values = numpy.array(values, dtype=float)
+    values.setflags(write=False)
+    return values
+
+
+def _rebuild(cls, delivery_mode, V_c, CL, Ka, V_p, Q_p):
+    """Rebuilds a pickled Model or FrozenModel from its parameters.
+    """
+    model = Model(delivery_mode, V_c, CL, Ka)
+    for V_p_new, Q_p_new in zip(V_p, Q_p):
+        model.add_compartment(V_p_new, Q_p_new)
+    return model if cls is Model else model.freeze()
+
+
 class Model:
     """The Model class holds the pharmacokinetic parameters chosen for the model.
     The delivery method can be specified, including options for
     intravenous or subcutaneous dosing.
     The Ka property is an absorption rate relevant for non-intravenous dosing.
+    The parameters of the peripheral compartments are held in arrays, and
+    the name and rate matrix are computed once and reused until the model
+    is changed.
     """
+    __slots__ = ('__delivery_mode', '__V_c', '__CL', '__Ka', '__V_p',
+                 '__Q_p', '__Name', '__System')
+
     def __init__(self, delivery_mode: str, V_c=1.0, CL=1.0, Ka=1.0):
         """Initialises a model with chosen pharmacokinetic parameters and name.
         Defaults to central compartment with V_c = 1.0 mL, CL = 1.0 mL/h, and
@@ -36,14 +62,32 @@ class Model:
         self.__V_c = V_c
         self.__CL = CL
         self.__Ka = Ka
-        """V_p (list of floats): Initialises empty string to hold V_p
+        """V_p (numpy ndarray): Initialises empty array to hold V_p
            for all additional compartments, the volume of the each additional
            compartment [mL]."""
-        self.__V_p = []
-        """Q_p (list of floats): Initialises empty string to hold Q_p
+        self.__V_p = _read_only([])
+        """Q_p (numpy ndarray): Initialises empty array to hold Q_p
             for all additional compartments, the transition rate between
             the central compartment and each peripheral compartment [mL/h]."""
-        self.__Q_p = []
+        self.__Q_p = _read_only([])
+        # the name and linear system, computed when first needed
+        self.__Name = None
+        self.__System = None
+
+    def __repr__(self):
+        """Returns a description of the model and all of its parameters.
+        """
+        return '{}({!r}, V_c={!r}, CL={!r}, Ka={!r}, V_p={!r}, Q_p={!r})'\
+            .format(type(self).__name__, self.__delivery_mode, self.__V_c,
+                    self.__CL, self.__Ka, self.__V_p.tolist(),
+                    self.__Q_p.tolist())
+
+    def __reduce__(self):
+        """Pickles the model by its parameters only.
+        """
+        return (_rebuild, (type(self), self.__delivery_mode, self.__V_c,
+                           self.__CL, self.__Ka, self.__V_p.tolist(),
+                           self.__Q_p.tolist()))
 
     def __str__(self):
         """Returns the name of the model as a string.
@@ -63,10 +107,11 @@ class Model:
         """str: name is a property constructed from the model parameters.
         This protects data integrity by tying results to an immutable label.
         """
-        self.__Name = ("Model-" + self.__delivery_mode + "-V_c="
-                       + str(self.__V_c) + "-CL=" + str(self.__CL)
-                       + "-Ka=" + str(self.__Ka) + "-"
-                       + str(len(self.__V_p)) + "compartments")
+        if self.__Name is None:
+            self.__Name = ("Model-" + self.__delivery_mode + "-V_c="
+                           + str(self.__V_c) + "-CL=" + str(self.__CL)
+                           + "-Ka=" + str(self.__Ka) + "-"
+                           + str(len(self.__V_p)) + "compartments")
         return self.__Name
 
     @property
@@ -93,6 +138,20 @@ class Model:
         """
         return self.__delivery_mode
 
+    @property
+    def v_p(self):
+        """numpy (ndarray): the read-only volumes of the peripheral
+        compartments [mL]
+        """
+        return self.__V_p
+
+    @property
+    def q_p(self):
+        """numpy (ndarray): the read-only transition rates between the
+        central and the peripheral compartments [mL/h]
+        """
+        return self.__Q_p
+
     def add_compartment(self, V_p_new: float, Q_p_new: float):
         """Receives V_p and Q_p for the desired additional compartment and
         adds these to the V_p and Q_p class attributes.
@@ -107,16 +166,52 @@ class Model:
             raise TypeError('Q_p_new must be int or float')
         if type(V_p_new) not in [int, float]:
             raise TypeError('V_p_new must be int or float')
-        self.__V_p.append(V_p_new)
-        self.__Q_p.append(Q_p_new)
+        self.__V_p = _read_only(numpy.append(self.__V_p, V_p_new))
+        self.__Q_p = _read_only(numpy.append(self.__Q_p, Q_p_new))
+        self.__Name = None
+        self.__System = None
 
     def list_compartments(self):
         """Returns list of lists with a list of [V_p, Q_p] for each compartment.
         """
-        list_compartments = []
+        return numpy.stack([self.__V_p, self.__Q_p], axis=1).tolist()
+
+    def linear_system(self):
+        """Compiles the model into the constant rate matrix A and the dose
+        input vector b of its linear ODE system, dq/dt = A q + b Dose(t).
+        The state q is ordered as in Solution.ode_system: [q_c, q_p1, ...]
+        for 'iv' dosing and [q_0, q_c, q_p1, ...] for 'sc' dosing, where q_0
+        is the subcutaneous input compartment. The arrays are computed once
+        and shared until the model is changed, so they are read-only.
+
+        Returns:
+            A (numpy ndarray): the (n, n) rate matrix [/h]
+            b (numpy ndarray): the (n,) vector routing the dose into q_0
+        """
+        if self.__System is not None:
+            return self.__System
+        # index of the central compartment in the state vector
+        c = 0 if self.__delivery_mode == 'iv' else 1
+        num_variables = len(self.__V_p) + c + 1
+        A = numpy.zeros((num_variables, num_variables), dtype=float)
+        if self.__delivery_mode == 'sc':
+            A[0, 0] = -self.__Ka
+            A[1, 0] = self.__Ka
+        A[c, c] = -self.__CL / self.__V_c
         for i in range(len(self.__V_p)):
-            list_compartments.append([self.__V_p[i], self.__Q_p[i]])
-        return list_compartments
+            p = c + 1 + i
+            # transition Q_p * (q_c / V_c - q_p / V_p) out of the central
+            # compartment and into the peripheral compartment
+            A[c, c] -= self.__Q_p[i] / self.__V_c
+            A[c, p] += self.__Q_p[i] / self.__V_p[i]
+            A[p, c] += self.__Q_p[i] / self.__V_c
+            A[p, p] -= self.__Q_p[i] / self.__V_p[i]
+        b = numpy.zeros(num_variables, dtype=float)
+        b[0] = 1.0
+        A.setflags(write=False)
+        b.setflags(write=False)
+        self.__System = (A, b)
+        return self.__System
 
     def remove_compartment(self, index: int):
         """Removes peripheral compartment at given index. Index refers to the
@@ -127,11 +222,90 @@ class Model:
             referring to V_p[index] and Q_p[index]; non-negative
         """
         # Verify valid index choice
-        if index < 0:
+        if type(index) != int or index < 0:
             raise ValueError('Index must be a non-negative integer')
-        if index not in range(len(V_p)):
+        if index not in range(len(self.__V_p)):
             raise ValueError('Invalid index for V_p')
-        if index not in range(len(Q_p)):
+        if index not in range(len(self.__Q_p)):
             raise ValueError('Invalid index for Q_p')
-        del V_p[index]
-        del Q_p[index]
+        self.__V_p = _read_only(numpy.delete(self.__V_p, index))
+        self.__Q_p = _read_only(numpy.delete(self.__Q_p, index))
+        self.__Name = None
+        self.__System = None
+
+    def freeze(self):
+        """Returns an immutable, hashable copy of the model.
+
+        Returns:
+            FrozenModel: the copy
+        """
+        return FrozenModel(self.__delivery_mode, self.__V_c, self.__CL,
+                           self.__Ka, self.__V_p.tolist(),
+                           self.__Q_p.tolist())
+
+
+class FrozenModel(Model):
+    """The FrozenModel class is a Model which cannot be changed once
+    created. Frozen models with equal parameters are equal and have equal
+    hashes, so they can be used as dictionary and cache keys, and they are
+    pickled compactly by their parameters, for sending to worker processes.
+    """
+    __slots__ = ('__Hash',)
+
+    def __init__(self, delivery_mode: str, V_c=1.0, CL=1.0, Ka=1.0,
+                 V_p=(), Q_p=()):
+        """Initialises a frozen model with all of its parameters.
+
+        Args:
+            delivery_mode, V_c, CL, Ka: as for Model
+            V_p (list of floats): the volumes of the peripheral compartments
+                [mL]
+            Q_p (list of floats): the transition rates between the central
+                and the peripheral compartments [mL/h]
+        """
+        super().__init__(delivery_mode, V_c, CL, Ka)
+        if len(V_p) != len(Q_p):
+            raise ValueError('V_p and Q_p must have the same length')
+        for V_p_new, Q_p_new in zip(V_p, Q_p):
+            super().add_compartment(V_p_new, Q_p_new)
+        self.__Hash = hash(self._parameters())
+
+    def _parameters(self) -> tuple:
+        """Returns every parameter of the model, as a tuple.
+        """
+        return (self.delivery_mode, self.v_c, self.cl, self.ka,
+                tuple(self.v_p.tolist()), tuple(self.q_p.tolist()))
+
+    def __hash__(self):
+        return self.__Hash
+
+    def __eq__(self, other):
+        if type(other) != FrozenModel:
+            return NotImplemented
+        return self._parameters() == other._parameters()
+
+    def add_compartment(self, V_p_new: float, Q_p_new: float):
+        """Raises a TypeError, as a frozen model cannot be changed.
+        """
+        raise TypeError('A FrozenModel cannot be changed; thaw it first')
+
+    def remove_compartment(self, index: int):
+        """Raises a TypeError, as a frozen model cannot be changed.
+        """
+        raise TypeError('A FrozenModel cannot be changed; thaw it first')
+
+    def freeze(self):
+        """Returns the model itself, which is already frozen.
+        """
+        return self
+
+    def thaw(self):
+        """Returns a mutable copy of the model.
+
+        Returns:
+            Model: the copy
+        """
+        model = Model(self.delivery_mode, self.v_c, self.cl, self.ka)
+        for V_p_new, Q_p_new in self.list_compartments():
+            model.add_compartment(V_p_new, Q_p_new)
+        return model
@@ -0,0 +1,230 @@
+"""Non-compartmental analysis (NCA) of concentration profiles.
+
+The metrics are computed for a batch of subjects at once, from arrays of
+concentrations of shape (N, T) on a shared time grid, such as the
+solutions of Solution.solve_population divided by the central volumes. The
+Accumulator computes them over consecutive windows of time, and nca_chunks
+over chunks of subjects, so that a whole population never needs to be held
+in memory at once.
+
+"""
+import numpy
+from .analytic import BLOCK_SIZE
+
+METHODS = ['linear', 'log', 'linear-log']
+
+
+def _segments(t1, t2, c1, c2, method):
+    """Returns the areas under the concentrations, and under the first
+    moment t c, of the segments from (t1, c1) to (t2, c2). The 'log' method
+    integrates an exponential between positive unequal concentrations and
+    'linear-log' does so only where they decline; elsewhere the
+    concentrations are interpolated linearly.
+    """
+    dt = t2 - t1
+    auc = 0.5 * dt * (c1 + c2)
+    aumc = 0.5 * dt * (t1 * c1 + t2 * c2)
+    if method == 'linear':
+        return auc, aumc
+    log = (c1 > 0) & (c2 > 0) & (c1 != c2)
+    if method == 'linear-log':
+        log &= c2 < c1
+    # evaluate the exponential everywhere, with harmless values where it is
+    # not used, rather than gathering the logarithmic segments
+    safe1 = numpy.where(log, c1, 2.0)
+    safe2 = numpy.where(log, c2, 1.0)
+    k = numpy.log(safe1 / safe2) / dt
+    auc = numpy.where(log, (safe1 - safe2) / k, auc)
+    aumc = numpy.where(log, (t1 * safe1 - t2 * safe2) / k
+                       + (safe1 - safe2) / k ** 2, aumc)
+    return auc, aumc
+
+
+def terminal_slope(time, concentrations):
+    """Fits the terminal elimination rate by linear regression of the log of
+    the positive concentrations on time.
+
+    Args:
+        time (array-like): the time points of the terminal phase, shape (T,)
+            or (N, T) [hours]
+        concentrations (array-like): shape (N, T) [ng/mL]
+
+    Returns:
+        lambda_z (numpy ndarray): the rates, shape (N,), NaN where fewer
+            than two concentrations are positive or they do not decline
+            [/h]
+        r2 (numpy ndarray): the coefficients of determination, shape (N,)
+    """
+    concentrations = numpy.atleast_2d(numpy.asarray(concentrations, float))
+    time = numpy.broadcast_to(numpy.asarray(time, dtype=float),
+                              concentrations.shape)
+    w = concentrations > 0
+    y = numpy.log(numpy.where(w, concentrations, 1.0))
+    n = w.sum(axis=1)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        t_mean = (w * time).sum(axis=1) / n
+        y_mean = (w * y).sum(axis=1) / n
+        dt = numpy.where(w, time - t_mean[:, None], 0.0)
+        dy = numpy.where(w, y - y_mean[:, None], 0.0)
+        sxx = (dt * dt).sum(axis=1)
+        sxy = (dt * dy).sum(axis=1)
+        syy = (dy * dy).sum(axis=1)
+        lambda_z = -sxy / sxx
+        r2 = numpy.where(syy > 0, sxy ** 2 / (sxx * syy), 1.0)
+    invalid = (n < 2) | ~(lambda_z > 0)
+    lambda_z[invalid] = numpy.nan
+    r2[invalid] = numpy.nan
+    return lambda_z, r2
+
+
+class Accumulator:
+    """The Accumulator class computes the NCA metrics of a batch of subjects
+    from their concentrations, given over consecutive windows of the time
+    grid. Only the last points of the profiles are kept between windows.
+    """
+    def __init__(self, num_subjects: int, dose=None, points: int = 3,
+                 method: str = 'linear-log'):
+        """Initialises the accumulator before the first window.
+
+        Args:
+            num_subjects (int): the number of subjects N
+            dose (array-like): the dose of each subject, scalar or shape
+                (N,), for the clearance and volume [ng]
+            points (int): the number of last time points used to fit the
+                terminal elimination rate
+            method (str): the integration between time points, 'linear',
+                'log' or 'linear-log' (linear while concentrations rise,
+                logarithmic while they fall)
+        """
+        if type(num_subjects) != int or num_subjects < 1:
+            raise ValueError('num_subjects must be a positive integer')
+        if type(points) != int or points < 2:
+            raise ValueError('points must be an integer of at least 2')
+        if method not in METHODS:
+            raise ValueError('method must be one of {}'.format(METHODS))
+        self.num_subjects = num_subjects
+        self.dose = dose
+        self.points = points
+        self.method = method
+        self.auc = numpy.zeros(num_subjects)
+        self.aumc = numpy.zeros(num_subjects)
+        self.cmax = numpy.full(num_subjects, -numpy.inf)
+        self.tmax = numpy.full(num_subjects, numpy.nan)
+        self.__Time = numpy.empty(0)
+        self.__Tail = numpy.empty((num_subjects, 0))
+
+    def update(self, time, concentrations):
+        """Adds the next window of the profiles.
+
+        Args:
+            time (array-like): the time points of the window, increasing and
+                after those of the previous windows, shape (T,) [hours]
+            concentrations (array-like): shape (N, T) [ng/mL]
+        """
+        time = numpy.asarray(time, dtype=float)
+        concentrations = numpy.asarray(concentrations, dtype=float)
+        if concentrations.shape != (self.num_subjects, len(time)):
+            raise ValueError('concentrations must have shape (num_subjects, '
+                             'len(time))')
+        if len(time) == 0:
+            return
+        if numpy.any(numpy.diff(time) <= 0) or (
+                len(self.__Time) and time[0] <= self.__Time[-1]):
+            raise ValueError('Time points must be increasing')
+        # join the window to the last point of the previous one
+        t = numpy.concatenate([self.__Time[-1:], time])
+        c = numpy.concatenate([self.__Tail[:, -1:], concentrations], axis=1)
+        # integrate in blocks of subjects so that the temporary arrays stay
+        # small enough to remain in cache
+        block = max(1, BLOCK_SIZE // len(time))
+        for start in range(0, self.num_subjects, block):
+            rows = slice(start, start + block)
+            auc, aumc = _segments(t[:-1], t[1:], c[rows, :-1], c[rows, 1:],
+                                  self.method)
+            self.auc[rows] += auc.sum(axis=1)
+            self.aumc[rows] += aumc.sum(axis=1)
+        peak = numpy.argmax(concentrations, axis=1)
+        cmax = concentrations[numpy.arange(self.num_subjects), peak]
+        higher = cmax > self.cmax
+        self.cmax[higher] = cmax[higher]
+        self.tmax[higher] = time[peak[higher]]
+        self.__Time = numpy.concatenate(
+            [self.__Time, time])[-self.points:]
+        self.__Tail = numpy.concatenate(
+            [self.__Tail, concentrations], axis=1)[:, -self.points:]
+
+    def result(self) -> dict:
+        """Returns the NCA metrics of the profiles added so far.
+
+        Returns:
+            dict: of arrays of shape (N,): 'cmax' and 'tmax', the maximum
+            concentration and its first time; 'auc_last' and 'aumc_last',
+            the areas under the profile and its first moment up to the last
+            time point; 'lambda_z', the terminal elimination rate, and
+            'r2', the goodness of its fit; 'half_life'; 'auc_inf' and
+            'aumc_inf', extrapolated to infinity; 'mrt', the mean residence
+            time; and, if the dose is given, 'cl', the clearance, and 'vz',
+            the terminal volume of distribution
+        """
+        if len(self.__Time) == 0:
+            raise ValueError('No profiles have been added')
+        lambda_z, r2 = terminal_slope(self.__Time, self.__Tail)
+        t_last = self.__Time[-1]
+        c_last = self.__Tail[:, -1]
+        auc_inf = self.auc + c_last / lambda_z
+        aumc_inf = (self.aumc + t_last * c_last / lambda_z
+                    + c_last / lambda_z ** 2)
+        result = {'cmax': self.cmax.copy(), 'tmax': self.tmax.copy(),
+                  'auc_last': self.auc.copy(), 'aumc_last': self.aumc.copy(),
+                  'lambda_z': lambda_z, 'r2': r2,
+                  'half_life': numpy.log(2) / lambda_z,
+                  'auc_inf': auc_inf, 'aumc_inf': aumc_inf,
+                  'mrt': aumc_inf / auc_inf}
+        if self.dose is not None:
+            result['cl'] = self.dose / auc_inf
+            result['vz'] = self.dose / (lambda_z * auc_inf)
+        return result
+
+
+def nca(time, concentrations, dose=None, points: int = 3,
+        method: str = 'linear-log') -> dict:
+    """Calculates the NCA metrics of a batch of profiles.
+
+    Args:
+        time (array-like): the time points, shape (T,) [hours]
+        concentrations (array-like): shape (N, T) or (T,) [ng/mL]
+        dose, points, method: as for Accumulator
+
+    Returns:
+        dict: as from Accumulator.result
+    """
+    concentrations = numpy.atleast_2d(numpy.asarray(concentrations, float))
+    accumulator = Accumulator(len(concentrations), dose, points, method)
+    accumulator.update(time, concentrations)
+    return accumulator.result()
+
+
+def nca_chunks(chunks, dose=None, points: int = 3,
+               method: str = 'linear-log') -> dict:
+    """Calculates the NCA metrics of a population given in chunks of
+    subjects, keeping only one chunk of profiles in memory at a time.
+
+    Args:
+        chunks (iterable): yields the (time, concentrations) of each chunk,
+            as for nca
+        dose (array-like): scalar, or a function of the chunk's index which
+            returns the doses of its subjects
+        points, method: as for Accumulator
+
+    Returns:
+        dict: as from Accumulator.result, for all the subjects in order
+    """
+    results = []
+    for index, (time, concentrations) in enumerate(chunks):
+        results.append(nca(time, concentrations,
+                           dose(index) if callable(dose) else dose,
+                           points, method))
+    if not results:
+        raise ValueError('No chunks were given')
+    return {name: numpy.concatenate([result[name] for result in results])
+            for name in results[0]}
@@ -0,0 +1,230 @@
+"""Plotting of pkmodel solutions with Matplotlib.
+
+This module is imported by Solution.visualise when it is first called, so
+that importing pkmodel does not load Matplotlib. Many profiles are drawn
+as one LineCollection per axes, or summarised as percentile ribbons, rather
+than with one plot call each. Figures written to a file are rendered by the
+Agg backend without pyplot, so no display is needed.
+
+"""
+import numpy
+import matplotlib
+import matplotlib.collections
+import matplotlib.figure
+import matplotlib.pyplot
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from .downsample import lttb
+
+LAYOUTS = ['overlay', 'side_by_side', 'grid']
+STYLES = ['lines', 'bands']
+
+# the most profiles labelled in a legend
+MAX_LABELS = 10
+
+
+def plot_lines(ax, time, profiles, labels=None, **options):
+    """Draws many profiles as a single LineCollection, coloured in turn
+    from the axes' colour cycle.
+
+    Args:
+        ax (Axes): the Matplotlib axes
+        time (array-like): the time points, shape (T,) shared by all the
+            profiles or (N, T) for each profile, or a list of the time
+            points of each profile where their lengths differ [hours]
+        profiles (array-like): the profiles, shape (N, T), or a list of
+            profiles of different lengths
+        labels (list of str): a label for each profile, for the legend
+        options: passed to LineCollection, for example linewidths or alpha
+
+    Returns:
+        LineCollection: the lines
+    """
+    if len({numpy.shape(profile) for profile in profiles}) > 1:
+        segments = [numpy.column_stack([t, profile])
+                    for t, profile in zip(time, profiles)]
+    else:
+        profiles = numpy.atleast_2d(numpy.asarray(profiles, dtype=float))
+        segments = numpy.empty(profiles.shape + (2,))
+        segments[..., 0] = numpy.asarray(time, dtype=float)
+        segments[..., 1] = profiles
+    if 'colors' not in options and 'color' not in options:
+        cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        options['colors'] = [cycle[i % len(cycle)]
+                             for i in range(len(profiles))]
+    lines = matplotlib.collections.LineCollection(segments, **options)
+    ax.add_collection(lines)
+    ax.autoscale_view()
+    if labels is not None and len(labels) <= MAX_LABELS:
+        # a collection has a single legend entry, so add one per profile
+        colors = lines.get_colors()
+        for i, label in enumerate(labels):
+            ax.plot([], [], color=colors[i % len(colors)], label=label)
+        ax.legend(fontsize='small')
+    return lines
+
+
+def plot_bands(ax, time, bands, percentiles=(5, 50, 95), color=None,
+               alpha=0.3):
+    """Draws percentile bands as a ribbon between the outer percentiles,
+    with a line for each inner percentile, such as the median. The bands
+    can be computed from profiles with numpy.percentile or by
+    Population.run.
+
+    Args:
+        ax (Axes): the Matplotlib axes
+        time (array-like): the time points, shape (T,) [hours]
+        bands (array-like): the percentiles of the profiles at each time
+            point, shape (len(percentiles), T), in increasing order
+        percentiles (list of float): the percentiles of the bands
+        color (str): the colour of the ribbon and lines
+        alpha (float): the opacity of the ribbon
+    """
+    bands = numpy.asarray(bands, dtype=float)
+    if len(bands) != len(percentiles) or len(bands) < 2:
+        raise ValueError('There must be a band for each of at least two '
+                         'percentiles')
+    ribbon = ax.fill_between(
+        time, bands[0], bands[-1], color=color, alpha=alpha, linewidth=0,
+        label='{:g}-{:g}%'.format(percentiles[0], percentiles[-1]))
+    color = ribbon.get_facecolor()[0][:3] if color is None else color
+    for band, percentile in zip(bands[1:-1], percentiles[1:-1]):
+        ax.plot(time, band, color=color, label='{:g}%'.format(percentile))
+    ax.legend(fontsize='small')
+
+
+def _figure(filename, size):
+    """Returns a new figure: a pyplot figure to be shown, or, for a file, a
+    figure rendered by Agg without pyplot.
+    """
+    if filename is None:
+        return matplotlib.pyplot.figure(figsize=size, constrained_layout=True)
+    figure = matplotlib.figure.Figure(figsize=size, constrained_layout=True)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def _grid_shape(count, layout, shape):
+    """Returns the (rows, columns) of the axes for a layout.
+    """
+    if layout == 'overlay' or count == 0:
+        return 1, 1
+    if layout == 'side_by_side':
+        return 1, count
+    if shape is None:
+        columns = int(numpy.ceil(numpy.sqrt(count)))
+        return int(numpy.ceil(count / columns)), columns
+    rows, columns = shape
+    if type(rows) != int or type(columns) != int or rows * columns < count:
+        raise ValueError('shape must be (rows, columns) with room for every '
+                         'pair')
+    return rows, columns
+
+
+def _axes(figure, rows, columns, count, layout):
+    """Returns the labelled axes of a figure, and the pairs drawn in each,
+    hiding those left empty.
+    """
+    axes = figure.subplots(rows, columns, squeeze=False).ravel()
+    for ax in axes:
+        ax.set_xlabel("Time (hrs)")
+        ax.set_ylabel("$q_{c}$")
+    if layout == 'overlay':
+        return axes, [range(count)]
+    for ax in axes[count:]:
+        ax.set_visible(False)
+    return axes, [[i] for i in range(count)]
+
+
+def _results(solution, time_res, results):
+    """Returns the central compartment of each pair of a Solution, solving
+    them in this process, through the cache and store if any, unless the
+    results are given.
+    """
+    if results is None:
+        results = solution.solve_all(time_res=time_res, workers=1)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    if len(results) != len(solution.list_compartments):
+        raise ValueError('There must be a result for each pair')
+    return results
+
+
+def _draw_lines(ax, time, profiles, group, labels, layout, max_points):
+    """Draws the profiles of a group of pairs in the 'lines' style: labelled
+    when overlaid, or else one pair titled in the colour it has when
+    overlaid.
+    """
+    if max_points is not None:
+        kept = [lttb(t, profile, max_points)
+                for t, profile in zip(time, profiles)]
+        time = [t[i] for t, i in zip(time, kept)]
+        profiles = [profile[i] for profile, i in zip(profiles, kept)]
+    if layout == 'overlay':
+        plot_lines(ax, time, profiles, labels)
+        return
+    cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+    plot_lines(ax, time, profiles, colors=[cycle[group[0] % len(cycle)]])
+    ax.set_title(labels[group[0]], fontsize='small')
+
+
+def visualise(solution, layout='overlay', time_res=1000, style='lines',
+              shape=None, results=None, filename=None,
+              percentiles=(5, 50, 95), dpi=100, max_points=None):
+    """Plots the solutions of the (model, protocol) pairs of a Solution,
+    as described in Solution.visualise.
+
+    Args:
+        solution (Solution object): solves the pairs
+        layout (str): 'overlay', 'side_by_side' or 'grid'
+        time_res (int): the number of time points in each solution
+        style (str): 'lines' or 'bands'
+        shape (tuple): the (rows, columns) of a 'grid' layout
+        results (list): the central compartment of each pair, already
+            solved on its time grid, so that the pairs are not solved again
+        filename (str): the file to which the figure is written
+        percentiles (list of float): the percentiles of the 'bands' style
+        dpi (int): the resolution of the file
+        max_points (int): if given, each profile of the 'lines' style is
+            reduced to at most this many points by LTTB downsampling
+            before it is drawn, which keeps its shape
+
+    Returns:
+        Figure: the figure
+    """
+    if layout not in LAYOUTS:
+        raise ValueError('Solution.visualise() supports the layouts {}'
+                         .format(LAYOUTS))
+    if style not in STYLES:
+        raise ValueError('Solution.visualise() supports the styles {}'
+                         .format(STYLES))
+    inputs = solution.list_compartments
+    results = _results(solution, time_res, results)
+    times = [numpy.linspace(0, protocol.time_span, time_res)
+             for model, protocol in inputs]
+    labels = ['Plot {}: {}'.format(i + 1, model.name)
+              for i, (model, protocol) in enumerate(inputs)]
+
+    rows, columns = _grid_shape(len(inputs), layout, shape)
+    height = 3.0 if layout == 'overlay' else 4.0
+    figure = _figure(filename, (10.0 if columns <= 2 else 4.0 * columns,
+                                height * rows))
+    axes, groups = _axes(figure, rows, columns, len(inputs), layout)
+    for ax, group in zip(axes, groups):
+        group = list(group)
+        if not group:
+            continue
+        time = numpy.array([times[i] for i in group])
+        profiles = numpy.array([results[i] for i in group], dtype=float)
+        if style == 'bands':
+            if numpy.any(time != time[0]):
+                raise ValueError('Bands need pairs with the same time span')
+            plot_bands(ax, time[0], numpy.percentile(profiles, percentiles,
+                                                     axis=0), percentiles)
+        else:
+            _draw_lines(ax, time, profiles, group, labels, layout, max_points)
+    if filename is None:
+        matplotlib.pyplot.show()
+    else:
+        figure.savefig(filename, dpi=dpi)
+    return figure
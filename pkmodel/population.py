@@ -0,0 +1,350 @@
+"""Monte Carlo simulation of populations with inter-individual variability.
+
+The parameters of each subject are log-normally distributed about the
+typical values of a Model: theta = theta_typical exp(eta), where eta is drawn
+from a multivariate normal distribution with zero mean and covariance omega.
+Subjects are drawn, solved and summarised in batches, so that the memory
+used does not grow with the number of subjects: the percentiles of the
+profiles are estimated by a QuantileSketch rather than from every profile.
+
+"""
+import concurrent.futures
+import os
+import numpy
+import pkmodel as pk
+
+
+class QuantileSketch:
+    """The QuantileSketch class estimates quantiles of profiles at each of a
+    fixed number of time points, from batches of profiles, in memory which
+    does not grow with the number of profiles. Values are counted in
+    logarithmically spaced buckets, so every estimate is within the relative
+    accuracy of the exact quantile. Sketches of separate batches can be
+    merged.
+    """
+    def __init__(self, num_points: int, relative_accuracy: float = 0.005,
+                 min_value: float = 1e-12):
+        """Initialises an empty sketch.
+
+        Args:
+            num_points (int): the number of time points T
+            relative_accuracy (float): the relative accuracy of the
+                quantiles, which sets the width of the buckets
+            min_value (float): values at or below this, including any small
+                negative values left by the solver, are counted as zero
+        """
+        if type(num_points) != int or num_points < 1:
+            raise ValueError('num_points must be a positive integer')
+        if type(relative_accuracy) != float or not (
+                0 < relative_accuracy < 1):
+            raise ValueError('relative_accuracy must be between 0 and 1')
+        if type(min_value) not in [int, float] or min_value <= 0:
+            raise ValueError('min_value must be positive')
+        self.num_points = num_points
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.count = 0
+        self.total = numpy.zeros(num_points)
+        self.zeros = numpy.zeros(num_points, dtype=numpy.int64)
+        # the counts of the buckets offset, ..., offset + K - 1 at each
+        # time point, where bucket k holds (gamma^(k-1), gamma^k]
+        self.__Offset = 0
+        self.__Counts = numpy.zeros((num_points, 0), dtype=numpy.int64)
+
+    def _extend(self, low: int, high: int):
+        """Widens the buckets to include the keys from low to high.
+        """
+        counts = self.__Counts
+        if counts.shape[1] == 0:
+            self.__Offset = low
+            self.__Counts = numpy.zeros((self.num_points, high - low + 1),
+                                        dtype=numpy.int64)
+            return
+        before = max(0, self.__Offset - low)
+        after = max(0, high - (self.__Offset + counts.shape[1] - 1))
+        if before or after:
+            self.__Counts = numpy.pad(counts, ((0, 0), (before, after)))
+            self.__Offset -= before
+
+    def update(self, values):
+        """Adds a batch of profiles to the sketch.
+
+        Args:
+            values (array-like): shape (N, T)
+        """
+        values = numpy.asarray(values, dtype=float)
+        if values.ndim != 2 or values.shape[1] != self.num_points:
+            raise ValueError('values must have shape (N, num_points)')
+        positive = values > self.min_value
+        self.count += len(values)
+        self.total += values.sum(axis=0)
+        self.zeros += len(values) - positive.sum(axis=0)
+        if not numpy.any(positive):
+            return
+        keys = numpy.ceil(numpy.log(values[positive])
+                          / numpy.log(self.gamma)).astype(numpy.int64)
+        self._extend(int(keys.min()), int(keys.max()))
+        width = self.__Counts.shape[1]
+        # count all the time points in one pass, with a flat bucket index
+        points = numpy.broadcast_to(numpy.arange(self.num_points),
+                                    values.shape)[positive]
+        self.__Counts += numpy.bincount(
+            points * width + keys - self.__Offset,
+            minlength=self.num_points * width).reshape(self.__Counts.shape)
+
+    def merge(self, other):
+        """Adds the profiles counted by another sketch with the same
+        settings.
+
+        Args:
+            other (QuantileSketch): the other sketch
+        """
+        if (other.num_points, other.relative_accuracy, other.min_value) != (
+                self.num_points, self.relative_accuracy, self.min_value):
+            raise ValueError('Only sketches with the same settings can be '
+                             'merged')
+        self.count += other.count
+        self.total += other.total
+        self.zeros += other.zeros
+        counts = other.__Counts
+        if counts.shape[1] == 0:
+            return
+        offset = other.__Offset
+        self._extend(offset, offset + counts.shape[1] - 1)
+        start = offset - self.__Offset
+        self.__Counts[:, start:start + counts.shape[1]] += counts
+
+    def mean(self):
+        """Returns the exact mean of the profiles, shape (T,).
+        """
+        if self.count == 0:
+            raise ValueError('No profiles have been added')
+        return self.total / self.count
+
+    def quantiles(self, q):
+        """Estimates quantiles of the profiles at every time point. The
+        q quantile is the value of rank floor(q (N - 1)) in the sorted
+        profiles, as numpy.quantile with method='lower'.
+
+        Args:
+            q (array-like): the quantiles, between 0 and 1
+
+        Returns:
+            numpy (ndarray): shape (len(q), T)
+        """
+        if self.count == 0:
+            raise ValueError('No profiles have been added')
+        q = numpy.atleast_1d(numpy.asarray(q, dtype=float))
+        if numpy.any((q < 0) | (q > 1)):
+            raise ValueError('Quantiles must be between 0 and 1')
+        cumulative = numpy.cumsum(numpy.concatenate(
+            [self.zeros[:, None], self.__Counts], axis=1), axis=1)
+        ranks = numpy.floor(q * (self.count - 1))
+        out = numpy.empty((len(q), self.num_points))
+        for i, rank in enumerate(ranks):
+            # the first bucket whose cumulative count exceeds the rank; the
+            # first column is the zero bucket
+            index = numpy.argmax(cumulative > rank, axis=1)
+            key = index - 1 + self.__Offset
+            # the middle of a bucket, in relative terms
+            value = 2 * self.gamma ** key / (1 + self.gamma)
+            out[i] = numpy.where(index == 0, 0.0, value)
+        return out
+
+
+def _solve_batch(solution, delivery_mode, protocol, time, parameters,
+                 concentration, settings):
+    """Solves one batch of subjects for Population.run, returning its
+    QuantileSketch. Runs in a worker process when run in parallel.
+    """
+    output = solution.solve_population(delivery_mode, protocol, time,
+                                       **parameters)
+    if concentration:
+        output /= numpy.reshape(parameters['V_c'], (-1, 1))
+    sketch = QuantileSketch(len(time), **settings)
+    sketch.update(output)
+    return sketch
+
+
+class Population:
+    """The Population class simulates the profiles of many subjects whose
+    parameters vary log-normally about the typical values of a Model, and
+    summarises them by percentile bands, without holding every profile.
+    """
+    def __init__(self, model, omega, parameters=None, solution=None,
+                 batch_size: int = 1024, concentration: bool = False):
+        """Initialises a population.
+
+        Args:
+            model (Model object): the typical values of the parameters
+            omega (array-like): the covariance of eta, the logarithms of
+                the parameters relative to their typical values, shape
+                (P, P), or the variances alone, shape (P,)
+            parameters (list of str): the P parameters which vary, in the
+                order of omega, from 'V_c', 'CL', 'Ka' and 'V_p[i]' and
+                'Q_p[i]' for each peripheral compartment i. Defaults to all
+                of them, in that order
+            solution (Solution object): solves the batches, giving the
+                backend and solver settings; defaults to
+                Solution(backend='analytic')
+            batch_size (int): the number of subjects solved together
+            concentration (bool): whether the profiles are concentrations
+                in the central compartment [ng/mL], rather than amounts
+        """
+        if not isinstance(model, pk.Model):
+            raise TypeError('The model must be a pkmodel Model')
+        if type(batch_size) != int or batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        k = len(model) - 1
+        names = ['V_c', 'CL', 'Ka'] + ['V_p[{}]'.format(i) for i in range(k)]
+        names += ['Q_p[{}]'.format(i) for i in range(k)]
+        if parameters is None:
+            parameters = names
+        parameters = list(parameters)
+        unknown = set(parameters) - set(names)
+        if unknown or len(set(parameters)) != len(parameters):
+            raise ValueError('The parameters must be distinct names from {}'
+                             .format(names))
+        omega = numpy.asarray(omega, dtype=float)
+        if omega.ndim == 1:
+            omega = numpy.diag(omega)
+        if omega.shape != (len(parameters), len(parameters)):
+            raise ValueError('omega must have shape (P, P) for P parameters')
+        if not numpy.allclose(omega, omega.T):
+            raise ValueError('omega must be symmetric')
+        eigenvalues, vectors = numpy.linalg.eigh(omega)
+        if numpy.any(eigenvalues < -1e-12 * max(1.0, eigenvalues.max())):
+            raise ValueError('omega must be positive semi-definite')
+        self.model = model
+        self.omega = omega
+        self.parameters = parameters
+        self.solution = (pk.Solution(backend='analytic') if solution is None
+                         else solution)
+        self.batch_size = batch_size
+        self.concentration = concentration
+        # eta = z @ factor.T has covariance omega for standard normal z
+        self.__Factor = vectors * numpy.sqrt(numpy.clip(eigenvalues, 0, None))
+        self.__Typical = numpy.array(
+            [model.v_c, model.cl, model.ka] + model.v_p.tolist()
+            + model.q_p.tolist())
+        self.__Index = [names.index(name) for name in parameters]
+
+    def _batches(self, num_subjects: int, seed=None):
+        """Draws the subjects in batches of at most batch_size. The normal
+        deviates are drawn in order from one generator, so the subjects do
+        not depend on the batch size.
+
+        Yields:
+            dict: the parameters of a batch, as for
+            Solution.solve_population
+        """
+        if type(num_subjects) != int or num_subjects < 1:
+            raise ValueError('num_subjects must be a positive integer')
+        rng = numpy.random.default_rng(seed)
+        k = len(self.model) - 1
+        for start in range(0, num_subjects, self.batch_size):
+            n = min(self.batch_size, num_subjects - start)
+            eta = rng.standard_normal((n, len(self.parameters)))
+            theta = numpy.tile(self.__Typical, (n, 1))
+            theta[:, self.__Index] *= numpy.exp(eta @ self.__Factor.T)
+            yield {'V_c': theta[:, 0], 'CL': theta[:, 1], 'Ka': theta[:, 2],
+                   'V_p': theta[:, 3:3 + k], 'Q_p': theta[:, 3 + k:]}
+
+    def sample(self, num_subjects: int, seed=None) -> dict:
+        """Draws the parameters of the subjects.
+
+        Args:
+            num_subjects (int): the number of subjects N
+            seed (int): the seed of the random number generator
+
+        Returns:
+            dict: 'V_c', 'CL' and 'Ka' of shape (N,), and 'V_p' and 'Q_p'
+            of shape (N, k), as for Sweep.run
+        """
+        batches = list(self._batches(num_subjects, seed))
+        return {name: numpy.concatenate([batch[name] for batch in batches])
+                for name in batches[0]}
+
+    def _run_parallel(self, sketch, batches, arguments, settings,
+                      workers: int):
+        """Solves the batches of a run in worker processes, merging each
+        into the sketch as it completes.
+        """
+        solver = self.solution._empty_copy()
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            pending = {}
+
+            def submit():
+                # keep at most two batches per worker in flight
+                for parameters in batches:
+                    future = executor.submit(
+                        _solve_batch, solver, *arguments, parameters,
+                        self.concentration, settings)
+                    pending[future] = parameters
+                    if len(pending) >= 2 * workers:
+                        break
+
+            submit()
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    parameters = pending.pop(future)
+                    try:
+                        batch = future.result()
+                    except Exception:
+                        # the batch could not be sent to a worker, for
+                        # example with a lambda dose function
+                        batch = _solve_batch(
+                            solver, *arguments, parameters,
+                            self.concentration, settings)
+                    sketch.merge(batch)
+                submit()
+
+    def run(self, protocol, time, num_subjects: int, seed=None,
+            percentiles=(5, 50, 95), workers: int = 1,
+            relative_accuracy: float = 0.005) -> dict:
+        """Simulates the population under a protocol and summarises the
+        profiles. Only one batch of profiles per worker is held at once.
+
+        Args:
+            protocol (Protocol object): the protocol for every subject
+            time (list): the time points [hours]
+            num_subjects (int): the number of subjects N
+            seed (int): the seed of the random number generator; a run is
+                reproduced by the same seed, whatever the batch size and
+                number of workers
+            percentiles (list of float): the percentiles of the bands
+            workers (int): the number of worker processes. With 1 worker,
+                the batches are solved in this process
+            relative_accuracy (float): the relative accuracy of the
+                percentiles, as for QuantileSketch
+
+        Returns:
+            dict: 'time'; 'percentiles'; 'bands', the percentiles of the
+            profiles at each time point, shape (len(percentiles),
+            len(time)); 'mean', the mean profile; and 'num_subjects'
+        """
+        if type(protocol) != pk.Protocol:
+            raise TypeError('The protocol must be a pkmodel Protocol')
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if type(workers) != int or workers < 1:
+            raise ValueError('workers must be a positive integer')
+        time = numpy.asarray(time, dtype=float)
+        percentiles = numpy.asarray(percentiles, dtype=float)
+        settings = {'relative_accuracy': relative_accuracy}
+        sketch = QuantileSketch(len(time), **settings)
+        batches = self._batches(num_subjects, seed)
+        arguments = (self.model.delivery_mode, protocol, time)
+        if workers == 1:
+            for parameters in batches:
+                sketch.merge(_solve_batch(
+                    self.solution, *arguments, parameters,
+                    self.concentration, settings))
+        else:
+            self._run_parallel(sketch, batches, arguments, settings, workers)
+        return {'time': time, 'percentiles': percentiles,
+                'bands': sketch.quantiles(percentiles / 100),
+                'mean': sketch.mean(), 'num_subjects': sketch.count}
@@ -1,3 +1,13 @@
+import hashlib
+import numpy
+
+
+def _zero_dose(t, y):
+    """The default dose function, f(t, y) = 0.
+    """
+    return 0
+
+
 class Protocol:
     """The Protocol class holds the pharmacokinetic parameters related to
     the dose and time span of the dose. It contains a method to return a
@@ -20,7 +30,16 @@ class Protocol:
         self.__Initial_dose = initial_dose
         self.__Time_span = time_span
         # define the default dose function to be f(t,y)=0
-        self.__Dose_func = lambda t, y: 0
+        self.__Dose_func = _zero_dose
+        # the dosing regimen, as lists of (time, amount, interval, repeats)
+        # for boluses and (start, stop, rate, interval, repeats) for
+        # infusions
+        self.__Boluses = []
+        self.__Infusions = []
+        # the declarative rate inputs, as lists of (times, rates) arrays for
+        # piecewise-constant schedules and interpolated rate tables
+        self.__Schedules = []
+        self.__Tables = []
 
     @property
     def name(self) -> str:
@@ -34,8 +53,27 @@ class Protocol:
         """
         self.__Name = ("Protocol-initial_dose=" + str(self.__Initial_dose)
                        + "-time_span=" + str(self.__Time_span))
+        for time, amount, interval, repeats in self.__Boluses:
+            self.__Name += ("-bolus=" + str(amount) + "@" + str(time)
+                            + "every" + str(interval) + "x" + str(repeats))
+        for start, stop, rate, interval, repeats in self.__Infusions:
+            self.__Name += ("-infusion=" + str(rate) + "@" + str(start)
+                            + "to" + str(stop) + "every" + str(interval)
+                            + "x" + str(repeats))
+        for times, rates in self.__Schedules:
+            self.__Name += "-schedule=" + self._digest(times, rates)
+        for times, rates in self.__Tables:
+            self.__Name += "-table=" + self._digest(times, rates)
         return self.__Name
 
+    @staticmethod
+    def _digest(times, rates) -> str:
+        """Returns a short digest of the arrays of a rate input, for the
+        name.
+        """
+        return hashlib.sha1(times.tobytes() + rates.tobytes()).hexdigest()[
+            :16]
+
     def __str__(self):
         """Returns:
             the name of the model (string)
@@ -74,6 +112,13 @@ class Protocol:
         # default case is the instantaneous addition, in which
         # case, there is no further addition, and rate is 0
 
+    @property
+    def has_dose_function(self) -> bool:
+        """bool: True if a dose function has been added with
+        add_dose_function, False while the default f(t, y) = 0 is in use
+        """
+        return self.__Dose_func is not _zero_dose
+
     def add_dose_function(self, func=None):
         """
         Allows the user to specify the function describing
@@ -93,3 +138,235 @@ class Protocol:
             # we need a way to test that func is dependent on time and y
             func(1, 2)  # Test that it accepts two arguments
             self.__Dose_func = func
+
+    @staticmethod
+    def _check_repeats(interval, repeats):
+        """Verifies the interval and number of repeats of a regimen entry.
+        """
+        if type(repeats) != int or repeats < 1:
+            raise ValueError('repeats must be a positive integer')
+        if interval is not None and type(interval) not in [int, float]:
+            raise TypeError('interval must be int or float')
+        if repeats > 1 and (interval is None or interval <= 0):
+            raise ValueError('Repeated doses need a positive interval')
+
+    def add_bolus(self, amount: float, time: float = 0.0, interval=None,
+                  repeats: int = 1):
+        """Adds instantaneous doses into the dosing compartment to the
+        regimen, at time, time + interval, time + 2 interval and so on.
+        The initial_dose is given at the start of the simulation in
+        addition to these.
+
+        Args:
+            amount (float): the amount of each dose [ng]
+            time (float): the time of the first dose [hours]
+            interval (float): the time between repeated doses [hours]
+            repeats (int): the number of doses, defaults to 1
+        """
+        if type(amount) not in [int, float]:
+            raise TypeError('amount must be int or float')
+        if type(time) not in [int, float]:
+            raise TypeError('time must be int or float')
+        if time < 0:
+            raise ValueError('time must be non-negative')
+        self._check_repeats(interval, repeats)
+        self.__Boluses.append((time, amount, interval, repeats))
+
+    def add_infusion(self, rate: float, start: float, stop: float,
+                     interval=None, repeats: int = 1):
+        """Adds constant-rate infusions into the dosing compartment to the
+        regimen, over the window from start to stop, repeated every
+        interval.
+
+        Args:
+            rate (float): the rate of the infusion [ng/h]
+            start (float): the start of the first infusion [hours]
+            stop (float): the end of the first infusion [hours]
+            interval (float): the time between repeated infusions [hours]
+            repeats (int): the number of infusions, defaults to 1
+        """
+        if type(rate) not in [int, float]:
+            raise TypeError('rate must be int or float')
+        if type(start) not in [int, float] or type(stop) not in [int, float]:
+            raise TypeError('start and stop must be int or float')
+        if start < 0 or stop <= start:
+            raise ValueError('The infusion must have 0 <= start < stop')
+        self._check_repeats(interval, repeats)
+        self.__Infusions.append((start, stop, rate, interval, repeats))
+
+    @staticmethod
+    def _check_rates(times, rates, num_times):
+        """Verifies the times and rates of a schedule or rate table.
+
+        Returns:
+            times, rates (numpy ndarray): as read-only float arrays
+        """
+        times = numpy.array(times, dtype=float)
+        rates = numpy.array(rates, dtype=float)
+        if times.ndim != 1 or rates.ndim != 1:
+            raise ValueError('times and rates must be 1-D')
+        if len(times) != num_times(len(rates)) or len(rates) == 0:
+            raise ValueError('times and rates have mismatched lengths')
+        if not (numpy.all(numpy.isfinite(times))
+                and numpy.all(numpy.isfinite(rates))):
+            raise ValueError('times and rates must be finite')
+        if times[0] < 0 or numpy.any(numpy.diff(times) <= 0):
+            raise ValueError('times must be non-negative and increasing')
+        times.setflags(write=False)
+        rates.setflags(write=False)
+        return times, rates
+
+    def add_schedule(self, times, rates):
+        """Adds a piecewise-constant dose rate into the dosing compartment
+        to the regimen: rates[i] from times[i] up to times[i + 1]. It is
+        given as a set of infusions, so every backend solves it without a
+        dose function, and the 'analytic' backend in closed form.
+
+        Args:
+            times (array-like): the increasing times at which the rate
+                changes, one more than the rates [hours]
+            rates (array-like): the rate in each interval [ng/h]
+        """
+        self.__Schedules.append(self._check_rates(times, rates,
+                                                  lambda n: n + 1))
+
+    def add_rate_table(self, times, rates):
+        """Adds a tabulated dose rate into the dosing compartment to the
+        regimen, interpolated linearly between the tabulated times, and zero
+        before the first and from the last. Within each interval the rate is
+        a linear ramp, which every backend solves without a dose function,
+        and the 'analytic' backend in closed form.
+
+        Args:
+            times (array-like): the increasing tabulated times [hours]
+            rates (array-like): the rates at those times [ng/h]
+        """
+        self.__Tables.append(self._check_rates(times, rates,
+                                               lambda n: n))
+
+    @property
+    def has_regimen(self) -> bool:
+        """bool: True if boluses, infusions, schedules or rate tables have
+        been added
+        """
+        return bool(self.__Boluses or self.__Infusions or self.__Schedules
+                    or self.__Tables)
+
+    @property
+    def has_rate_table(self) -> bool:
+        """bool: True if rate tables have been added, so that the dose rate
+        is not constant between the events of the regimen
+        """
+        return bool(self.__Tables)
+
+    def boluses(self):
+        """Returns every dose of the bolus regimen, sorted by time.
+
+        Returns:
+            times (numpy ndarray): the dose times [hours]
+            amounts (numpy ndarray): the dose amounts [ng]
+        """
+        times = [numpy.full(1, float(time)) if repeats == 1
+                 else time + interval * numpy.arange(repeats, dtype=float)
+                 for time, amount, interval, repeats in self.__Boluses]
+        amounts = [numpy.full(repeats, float(amount))
+                   for time, amount, interval, repeats in self.__Boluses]
+        times = numpy.concatenate(times) if times else numpy.zeros(0)
+        amounts = numpy.concatenate(amounts) if amounts else numpy.zeros(0)
+        order = numpy.argsort(times, kind='stable')
+        return times[order], amounts[order]
+
+    def infusions(self):
+        """Returns every infusion window of the regimen, including the
+        intervals of schedules.
+
+        Returns:
+            starts, stops (numpy ndarray): the window of each infusion
+                [hours]
+            rates (numpy ndarray): the rate of each infusion [ng/h]
+        """
+        starts, stops, rates = [], [], []
+        for start, stop, rate, interval, repeats in self.__Infusions:
+            offsets = numpy.zeros(1) if repeats == 1 else (
+                interval * numpy.arange(repeats, dtype=float))
+            starts.append(start + offsets)
+            stops.append(stop + offsets)
+            rates.append(numpy.full(repeats, float(rate)))
+        for times, schedule in self.__Schedules:
+            starts.append(times[:-1])
+            stops.append(times[1:])
+            rates.append(schedule)
+        if not starts:
+            return numpy.zeros(0), numpy.zeros(0), numpy.zeros(0)
+        return (numpy.concatenate(starts), numpy.concatenate(stops),
+                numpy.concatenate(rates))
+
+    def infusion_rate(self, t):
+        """Returns the total rate of the regimen's infusions, which include
+        their start and exclude their end.
+
+        Args:
+            t (array-like): the times [hours]
+
+        Returns:
+            numpy (ndarray): the rates, with the shape of t [ng/h]
+        """
+        t = numpy.asarray(t, dtype=float)
+        starts, stops, rates = self.infusions()
+        active = (t[..., None] >= starts) & (t[..., None] < stops)
+        return active @ rates
+
+    def table_rate(self, t, slope: bool = False):
+        """Returns the total rate of the regimen's rate tables, which
+        include the first tabulated time and exclude the last.
+
+        Args:
+            t (array-like): the times [hours], of any shape, such as
+                (subjects, time points)
+            slope (bool): whether to also return the rate of change
+
+        Returns:
+            numpy (ndarray): the rates, with the shape of t [ng/h]
+            numpy (ndarray): if slope, the rates of change [ng/h^2]
+        """
+        t = numpy.asarray(t, dtype=float)
+        total = numpy.zeros(t.shape)
+        gradient = numpy.zeros(t.shape)
+        for times, rates in self.__Tables:
+            index = numpy.searchsorted(times, t, side='right') - 1
+            inside = (index >= 0) & (index < len(times) - 1)
+            index = numpy.clip(index, 0, max(len(times) - 2, 0))
+            if len(times) > 1:
+                step = numpy.diff(rates) / numpy.diff(times)
+                gradient += numpy.where(inside, step[index], 0.0)
+                total += numpy.where(inside, rates[index] + step[index] * (
+                    t - times[index]), 0.0)
+        if slope:
+            return total, gradient
+        return total
+
+    def input_rate(self, t):
+        """Returns the total dose rate of the regimen's infusions, schedules
+        and rate tables, evaluated for all the times at once.
+
+        Args:
+            t (array-like): the times [hours], of any shape
+
+        Returns:
+            numpy (ndarray): the rates, with the shape of t [ng/h]
+        """
+        return self.infusion_rate(t) + self.table_rate(t)
+
+    def event_times(self):
+        """Returns the sorted, unique times at which the regimen changes:
+        the bolus times, the starts and ends of infusions and schedule
+        intervals, and the tabulated times of rate tables. Solution
+        integrates piecewise between these.
+
+        Returns:
+            numpy (ndarray): the event times [hours]
+        """
+        times, _ = self.boluses()
+        starts, stops, _ = self.infusions()
+        return numpy.unique(numpy.concatenate(
+            [times, starts, stops] + [table for table, _ in self.__Tables]))
@@ -1,7 +1,40 @@
 import pkmodel as pk
+import collections
+import concurrent.futures
+import os
+import hashlib
 import numpy
 import scipy.integrate
-import matplotlib.pyplot
+import scipy.optimize
+import scipy.sparse
+from .analytic import LinearModes, rate_matrices
+from .trajectory import Trajectory
+from .dense import ConstantPiece, DenseSolution, ModalPiece
+from .downsample import adaptive_grid
+from .export import write_results, read_results
+
+
+def _solve_chunk(solver, pairs, time_res):
+    """Solves a chunk of (model, protocol) pairs for Solution.solve_all.
+    Runs in a worker process, so exceptions are returned, not raised.
+
+    Returns:
+        list of Trajectory or Exception, one per pair
+        list of the Instrumentation records of the pairs, if instrumented
+    """
+    results = []
+    instrumentation = solver.instrumentation
+    num_records = len(instrumentation.records) if instrumentation else 0
+    for model, protocol in pairs:
+        try:
+            time = numpy.linspace(0, protocol.time_span, time_res)
+            results.append(solver.solution(
+                model, protocol, time, full_output=True))
+        except Exception as e:
+            results.append(e)
+    if instrumentation is None:
+        return results, []
+    return results, instrumentation.records[num_records:]
 
 
 class Solution:
@@ -10,14 +43,65 @@ class Solution:
     compartment, in side-by-side or overlay views. The user can add
     or remove the models and protocols to be solved.
     """
-    def __init__(self):
+    def __init__(self, backend: str = 'ode', cache=None, store=None,
+                 method: str = 'RK45', rtol: float = 1e-3,
+                 atol: float = 1e-6, instrumentation=None):
         """Initialises a Solution object, which holds a list of model objects
         and a list of protocol objects. These initialise as empty lists.
         Further documentation on the Model and Protocol classes can be found
         under their methods.
         Args:
-            None
+            backend (str): how the right-hand side of the ODE system is
+                evaluated. 'ode' (default) calls Solution.ode_system, which
+                validates its input at every solver step; 'compiled' compiles
+                each model once into a constant rate matrix (see
+                Model.linear_system) before the solve; 'analytic' evaluates
+                the closed-form solution of the linear system on the whole
+                time grid at once, falling back to the compiled backend for
+                protocols with a dose function.
+            cache (ResultCache): an optional cache, which Solution.solution
+                consults before solving and fills afterwards. A cache can
+                be shared between Solution objects
+            store (ResultStore): an optional on-disk store, which
+                Solution.solution consults after the cache and fills after
+                solving. Protocols with a dose function are never stored
+            method (str): the .solve_ivp() integration method. For stiff
+                models, with fast exchange between compartments, choose an
+                implicit method ('Radau', 'BDF' or 'LSODA'); these are given
+                the exact, constant Jacobian of the model. Dose functions
+                are assumed not to depend on q for the Jacobian
+            rtol (float): the relative tolerance of the solver
+            atol (float): the absolute tolerance of the solver [ng]
+            instrumentation (Instrumentation): an optional record of the
+                time, right-hand side and dose function evaluations and
+                solver steps of each pair solved by Solution.solution and
+                Solution.solve_all, and of the time spent plotting
         """
+        if backend not in ['ode', 'compiled', 'analytic']:
+            raise ValueError(
+                'backend must be "ode", "compiled" or "analytic"')
+        if method not in ['RK45', 'RK23', 'DOP853', 'Radau', 'BDF', 'LSODA']:
+            raise ValueError('method must be a solve_ivp method: "RK45", '
+                             '"RK23", "DOP853", "Radau", "BDF" or "LSODA"')
+        if type(rtol) not in [int, float] or rtol <= 0:
+            raise ValueError('rtol must be a positive float')
+        if type(atol) not in [int, float] or atol <= 0:
+            raise ValueError('atol must be a positive float')
+        if cache is not None and type(cache) != pk.ResultCache:
+            raise TypeError('The cache must be a pkmodel ResultCache')
+        if store is not None and type(store) != pk.ResultStore:
+            raise TypeError('The store must be a pkmodel ResultStore')
+        if instrumentation is not None and (
+                type(instrumentation) != pk.Instrumentation):
+            raise TypeError('The instrumentation must be a pkmodel '
+                            'Instrumentation')
+        self.backend = backend
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+        self.cache = cache
+        self.store = store
+        self.instrumentation = instrumentation
         self.models = []
         self.protocols = []
 
@@ -33,7 +117,7 @@ class Solution:
             parameters of the dose and time span for the ODE solver
         """
         # Verify the type of the model and protocol arguments
-        if type(model) != pk.Model:
+        if not isinstance(model, pk.Model):
             raise TypeError('The model must be a pkmodel Model')
         if type(protocol) != pk.Protocol:
             raise TypeError('The protocol must be a pkmodel Protocol')
@@ -93,7 +177,7 @@ class Solution:
             if type(item) not in [int, float, numpy.float64]:
                 raise TypeError('q must be array of float or int values')
         # Verify the type of the model and protocol arguments
-        if type(model) != pk.Model:
+        if not isinstance(model, pk.Model):
             raise TypeError('The model must be a pkmodel Model')
         if type(protocol) != pk.Protocol:
             raise TypeError('The protocol must be a pkmodel Protocol')
@@ -116,11 +200,11 @@ class Solution:
         # Validate input
         self.ode_system_validation(q, t, model, protocol)
 
-        dose_fn = protocol.dose
+        dose_fn = self._dose(protocol)
         # get the number of variables in the model, from len(q)
         num_variables = len(q)
         # get the number of compartments
-        num_compartments = len(model.list_compartments())
+        num_compartments = len(model) - 1
         # check that for iv num_var is one more than num_comp, and two more
         # for sc
         if model.delivery_mode == 'iv':
@@ -138,19 +222,15 @@ class Solution:
         ka = model.ka
 
         # get the parameters for each compartment
-        # this is a list which
-        compartment_parameters = model.list_compartments()
-
-        # now extract the ones we need
-        q_p = [qp for (v, qp) in compartment_parameters]
-        v_p = [vp for (vp, q) in compartment_parameters]
+        q_p = model.q_p.tolist()
+        v_p = model.v_p.tolist()
 
         # create a list of transitions
         if model.delivery_mode == 'iv':
             transitions = [q_p[i] * ((q[0] / v_c) - (
                 q[i + 1] / v_p[i])) for i in range(0, num_compartments)]
         elif model.delivery_mode == 'sc':
-            transitions = [q_p[i] * ((q[0] / v_c) - (
+            transitions = [q_p[i] * ((q[1] / v_c) - (
                 q[i + 2] / v_p[i])) for i in range(0, num_compartments)]
 
         if model.delivery_mode == 'iv':
@@ -172,24 +252,269 @@ class Solution:
             return_list += transitions
             return return_list
 
-    def solution(self, model, protocol, time):
+    def compiled_system(self, model, protocol):
+        """Compiles a model and protocol pair into the right-hand side of
+        their ODE system. The model is reduced once to its rate matrix and
+        dose input vector, so each evaluation is a single matrix-vector
+        product with no validation of its input.
+
+        Args:
+            model (Model object)
+            protocol (Protocol object)
+
+        Returns:
+            function f(t, q) returning the 1-D numpy array dq/dt
+        """
+        A, b = model.linear_system()
+        dose_fn = self._dose(protocol)
+        return lambda t, q: A.dot(q) + b * dose_fn(t, q)
+
+    def _dose(self, protocol):
+        """Returns the dose function of a protocol, counted by the
+        instrumentation if there is one.
+        """
+        if self.instrumentation is None or not protocol.has_dose_function:
+            return protocol.dose
+        return self.instrumentation.count(protocol.dose, 'dose')
+
+    def _settings(self):
+        """Returns the solver settings of this Solution as keyword arguments
+        for the constructor.
+        """
+        return {'backend': self.backend, 'method': self.method,
+                'rtol': self.rtol, 'atol': self.atol}
+
+    def _integrate(self, system, y0, t_span, t_eval, jacobian,
+                   dense_output=False):
+        """Integrates an ODE system with .solve_ivp(), using the solver
+        settings of this Solution.
+
+        Args:
+            system (function): the right-hand side f(t, q)
+            y0 (numpy ndarray): the initial state
+            t_span (list): the start and end of the integration [hours]
+            t_eval (list): the time points, or None for the solver's own
+                time points [hours]
+            jacobian (function): returns the constant Jacobian of the
+                system, called only for the implicit methods
+            dense_output (bool): whether to return the solver's interpolant
+
+        Returns:
+            the solve_ivp result object
+        """
+        if t_span[0] == t_span[1]:
+            # an empty segment, such as that of a bolus at the last time
+            # point, keeps its initial state
+            t = numpy.asarray(t_span[:1] if t_eval is None else t_eval,
+                              dtype=float)
+            y = numpy.repeat(numpy.reshape(y0, (-1, 1)), len(t), axis=1)
+            return scipy.optimize.OptimizeResult(
+                t=t, y=y, sol=ConstantPiece(y0) if dense_output else None,
+                nfev=0, njev=0, nlu=0, status=0, success=True,
+                message='The segment is empty.')
+        options = {}
+        if self.method in ['Radau', 'BDF']:
+            options['jac'] = jacobian()
+        elif self.method == 'LSODA':
+            # LSODA only accepts the Jacobian as a function of a dense array
+            matrix = jacobian()
+            if scipy.sparse.issparse(matrix):
+                matrix = matrix.toarray()
+            options['jac'] = lambda t, q: matrix
+        return scipy.integrate.solve_ivp(
+            fun=system, y0=y0, t_span=t_span, t_eval=t_eval,
+            method=self.method, rtol=self.rtol, atol=self.atol,
+            dense_output=dense_output, **options)
+
+    @staticmethod
+    def _segments(protocol, time):
+        """Splits the time points at the events of the protocol's regimen.
+
+        Args:
+            protocol (Protocol object)
+            time (numpy ndarray): the time points [hours]
+
+        Yields:
+            start, stop (float): the ends of a segment between events
+            points (slice): the time points in the segment, from start up
+                to, but excluding, stop (including it for the last segment).
+                A bolus at the last time point is given in an empty last
+                segment, starting and stopping there, so that the output
+                at that point includes it
+            bolus (float): the total bolus given at start [ng]
+            rate (float): the dose rate of the infusions, schedules and rate
+                tables at start [ng/h]
+            slope (float): the constant rate of change of the dose rate in
+                the segment, non-zero only for rate tables [ng/h^2]
+        """
+        events = protocol.event_times()
+        events = events[(events > time[0]) & (events < time[-1])]
+        bolus_times, amounts = protocol.boluses()
+        if time[-1] > time[0] and numpy.any(bolus_times == time[-1]):
+            events = numpy.append(events, time[-1])
+        bounds = numpy.concatenate([time[:1], events, time[-1:]])
+        index = numpy.searchsorted(time, bounds)
+        index[-1] = len(time)
+        for k in range(len(bounds) - 1):
+            start, stop = bounds[k], bounds[k + 1]
+            # the rates are read at the midpoint, away from the events
+            middle = 0.5 * (start + stop)
+            rate, slope = protocol.table_rate(middle, slope=True)
+            rate = protocol.infusion_rate(middle) + rate - slope * (
+                middle - start)
+            yield (start, stop, slice(index[k], index[k + 1]),
+                   amounts[bolus_times == start].sum(), float(rate),
+                   float(slope))
+
+    def _piecewise(self, protocol, time, q0, solve_segment):
+        """Solves from the initial state q0 across the events of the
+        protocol's regimen, one segment between events at a time. Each
+        bolus is applied as a jump in q_0 at the start of its segment, and
+        the dose rate is linear in time within each segment.
+
+        Args:
+            protocol (Protocol object)
+            time (numpy ndarray): the time points [hours]
+            q0 (numpy ndarray): the initial state, shape (..., n)
+            solve_segment (function): solve_segment(start, stop, t_eval, q,
+                rate, slope) solves a segment from the state q at start with
+                the dose rate rate + slope (t - start). It returns the output
+                times, the output at those times (with the time axis last)
+                and the full state at stop
+
+        Returns:
+            t (numpy ndarray): the output times [hours]
+            y (numpy ndarray): the output, joined along the time axis
+        """
+        q = numpy.array(q0, dtype=float)
+        times, outputs = [], []
+        for start, stop, points, bolus, rate, slope in self._segments(
+                protocol, time):
+            q[..., 0] += bolus
+            t, y, q = solve_segment(start, stop, time[points], q, rate,
+                                    slope)
+            times.append(t)
+            outputs.append(y)
+        return numpy.concatenate(times), numpy.concatenate(outputs, axis=-1)
+
+    def cache_key(self, model, protocol, time, solver_points=False):
+        """Returns the key under which the solution of a model and protocol
+        on a time grid is cached. It combines the model and protocol
+        parameters, a digest of the time grid and the solver settings.
+
+        Args:
+            model (Model object)
+            protocol (Protocol object)
+            time (list): the time points [hours]
+            solver_points (bool): as for Solution.solution
+
+        Returns:
+            tuple: the key, or None if the solution should not be cached
+        """
+        dose = None
+        if protocol.has_dose_function:
+            if self.cache is not None and not self.cache.cache_dose_functions:
+                return None
+            # the key holds a reference to the function, so its identity
+            # cannot be reused by another function while it is cached
+            dose = protocol.dose
+        time = numpy.ascontiguousarray(time, dtype=float)
+        return (model.name, tuple(map(tuple, model.list_compartments())),
+                protocol.name, dose,
+                hashlib.sha1(time.tobytes()).hexdigest(), len(time),
+                bool(solver_points), tuple(sorted(self._settings().items())))
+
+    def solution(self, model, protocol, time, full_output=False,
+                 solver_points=False):
         """Calcuates the ODE solution for a specific model and protocol
-        using SciPy .solve_ivp().
+        using SciPy .solve_ivp(), or in closed form with the 'analytic'
+        backend when the protocol has no dose function. If the Solution has
+        a cache or a store, solutions are looked up there before solving.
 
         Args:
             model (Model object)
             protocol (Protocol object)
             time (list): t0 start of the integration and
             tmax the end [hours]
+            full_output (bool): if True, return a Trajectory with every
+                compartment and the solver statistics, instead of only the
+                central compartment
+            solver_points (bool): if True, return the solution at the time
+                points chosen by the numerical solver between time[0] and
+                time[-1], instead of at the points in time. The analytic
+                backend takes no steps and always uses the points in time
+
+        Returns:
+            numpy (ndarray): the numerical solutions to the system, or a
+            Trajectory if full_output is True. Read from the store, these
+            are backed by a read-only memory-mapped array
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.begin(model, protocol, self.backend, self.method)
+        result, cached = None, False
+        try:
+            if self.cache is None and self.store is None:
+                result = self._solve(model, protocol, time, solver_points)
+            else:
+                key = self.cache_key(model, protocol, time, solver_points)
+                result = self._lookup(key, protocol)
+                cached = result is not None
+                if result is None:
+                    result = self._solve(model, protocol, time,
+                                         solver_points)
+                    self._remember(key, model, protocol, result)
+        except Exception as e:
+            if instrumentation is not None:
+                instrumentation.end(error=e)
+            raise
+        if instrumentation is not None:
+            instrumentation.end(result, cached)
+        return result if full_output else result.central
+
+    def _lookup(self, key, protocol):
+        """Returns the solution for a key from the cache or else the store,
+        or None if neither holds it.
+        """
+        if self.cache is not None and key is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+        if self.store is not None and not protocol.has_dose_function:
+            result = self.store.get(key)
+            if result is not None:
+                if self.cache is not None:
+                    self.cache.put(key, result)
+                return result
+        return None
+
+    def _remember(self, key, model, protocol, result):
+        """Saves a newly solved solution to the store and the cache.
+        """
+        if self.store is not None and not protocol.has_dose_function:
+            self.store.put(key, result, {
+                'model': model.name,
+                'compartments': model.list_compartments(),
+                'protocol': protocol.name})
+        if self.cache is not None and key is not None:
+            self.cache.put(key, result)
+
+    def _solve(self, model, protocol, time, solver_points=False, q0=None):
+        """Solves a model and protocol pair for Solution.solution, without
+        using the cache.
+
+        Args:
+            q0 (numpy ndarray): the state at time[0], before any bolus given
+                then. Defaults to the protocol's initial dose in q_0
 
         Returns:
-            numpy (ndarray): the numerical solutions to the system
+            Trajectory: the full solution
         """
         # Get an array to store all the variables in the system
         if model.delivery_mode == 'iv':
-            num_variables = len(model.list_compartments()) + 1
+            num_variables = len(model)
         elif model.delivery_mode == 'sc':
-            num_variables = len(model.list_compartments()) + 2
+            num_variables = len(model) + 1
 
         y0 = numpy.zeros((num_variables), dtype=float)
         # Set the first element of the initial conditions array y0
@@ -198,89 +523,669 @@ class Solution:
 
         # However in both cases, drug is always delivered to q0
         y0[0] = protocol.initial_dose
-        # Now we need to define the model in terms of ODEs
-        system = lambda t, q: self.ode_system(
-            q, t, model=model, protocol=protocol)
+        if q0 is not None:
+            y0[:] = q0
 
-        time_span = [time[0], time[-1]]
-        numerical_solution = scipy.integrate.solve_ivp(
-            fun=system, y0=y0, t_span=time_span, t_eval=time)
+        time = numpy.asarray(time, dtype=float)
+        stats = {'nfev': 0, 'njev': 0, 'nlu': 0, 'status': 0,
+                 'message': ''}
+        if self.backend == 'analytic' and not protocol.has_dose_function:
+            solve_segment = self._analytic_segments(model)
+        else:
+            solve_segment = self._numerical_segments(
+                model, protocol, solver_points, stats)
+        t, y = self._piecewise(protocol, time, y0, solve_segment)
+        # keep the time points and every compartment in one array
+        data = numpy.empty((num_variables + 1, len(t)))
+        data[0] = t
+        data[1:] = y
+        return Trajectory(data, model.delivery_mode, **stats)
 
-        numerical_solution = numerical_solution.y
-        # cut down the output to just the integrated solution
+    @staticmethod
+    def _analytic_segments(model):
+        """Returns the solve_segment function of Solution._piecewise which
+        evaluates the closed-form solution of a model, for Solution._solve.
+        """
+        modes = LinearModes.from_model(model)
 
-        if model.delivery_mode == 'iv':
-            return numerical_solution[0]
-            # the numerical solution for intravenous dosing
-        elif model.delivery_mode == 'sc':
-            return numerical_solution[1]
-            # the numerical solution for subcutaneous dosing
+        def solve_segment(start, stop, t_eval, q, rate, slope):
+            # evaluate the output points and the end state in one call
+            y = modes.evaluate(
+                numpy.append(t_eval, stop) - start, q, rate,
+                slope=slope)[0]
+            return t_eval, y[:, :-1], y[:, -1]
+
+        return solve_segment
+
+    @staticmethod
+    def _add_rate(system, num_variables, start, rate, slope):
+        """Returns a right-hand side with a dose rate rate + slope (t -
+        start) into q_0 added to that of system.
+        """
+        if slope != 0:
+            infusion = numpy.zeros(num_variables)
+            infusion[0] = 1.0
+            return lambda t, q: numpy.add(
+                system(t, q), infusion * (rate + slope * (t - start)))
+        if rate != 0:
+            infusion = numpy.zeros(num_variables)
+            infusion[0] = rate
+            return lambda t, q: numpy.add(system(t, q), infusion)
+        return system
+
+    def _numerical_segments(self, model, protocol, solver_points, stats):
+        """Returns the solve_segment function of Solution._piecewise which
+        integrates the ODE system of a model and protocol pair, adding the
+        solver statistics to stats, for Solution._solve.
+        """
+        if self.backend in ['compiled', 'analytic']:
+            system = self.compiled_system(model, protocol)
         else:
-            raise ValueError(
-                """Model delivery mode incorrectly defined.
-                Options are: 'intravenous', or 'subcutaneous'.""")
+            system = lambda t, q: self.ode_system(
+                q, t, model=model, protocol=protocol)
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            system = instrumentation.count(system, 'rhs')
+        num_variables = len(model) + (model.delivery_mode == 'sc')
+
+        def solve_segment(start, stop, t_eval, q, rate, slope):
+            rhs = self._add_rate(system, num_variables, start, rate, slope)
+            # also evaluate the end state, unless it is already an output
+            points = t_eval
+            if len(t_eval) == 0 or t_eval[-1] != stop:
+                points = numpy.append(t_eval, stop)
+            numerical_solution = self._integrate(
+                rhs, q, [start, stop], None if solver_points else points,
+                lambda: model.linear_system()[0],
+                dense_output=instrumentation is not None)
+            if instrumentation is not None and stop > start:
+                # the steps are read from the solver's interpolant
+                instrumentation.add_steps(numerical_solution, self.method)
+            for stat in ['nfev', 'njev', 'nlu']:
+                stats[stat] += getattr(numerical_solution, stat)
+            if numerical_solution.status != 0 or not stats['message']:
+                stats['status'] = numerical_solution.status
+                stats['message'] = numerical_solution.message
+            t, y = numerical_solution.t, numerical_solution.y
+            if solver_points:
+                return t, y, y[:, -1]
+            return t_eval, y[:, :len(t_eval)], y[:, -1]
+
+        return solve_segment
+
+    def dense(self, model, protocol, t_span=None):
+        """Solves a model and protocol pair once, returning a DenseSolution
+        which can then be evaluated at any times within the time span
+        without solving again. It is not cached.
+
+        Args:
+            model (Model object)
+            protocol (Protocol object)
+            t_span (tuple): the start and end of the solution, defaults to
+                (0, protocol.time_span) [hours]
+
+        Returns:
+            DenseSolution: the solution as a function of time
+        """
+        if t_span is None:
+            t_span = (0.0, protocol.time_span)
+        if len(t_span) != 2 or not t_span[0] < t_span[1]:
+            raise ValueError('t_span must be an increasing (start, end) pair')
+        num_variables = len(model) + (
+            0 if model.delivery_mode == 'iv' else 1)
+        y0 = numpy.zeros(num_variables)
+        y0[0] = protocol.initial_dose
+        starts, pieces = [], []
+
+        if self.backend == 'analytic' and not protocol.has_dose_function:
+            modes = LinearModes.from_model(model)
+
+            def solve_segment(start, stop, t_eval, q, rate, slope):
+                starts.append(start)
+                pieces.append(ModalPiece(modes, start, q.copy(), rate,
+                                         slope))
+                return t_eval, t_eval, modes.evaluate(
+                    [stop - start], q, rate, slope=slope)[0, :, 0]
+        else:
+            if self.backend in ['compiled', 'analytic']:
+                system = self.compiled_system(model, protocol)
+            else:
+                system = lambda t, q: self.ode_system(
+                    q, t, model=model, protocol=protocol)
+
+            def solve_segment(start, stop, t_eval, q, rate, slope):
+                infusion = numpy.zeros(num_variables)
+                infusion[0] = 1.0
+                numerical_solution = self._integrate(
+                    lambda t, q: numpy.add(system(t, q), infusion * (
+                        rate + slope * (t - start))), q,
+                    [start, stop], None, lambda: model.linear_system()[0],
+                    dense_output=True)
+                starts.append(start)
+                pieces.append(numerical_solution.sol)
+                return t_eval, t_eval, numerical_solution.y[:, -1]
+
+        self._piecewise(protocol, numpy.asarray(t_span, dtype=float), y0,
+                        solve_segment)
+        return DenseSolution(model.delivery_mode, starts, float(t_span[1]),
+                             pieces)
+
+    def adaptive(self, model, protocol, rtol: float = 1e-3,
+                 atol: float = 1e-9, max_points: int = 10000, t_span=None):
+        """Solves a model and protocol pair on a time grid chosen to follow
+        the solution, rather than an evenly spaced one: points are placed
+        where the profile bends, such as around an absorption peak, and few
+        where it is flat, such as in the elimination tail. Linear
+        interpolation between the points is within the tolerances, so plots
+        and exported series need far fewer points. It is not cached.
+
+        Args:
+            model (Model object)
+            protocol (Protocol object)
+            rtol (float): the tolerance of the interpolation, relative to
+                each state variable
+            atol (float): the absolute tolerance of the interpolation [ng]
+            max_points (int): the most time points, at least 3
+            t_span (tuple): as for Solution.dense
 
-    def visualise(self, layout='overlay', time_res=1000):
+        Returns:
+            Trajectory: the full solution on the chosen grid, see
+            pkmodel.downsample.adaptive_grid
+        """
+        dense = self.dense(model, protocol, t_span)
+        t, y = adaptive_grid(dense, rtol, atol, max_points)
+        data = numpy.empty((len(y) + 1, len(t)))
+        data[0] = t
+        data[1:] = y
+        return Trajectory(data, model.delivery_mode)
+
+    def stream(self, model, protocol, time_res=1000, window=10000,
+               full_output=False):
+        """Solves a model and protocol pair over the protocol's time span,
+        one window of time points at a time, carrying the state from each
+        window to the next. Only one window is held in memory at once, so
+        the memory used does not grow with the time span. Windows are not
+        cached.
+
+        Args:
+            model (Model object)
+            protocol (Protocol object)
+            time_res (int): the number of equally spaced time points from 0
+                to protocol.time_span, as for Solution.solve_all
+            window (int): the number of time points in each window
+            full_output (bool): if True, yield every compartment instead of
+                only the central compartment
+
+        Yields:
+            t (numpy ndarray): the time points of the window [hours]
+            y (numpy ndarray): the solution at those points, as from
+                Solution.solution, or every compartment in an array of
+                shape (n, len(t)) if full_output is True
+        """
+        if type(time_res) != int or time_res < 2:
+            raise ValueError('time_res must be an integer of at least 2')
+        if type(window) != int or window < 1:
+            raise ValueError('window must be a positive integer')
+        step = protocol.time_span / (time_res - 1)
+        q = None
+        for start in range(0, time_res, window):
+            # solve up to the first point of the next window, whose state
+            # starts it
+            stop = min(start + window, time_res - 1)
+            last = stop == time_res - 1
+            time = numpy.arange(start, stop + 1) * step
+            if last:
+                time[-1] = protocol.time_span
+            trajectory = self._solve(model, protocol, time, q0=q)
+            q = trajectory.y[:, -1].copy()
+            if not last:
+                # a bolus at the boundary is given again by the next window
+                bolus_times, amounts = protocol.boluses()
+                q[0] -= amounts[bolus_times == time[-1]].sum()
+            points = slice(None) if last else slice(-1)
+            y = trajectory.y if full_output else trajectory.central
+            yield trajectory.t[points], y[..., points]
+            if last:
+                return
+
+    def solve_population(self, delivery_mode, protocol, time, V_c=1.0,
+                         CL=1.0, Ka=1.0, V_p=None, Q_p=None):
+        """Solves a population of models which share a delivery mode and a
+        number of peripheral compartments but differ in their parameters,
+        all under the same protocol. All subjects are solved together, as
+        one batched closed-form evaluation with the 'analytic' backend or as
+        one stacked ODE system integrated by a single .solve_ivp() call
+        (per segment between the doses of the protocol's regimen).
+
+        Args:
+            delivery_mode (str): the delivery mode, as for Model
+            protocol (Protocol object): the protocol for every subject. A
+                dose function is called as dose(t, q) with the (N, n) array
+                of all subject states and must return a scalar or an
+                array of shape (N,)
+            time (list): the time points, as for Solution.solution [hours]
+            V_c, CL, Ka (array-like): the parameters of each subject, as
+                arrays of shape (N,) or as scalars shared by all subjects
+            V_p, Q_p (array-like): the peripheral compartment parameters,
+                as arrays of shape (N, k) or (k,) for k compartments.
+                Defaults to no peripheral compartments
+
+        Returns:
+            numpy (ndarray): the solution for the central compartment, as
+            returned by Solution.solution, with shape (N, len(time))
+        """
+        if delivery_mode not in ['intravenous', 'iv', 'IV',
+                                 'subcutaneous', 'subq', 'sc', 'SC']:
+            raise ValueError('Given delivery_mode invalid;'
+                             'try "intravenous" or "subcutaneous"')
+        if type(protocol) != pk.Protocol:
+            raise TypeError('The protocol must be a pkmodel Protocol')
+        if delivery_mode in ['intravenous', 'iv', 'IV']:
+            delivery_mode = 'iv'
+        else:
+            delivery_mode = 'sc'
+        central = 0 if delivery_mode == 'iv' else 1
+        time = numpy.asarray(time, dtype=float)
+
+        if self.backend == 'analytic' and not protocol.has_dose_function:
+            modes = LinearModes(delivery_mode, V_c, CL, Ka, V_p, Q_p)
+            y0 = numpy.zeros((len(modes.lam), modes.num_variables))
+            y0[:, 0] = protocol.initial_dose
+
+            def solve_segment(start, stop, t_eval, q, rate, slope):
+                y = modes.evaluate(t_eval - start, q, rate, rows=[central],
+                                   slope=slope)
+                end = modes.evaluate([stop - start], q, rate, slope=slope)
+                return t_eval, y[:, 0], end[:, :, 0]
+
+            return self._piecewise(protocol, time, y0, solve_segment)[1]
+
+        # Stack the subjects into one system of N * n variables
+        A = rate_matrices(delivery_mode, V_c, CL, Ka, V_p, Q_p)
+        num_subjects, num_variables = A.shape[:2]
+        y0 = numpy.zeros((num_subjects, num_variables))
+        y0[:, 0] = protocol.initial_dose
+        dose_fn = protocol.dose
+
+        def system(t, y):
+            q = y.reshape(num_subjects, num_variables)
+            dq = numpy.einsum('ijk,ik->ij', A, q)
+            dq[:, 0] += dose_fn(t, q)
+            return dq.ravel()
+
+        def solve_segment(start, stop, t_eval, q, rate, slope):
+            rhs = system
+            if rate != 0 or slope != 0:
+                rhs = lambda t, y: system(t, y) + infusion * (
+                    rate + slope * (t - start))
+            points = t_eval
+            if len(t_eval) == 0 or t_eval[-1] != stop:
+                points = numpy.append(t_eval, stop)
+            numerical_solution = self._integrate(
+                rhs, q.ravel(), [start, stop], points,
+                lambda: scipy.sparse.block_diag(A, format='csc'))
+            y = numerical_solution.y.reshape(num_subjects, num_variables, -1)
+            return t_eval, y[:, central, :len(t_eval)], y[:, :, -1]
+
+        infusion = numpy.zeros((num_subjects, num_variables))
+        infusion[:, 0] = 1.0
+        infusion = infusion.ravel()
+        return self._piecewise(protocol, time, y0, solve_segment)[1]
+
+    def superposition(self, model, protocol, time):
+        """Calculates the central compartment under a regimen of boluses by
+        superposition: the model is linear, so the response to every dose
+        is the single dose response, shifted to the dose time and scaled by
+        the amount. The single dose response is computed once, in closed
+        form, and evaluated for all doses and time points in vectorised
+        blocks.
+
+        Args:
+            model (Model object)
+            protocol (Protocol object): with the initial_dose given at
+                time[0] and boluses added with Protocol.add_bolus. Boluses
+                before time[0] are ignored
+            time (list): the time points [hours]
+
+        Returns:
+            numpy (ndarray): the solution, as from Solution.solution
+        """
+        if (protocol.has_dose_function or len(protocol.infusions()[0])
+                or protocol.has_rate_table):
+            raise ValueError('Superposition supports protocols with boluses '
+                             'only, not dose functions or infusions')
+        time = numpy.asarray(time, dtype=float)
+        central = 0 if model.delivery_mode == 'iv' else 1
+        modes = LinearModes.from_model(model)
+        unit = numpy.zeros(modes.num_variables)
+        unit[0] = 1.0
+        dose_times, amounts = protocol.boluses()
+        keep = (dose_times >= time[0]) & (dose_times <= time[-1])
+        dose_times = numpy.append(time[0], dose_times[keep])
+        amounts = numpy.append(protocol.initial_dose, amounts[keep])
+        out = numpy.zeros(len(time))
+        # bound the (doses, time) blocks to about a million elements
+        block = max(1, 2 ** 20 // len(time))
+        for start in range(0, len(dose_times), block):
+            elapsed = time - dose_times[start:start + block, None]
+            response = modes.evaluate(
+                numpy.maximum(elapsed, 0), unit, rows=[central])[:, 0]
+            response[elapsed < 0] = 0
+            out += amounts[start:start + block] @ response
+        return out
+
+    def steady_state(self, model, amount, interval, time_res=100):
+        """Calculates the steady state of a regimen of equal boluses at a
+        fixed interval directly, without simulating the doses before it.
+        The state just before a dose at steady state, q_ss, satisfies
+        q_ss = exp(A interval) (q_ss + amount e_0).
+
+        Args:
+            model (Model object): a model with CL > 0
+            amount (float): the amount of each dose [ng]
+            interval (float): the time between doses [hours]
+            time_res (int): the number of time points over one interval
+
+        Returns:
+            dict: with 'time', the time points after a dose [hours];
+            'profile', the central compartment over one interval at steady
+            state; 'peak' and 'trough', its maximum and minimum; and
+            'accumulation_ratio', the ratio of the area under the profile
+            at steady state to that after a single dose
+        """
+        if type(amount) not in [int, float]:
+            raise TypeError('amount must be int or float')
+        if type(interval) not in [int, float] or interval <= 0:
+            raise ValueError('interval must be a positive number')
+        central = 0 if model.delivery_mode == 'iv' else 1
+        modes = LinearModes.from_model(model)
+        n = modes.num_variables
+        # the propagator exp(A interval), column by column
+        propagator = modes.evaluate([interval], numpy.eye(n))[:, :, 0].T
+        dose = numpy.zeros(n)
+        dose[0] = amount
+        try:
+            trough = numpy.linalg.solve(numpy.eye(n) - propagator,
+                                        propagator @ dose)
+        except numpy.linalg.LinAlgError:
+            raise ValueError('The model has no steady state; CL must be '
+                             'positive')
+        time = numpy.linspace(0, interval, time_res)
+        profile = modes.evaluate(time, trough + dose, rows=[central])[0, 0]
+        single = modes.evaluate(time, dose, rows=[central])[0, 0]
+        # the ratio of the areas by the trapezoidal rule, in which the equal
+        # time steps cancel
+        return {'time': time, 'profile': profile,
+                'peak': profile.max(), 'trough': profile.min(),
+                'accumulation_ratio': (
+                    numpy.sum(profile[1:] + profile[:-1])
+                    / numpy.sum(single[1:] + single[:-1]))}
+
+    def _empty_copy(self):
+        """Returns a Solution with the same solver settings but no pairs.
+        """
+        instrumentation = None
+        if self.instrumentation is not None:
+            instrumentation = pk.Instrumentation()
+        return Solution(instrumentation=instrumentation, **self._settings())
+
+    def solve_all(self, time_res=1000, workers=None, chunk_size=None,
+                  full_output=False):
+        """Solves every (model, protocol) pair in Solution.list_compartments,
+        spreading them over a pool of worker processes. Pairs are sent to
+        the workers in chunks, and only a few chunks per worker are in
+        flight at once. Pairs which cannot be sent to another process
+        (for example with a lambda dose function) are solved in this one.
+
+        Args:
+            time_res (int): the number of time points between 0 and the
+                protocol time span, as for Solution.visualise
+            workers (int): the number of worker processes, defaults to the
+                number of CPUs. With 1 worker the pairs are solved serially
+                in this process
+            chunk_size (int): the number of pairs sent to a worker at once,
+                defaults to spreading the pairs over 4 chunks per worker
+            full_output (bool): as for Solution.solution
+
+        Returns:
+            list: the solution of each pair, in the order of
+            Solution.list_compartments, as returned by Solution.solution.
+            If a pair failed, its entry is the exception it raised
+        """
+        results = self._solve_pairs(self.list_compartments, time_res,
+                                    workers, chunk_size)
+        if full_output:
+            return results
+        return [result if isinstance(result, Exception) else result.central
+                for result in results]
+
+    def _solve_pairs(self, pairs, time_res, workers, chunk_size):
+        """Solves some (model, protocol) pairs for Solution.solve_all, which
+        documents the arguments, returning a Trajectory or exception each.
+        """
+        workers, chunk_size = self._chunking(len(pairs), workers, chunk_size)
+        if workers == 1:
+            # solved here, so Solution.solution uses the cache directly,
+            # and the instrumentation has already recorded the pairs
+            return _solve_chunk(self, pairs, time_res)[0]
+        return self._solve_parallel(pairs, time_res, workers, chunk_size)
+
+    @staticmethod
+    def _chunking(num_pairs, workers, chunk_size):
+        """Returns the number of workers and the chunk size of
+        Solution.solve_all, which documents their defaults.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if type(workers) != int or workers < 1:
+            raise ValueError('workers must be a positive integer')
+        if chunk_size is None:
+            chunk_size = max(1, -(-num_pairs // (4 * workers)))
+        if type(chunk_size) != int or chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer')
+        return workers, chunk_size
+
+    def _iter_pairs(self, pairs, time_res, workers, max_chunk_size):
+        """Solves some (model, protocol) pairs over a single process pool,
+        yielding the Trajectory or exception of each in order, for
+        pkmodel.export.write_results. Chunks are looked up in the cache
+        and store, and solved, at most two per worker ahead of the pair
+        being yielded, so only those are held at once.
+
+        Args:
+            pairs (list): the (model, protocol) pairs
+            time_res (int): as for Solution.solve_all
+            workers (int): as for Solution.solve_all
+            max_chunk_size (int): the most pairs sent to a worker at once
+        """
+        workers, chunk_size = self._chunking(len(pairs), workers, None)
+        if workers == 1:
+            for pair in pairs:
+                yield _solve_chunk(self, [pair], time_res)[0][0]
+            return
+        chunk_size = min(chunk_size, max_chunk_size)
+        solver = self._empty_copy()
+        starts = iter(range(0, len(pairs), chunk_size))
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            chunks = collections.deque()
+
+            def submit():
+                for start in starts:
+                    chunk = pairs[start:start + chunk_size]
+                    results, todo = self._lookup_pairs(chunk, time_res)
+                    future = None
+                    if todo:
+                        future = executor.submit(
+                            _solve_chunk, solver, [chunk[i] for i in todo],
+                            time_res)
+                    chunks.append((chunk, results, todo, future))
+                    if len(chunks) >= 2 * workers:
+                        break
+
+            submit()
+            while chunks:
+                chunk, results, todo, future = chunks.popleft()
+                if future is not None:
+                    self._collect_chunk(future, solver, chunk, todo,
+                                        time_res, results)
+                submit()
+                for result in results:
+                    yield result
+
+    def _lookup_pairs(self, pairs, time_res):
+        """Reads the solved pairs from the cache and store for
+        Solution._solve_parallel.
+
+        Returns:
+            list: the solution of each pair, or None if it is not cached
+            list: the indices of the pairs which are not cached
+        """
+        results = [None] * len(pairs)
+        if self.cache is None and self.store is None:
+            return results, list(range(len(pairs)))
+        todo = []
+        for i, (model, protocol) in enumerate(pairs):
+            time = numpy.linspace(0, protocol.time_span, time_res)
+            results[i] = self._lookup(self.cache_key(model, protocol, time),
+                                      protocol)
+            if results[i] is None:
+                todo.append(i)
+            elif self.instrumentation is not None:
+                self.instrumentation.begin(
+                    model, protocol, self.backend, self.method)
+                self.instrumentation.end(results[i], cached=True)
+        return results, todo
+
+    def _collect_chunk(self, future, solver, pairs, indices, time_res,
+                       results):
+        """Stores the solutions of a chunk of pairs solved by a worker in
+        results, and in the cache and store, for Solution._solve_parallel.
+        """
+        chunk = [pairs[i] for i in indices]
+        try:
+            chunk_results, records = future.result()
+        except Exception:
+            # the chunk could not be sent to or run by a worker
+            chunk_results, records = _solve_chunk(solver, chunk, time_res)
+        for record in records:
+            self.instrumentation.add(record)
+        remember = self.cache is not None or self.store is not None
+        for i, result in zip(indices, chunk_results):
+            results[i] = result
+            if remember and not isinstance(result, Exception):
+                model, protocol = pairs[i]
+                time = numpy.linspace(0, protocol.time_span, time_res)
+                self._remember(self.cache_key(model, protocol, time),
+                               model, protocol, result)
+
+    def _solve_parallel(self, pairs, time_res, workers, chunk_size):
+        """Solves pairs over a process pool for Solution.solve_all.
+        """
+        solver = self._empty_copy()
+        # only the pairs missing from the cache and store are sent to the
+        # workers
+        results, todo = self._lookup_pairs(pairs, time_res)
+        starts = iter(range(0, len(todo), chunk_size))
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            pending = {}
+
+            def submit():
+                # keep at most two chunks per worker in flight
+                for start in starts:
+                    chunk = [pairs[i] for i in todo[start:start + chunk_size]]
+                    future = executor.submit(
+                        _solve_chunk, solver, chunk, time_res)
+                    pending[future] = start
+                    if len(pending) >= 2 * workers:
+                        break
+
+            submit()
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    start = pending.pop(future)
+                    self._collect_chunk(future, solver, pairs,
+                                        todo[start:start + chunk_size],
+                                        time_res, results)
+                submit()
+        return results
+
+    def export(self, path: str, time_res=1000, full_output=False,
+               group_size=64, workers=1, file_format=None):
+        """Solves every (model, protocol) pair in Solution.list_compartments
+        and writes their solutions, with the parameters of their models and
+        protocols, to a columnar file: compressed NumPy (.npz), Parquet
+        (.parquet) or Arrow IPC (.arrow), the last two needing pyarrow.
+        Pairs are solved and written in groups, so the whole table is never
+        held in memory. See pkmodel.export for the columns.
+
+        Args:
+            path (str): the file, whose extension gives its format
+            time_res (int): the number of time points of each pair, as for
+                Solution.solve_all
+            full_output (bool): whether to write every compartment, rather
+                than the central compartment only
+            group_size (int): the number of pairs written together, as
+                one row group, and the most sent to a worker at once
+            workers (int): the number of worker processes, as for
+                Solution.solve_all
+            file_format (str): 'npz', 'parquet' or 'arrow', if not given by
+                the extension of path
+
+        Returns:
+            int: the number of rows written
+        """
+        return write_results(self, path, time_res, full_output, group_size,
+                             workers, file_format)
+
+    @staticmethod
+    def import_results(path: str, file_format=None) -> dict:
+        """Reads a file written by Solution.export.
+
+        Args:
+            path (str): the file, whose extension gives its format
+            file_format (str): 'npz', 'parquet' or 'arrow', if not given by
+                the extension of path
+
+        Returns:
+            dict: the columns, as numpy arrays with a value per row, keyed
+            by name
+        """
+        return read_results(path, file_format)
+
+    def visualise(self, layout='overlay', time_res=1000, **options):
         """Plots the ODE solutions of the model using Matplotlib.
-        Layout can be chosen to be overlay or side-by-side.
-        Currently supports up to two side-by-side plots.
-        Time resolution defaults to 100 time steps but can be changed
+        Layout can be chosen to be overlay, side-by-side or a grid, with
+        any number of pairs. The profiles in each axes are drawn as a
+        single LineCollection, so thousands of pairs can be overlaid, or
+        summarised as percentile ribbons. Pairs are solved through the
+        cache and store, if any, unless their results are given.
+        Time resolution defaults to 1000 time steps but can be changed
         by the user as desired.
 
         Args:
-            layout (str): either 'overlay' or 'side_by_side,' defaults
+            layout (str): 'overlay', 'side_by_side' or 'grid', defaults
                to 'overlay.' Specifies if the solutions are shown overlaying
-               each other on one plot or as independent subplots side by side.
+               each other on one plot or as independent subplots side by
+               side or in a grid.
             time_res (int): the time resolution, specified as the number of
                 elements in the time and ODE solution array used for plotting.
-                Default is 100 elements.
-        """
-        # Generate tuples with (model, protocol) pairs as a list of tuples
-        inputs = self.list_compartments
-        # Generate figures to be populated with 'overlay',
-        # or 'side-by-side' plots
-        if layout == 'overlay' or (
-                layout == 'side_by_side' and len(inputs) == 1):
-            # make empty figure
-            fig = matplotlib.pyplot.figure(figsize=(10.0, 3.0))
-            # annotate
-            matplotlib.pyplot.xlabel("Time (hrs)")
-            matplotlib.pyplot.ylabel("$q_{c}$")
-        elif layout == 'side_by_side' and len(inputs) == 2:
-            fig = matplotlib.pyplot.figure(figsize=(10.0, 4.0))
-            plot1 = fig.add_subplot(1, 2, 1)
-            plot2 = fig.add_subplot(1, 2, 2)
-            # create axes labels
-            plot1.set_xlabel("Time (hrs)")
-            plot2.set_xlabel("Time (hrs)")
-            plot1.set_ylabel("$q_{c}$")
-            plot2.set_ylabel("$q_{c}$")
-        else:
-            raise ValueError(
-                """Solution.Visualise() supports overlay or side-by-side plots,
-                 with max of 2 inputs""")
-        # Loop over (model, protocol) objects to solve and then plot each
-        i = 0
-        for input in inputs:
-            model = input[0]
-            # the model object is the first in the tuple
-            protocol = input[1]
-            # the protocol object is the second in the tuple
-            time = numpy.linspace(0, protocol.time_span, time_res)
-            # generate time array
-            ODE_solution = self.solution(model, protocol, time)
-            # a function of the time array
-            if (layout == 'overlay') or (
-                    layout == 'side_by_side' and len(inputs) == 1):
-                label = 'Plot ' + str(i + 1)
-                matplotlib.pyplot.plot(time, ODE_solution, label=label)
-                print(label + ' = ' + model.name)
-            elif layout == 'side_by_side' and len(inputs) == 2:
-                if i == 0:
-                    plot1.plot(time, ODE_solution, label='Plot 1')
-                    print('Plot 1 = ' + model.name)
-                elif i == 1:
-                    plot2.plot(time, ODE_solution, label='Plot 2')
-                    print('Plot 2 = ' + model.name)
-            i += 1
-        matplotlib.pyplot.show()
+                Default is 1000 elements.
+            options: as for pkmodel.plotting.visualise: style ('lines' or
+                'bands'), shape (the rows and columns of a grid), results
+                (the already solved central compartment of each pair),
+                filename (to render the figure headless, with Agg, to a
+                file rather than showing it), percentiles, dpi and
+                max_points (to draw each line downsampled to at most so
+                many points)
+
+        Returns:
+            Figure: the Matplotlib figure
+        """
+        # imported here, so that matplotlib is only loaded for plotting
+        from .plotting import visualise
+        if self.instrumentation is None:
+            return visualise(self, layout, time_res, **options)
+        with self.instrumentation.timer('visualise'):
+            return visualise(self, layout, time_res, **options)
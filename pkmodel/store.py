@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy
+from .trajectory import Trajectory
+
+
+class ResultStore:
+    """The ResultStore class persists solutions in a directory, so that they
+    outlive the process which solved them and can be shared by jobs on the
+    same filesystem. Each solution is kept as a .npy file, named by a digest
+    of its key (see Solution.cache_key), next to a .json index entry with
+    the model and protocol it belongs to. Solutions are read back as
+    read-only memory-mapped arrays, without copying.
+    """
+    def __init__(self, path: str):
+        """Opens the store in a directory, creating it if needed.
+
+        Args:
+            path (str): the directory holding the store
+        """
+        if type(path) != str:
+            raise TypeError('path must be a str')
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Returns the number of stored solutions.
+        """
+        return len(self.digests())
+
+    def __contains__(self, key) -> bool:
+        """Returns whether a solution is stored for the key.
+        """
+        return os.path.exists(self._file(self.digest(key), '.npy'))
+
+    @staticmethod
+    def digest(key) -> str:
+        """Returns the digest of a key, which names its files in the store.
+        Keys must be built from values with a deterministic repr, such as
+        strings and numbers.
+
+        Args:
+            key (tuple): the key, as from Solution.cache_key
+        """
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _file(self, digest, extension):
+        """Returns the path of a file in the store.
+        """
+        return os.path.join(self.path, digest + extension)
+
+    def digests(self):
+        """Returns the digests of all the stored solutions.
+        """
+        return sorted(name[:-4] for name in os.listdir(self.path)
+                      if name.endswith('.npy'))
+
+    def get(self, key):
+        """Returns the stored solution for the key, backed by a read-only
+        memory-mapped array, or None if it is not stored.
+
+        Args:
+            key (tuple): the key, as from Solution.cache_key
+        """
+        digest = self.digest(key)
+        try:
+            value = numpy.load(self._file(digest, '.npy'), mmap_mode='r')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry = self.info(digest)
+        if 'trajectory' in entry:
+            return Trajectory(value, **entry['trajectory'])
+        return value
+
+    def info(self, digest: str) -> dict:
+        """Returns the index entry of a stored solution.
+
+        Args:
+            digest (str): the digest, as from ResultStore.digests
+        """
+        with open(self._file(digest, '.json')) as f:
+            return json.load(f)
+
+    def put(self, key, value, info=None):
+        """Stores a solution. Files are written under temporary names and
+        then renamed, so concurrent readers never see a partial file.
+
+        Args:
+            key (tuple): the key, as from Solution.cache_key
+            value (numpy ndarray or Trajectory): the solution
+            info (dict): JSON-serialisable description of the solution,
+                for example the model and protocol names
+        """
+        digest = self.digest(key)
+        entry = dict(info or {})
+        if isinstance(value, Trajectory):
+            entry['trajectory'] = dict(
+                value.stats, delivery_mode=value.delivery_mode,
+                message=value.message)
+            value = value.data
+        value = numpy.asarray(value)
+        entry.update(shape=list(value.shape), dtype=str(value.dtype))
+        self._write(digest, '.json',
+                    lambda f: f.write(json.dumps(entry).encode()))
+        self._write(digest, '.npy', lambda f: numpy.save(f, value))
+
+    def _write(self, digest, extension, write):
+        """Atomically writes one file of a stored solution.
+        """
+        fd, temporary = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temporary, self._file(digest, extension))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def remove(self, digest: str):
+        """Removes a stored solution.
+
+        Args:
+            digest (str): the digest, as from ResultStore.digests
+        """
+        for extension in ['.npy', '.json']:
+            if os.path.exists(self._file(digest, extension)):
+                os.remove(self._file(digest, extension))
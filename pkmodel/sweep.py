@@ -0,0 +1,274 @@
+"""Parameter sweeps and local sensitivity analysis.
+
+Samples of the model parameters are held in dicts mapping the parameter
+names V_c, CL, Ka, V_p and Q_p to arrays with a leading sample axis: shape
+(N,) for V_c, CL and Ka, and (N, k) for the k peripheral compartments of
+V_p and Q_p. A Sweep solves all the samples as batched populations (see
+Solution.solve_population) rather than one Model at a time.
+
+"""
+import numpy
+import scipy.sparse
+import pkmodel as pk
+from .analytic import rate_matrices, rate_matrix_derivatives
+
+PARAMETERS = ['V_c', 'CL', 'Ka', 'V_p', 'Q_p']
+
+
+def _check_names(names):
+    """Raises a ValueError for names which are not model parameters.
+    """
+    unknown = set(names) - set(PARAMETERS)
+    if unknown:
+        raise ValueError('Unknown parameters {}; the parameters are {}'
+                         .format(sorted(unknown), PARAMETERS))
+
+
+def grid(**levels) -> dict:
+    """Returns the full factorial grid of the given parameter levels.
+
+    Args:
+        levels (array-like): the levels of each parameter, keyed by its
+            name, along the first axis. Levels of V_p and Q_p have shape
+            (L, k) for k peripheral compartments
+
+    Returns:
+        dict: the samples, one for each combination of levels, with the
+        last parameter varying fastest
+    """
+    _check_names(levels)
+    levels = {name: numpy.asarray(value, dtype=float)
+              for name, value in levels.items()}
+    index = numpy.indices([len(value) for value in levels.values()])
+    index = index.reshape(len(levels), -1)
+    return {name: value[i] for (name, value), i in zip(levels.items(), index)}
+
+
+def latin_hypercube(num_samples: int, seed=None, log: bool = False,
+                    **bounds) -> dict:
+    """Returns a Latin hypercube sample of the parameters: the range of every
+    parameter is split into num_samples equally likely strata, and each
+    stratum is sampled exactly once.
+
+    Args:
+        num_samples (int): the number of samples N
+        seed (int): the seed of the random number generator
+        log (bool): whether to sample uniformly in the logarithm of the
+            parameters rather than in the parameters
+        bounds (tuple): the (low, high) bounds of each parameter, keyed by
+            its name. Bounds of V_p and Q_p have shape (k,)
+
+    Returns:
+        dict: the samples
+    """
+    if type(num_samples) != int or num_samples < 1:
+        raise ValueError('num_samples must be a positive integer')
+    _check_names(bounds)
+    rng = numpy.random.default_rng(seed)
+    samples = {}
+    for name, (low, high) in bounds.items():
+        low = numpy.asarray(low, dtype=float)
+        high = numpy.asarray(high, dtype=float)
+        if numpy.any(high < low):
+            raise ValueError('The bounds of {} must be (low, high)'
+                             .format(name))
+        if log and numpy.any(low <= 0):
+            raise ValueError('Log sampling needs positive bounds')
+        shape = (num_samples,) + numpy.broadcast(low, high).shape
+        # an independent random permutation of the strata in every column
+        strata = numpy.argsort(rng.random(shape), axis=0)
+        u = (strata + rng.random(shape)) / num_samples
+        if log:
+            samples[name] = low * (high / low) ** u
+        else:
+            samples[name] = low + (high - low) * u
+    return samples
+
+
+def exposure(time, profiles) -> dict:
+    """Calculates the exposure metrics of a batch of profiles.
+
+    Args:
+        time (array-like): the time points, shape (T,) [hours]
+        profiles (array-like): the profiles, shape (..., T)
+
+    Returns:
+        dict: 'auc', the area under the profiles by the trapezoidal rule;
+        'cmax', their maxima; and 'tmax', the first times of the maxima
+    """
+    time = numpy.asarray(time, dtype=float)
+    profiles = numpy.asarray(profiles, dtype=float)
+    peak = numpy.argmax(profiles, axis=-1)
+    auc = 0.5 * numpy.sum(numpy.diff(time)
+                          * (profiles[..., 1:] + profiles[..., :-1]), axis=-1)
+    return {'auc': auc,
+            'cmax': numpy.take_along_axis(
+                profiles, peak[..., None], axis=-1)[..., 0],
+            'tmax': time[peak]}
+
+
+class Sweep:
+    """The Sweep class evaluates the exposure to a protocol, and its local
+    sensitivity to the model parameters, over many samples of the
+    parameters at once.
+    """
+    def __init__(self, delivery_mode: str, protocol, time, solution=None,
+                 batch_size: int = 1024, concentration: bool = False,
+                 **fixed):
+        """Initialises a sweep.
+
+        Args:
+            delivery_mode (str): 'iv' or 'sc'
+            protocol (Protocol object): the protocol for every sample
+            time (list): the time points [hours]
+            solution (Solution object): solves the samples, giving the
+                backend and solver settings; defaults to Solution()
+            batch_size (int): the number of samples solved together
+            concentration (bool): whether the profiles are concentrations
+                in the central compartment [ng/mL], rather than amounts
+            fixed: values of the parameters which are not swept, as for
+                Solution.solve_population
+        """
+        if delivery_mode not in ['iv', 'sc']:
+            raise ValueError('delivery_mode must be "iv" or "sc"')
+        if type(protocol) != pk.Protocol:
+            raise TypeError('The protocol must be a pkmodel Protocol')
+        if type(batch_size) != int or batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        _check_names(fixed)
+        self.delivery_mode = delivery_mode
+        self.protocol = protocol
+        self.time = numpy.asarray(time, dtype=float)
+        self.solution = pk.Solution() if solution is None else solution
+        self.batch_size = batch_size
+        self.concentration = concentration
+        self.fixed = fixed
+
+    def _batches(self, samples):
+        """Combines the samples with the fixed parameters and yields them in
+        batches of at most batch_size samples.
+
+        Yields:
+            dict: the parameters of a batch, keyed by name
+        """
+        _check_names(samples)
+        parameters = {'V_c': 1.0, 'CL': 1.0, 'Ka': 1.0,
+                      'V_p': None, 'Q_p': None}
+        parameters.update(self.fixed)
+        parameters.update(samples)
+        # parameters with a sample axis: V_c, CL, Ka of shape (N,) and
+        # V_p, Q_p of shape (N, k)
+        sampled = {name for name, value in parameters.items()
+                   if value is not None and numpy.ndim(value)
+                   == (2 if name in ['V_p', 'Q_p'] else 1)}
+        sizes = {len(parameters[name]) for name in sampled}
+        if len(sizes) > 1:
+            raise ValueError('All samples must have the same length')
+        num_samples = sizes.pop() if sizes else 1
+        for start in range(0, num_samples, self.batch_size):
+            batch = slice(start, start + self.batch_size)
+            yield {name: (value[batch] if name in sampled else value)
+                   for name, value in parameters.items()}
+
+    def run(self, samples, profiles: bool = True) -> dict:
+        """Solves all the samples and calculates their exposure.
+
+        Args:
+            samples (dict): the samples, as from grid or latin_hypercube
+            profiles (bool): whether to keep the profiles
+
+        Returns:
+            dict: 'auc', 'cmax' and 'tmax', as from exposure, of shape (N,),
+            and 'profiles' of shape (N, len(time)) if requested
+        """
+        results = []
+        for parameters in self._batches(samples):
+            output = self.solution.solve_population(
+                self.delivery_mode, self.protocol, self.time, **parameters)
+            if self.concentration:
+                output /= numpy.reshape(parameters['V_c'], (-1, 1))
+            metrics = exposure(self.time, output)
+            if profiles:
+                metrics['profiles'] = output
+            results.append(metrics)
+        return {name: numpy.concatenate([result[name] for result in results])
+                for name in results[0]}
+
+    def sensitivities(self, samples) -> dict:
+        """Calculates the local sensitivities of the profiles to every model
+        parameter, the derivatives d y(t) / d theta, by integrating the
+        forward sensitivity equations
+            ds/dt = A s + (dA/dtheta) q,    s(0) = 0
+        alongside the model. A dose function is assumed not to depend on
+        the model parameters.
+
+        Args:
+            samples (dict): the samples, as from grid or latin_hypercube
+
+        Returns:
+            dict: the sensitivities, keyed 'V_c', 'CL', 'Ka', 'V_p[i]' and
+            'Q_p[i]' for every peripheral compartment i, each of shape
+            (N, len(time))
+        """
+        results = []
+        for parameters in self._batches(samples):
+            results.append(self._sensitivities(parameters))
+        return {name: numpy.concatenate([result[name] for result in results])
+                for name in results[0]}
+
+    def _sensitivities(self, parameters) -> dict:
+        """Calculates the sensitivities of one batch for Sweep.sensitivities.
+        """
+        A = rate_matrices(self.delivery_mode, **parameters)
+        dA = rate_matrix_derivatives(self.delivery_mode, **parameters)
+        num_subjects, num_parameters, num_variables = dA.shape[:3]
+        k = (num_parameters - 3) // 2
+        names = ['V_c', 'CL', 'Ka'] + ['V_p[{}]'.format(i) for i in range(k)]
+        names += ['Q_p[{}]'.format(i) for i in range(k)]
+        central = 0 if self.delivery_mode == 'iv' else 1
+        # the state of each subject is q followed by its sensitivities, so
+        # that the boluses of Solution._piecewise only jump q_0
+        shape = (num_subjects, num_parameters + 1, num_variables)
+        y0 = numpy.zeros(shape)
+        y0[:, 0, 0] = self.protocol.initial_dose
+        dose_fn = self.protocol.dose
+
+        def system(t, y, rate):
+            y = y.reshape(shape)
+            dy = numpy.einsum('nij,npj->npi', A, y)
+            dy[:, 1:] += numpy.einsum('npij,nj->npi', dA, y[:, 0])
+            dy[:, 0, 0] += dose_fn(t, y[:, 0]) + rate
+            return dy.ravel()
+
+        def jacobian():
+            blocks = numpy.zeros((num_subjects, num_parameters + 1,
+                                  num_parameters + 1, num_variables,
+                                  num_variables))
+            diagonal = numpy.arange(num_parameters + 1)
+            blocks[:, diagonal, diagonal] = A[:, None]
+            blocks[:, 1:, 0] = dA
+            blocks = blocks.transpose(0, 1, 3, 2, 4).reshape(
+                num_subjects, shape[1] * num_variables, -1)
+            return scipy.sparse.block_diag(blocks, format='csc')
+
+        def solve_segment(start, stop, t_eval, q, rate, slope):
+            points = t_eval
+            if len(t_eval) == 0 or t_eval[-1] != stop:
+                points = numpy.append(t_eval, stop)
+            numerical_solution = self.solution._integrate(
+                lambda t, y: system(t, y, rate + slope * (t - start)),
+                q.ravel(), [start, stop], points, jacobian)
+            y = numerical_solution.y.reshape(shape + (-1,))
+            return (t_eval, y[:, :, central, :len(t_eval)],
+                    y[..., -1].reshape(num_subjects, -1))
+
+        y = self.solution._piecewise(
+            self.protocol, self.time, y0.reshape(num_subjects, -1),
+            solve_segment)[1]
+        if self.concentration:
+            V_c = numpy.broadcast_to(
+                numpy.reshape(parameters['V_c'], (-1, 1)), (num_subjects, 1))
+            y = y / V_c[:, None]
+            # d(q_c / V_c) / dV_c = (dq_c / dV_c) / V_c - q_c / V_c^2
+            y[:, 1] -= y[:, 0] / V_c
+        return {name: y[:, i + 1] for i, name in enumerate(names)}
@@ -0,0 +1,121 @@
+import unittest
+import numpy as np
+import scipy.linalg
+import pkmodel as pk
+from pkmodel.analytic import LinearModes, exp_difference
+
+
+class AnalyticTest(unittest.TestCase):
+    """
+    Tests the closed-form solutions in :mod:`pkmodel.analytic`.
+    """
+    def test_exp_difference(self):
+        """
+        Tests the exponential difference including its degenerate limit.
+        """
+        t = np.linspace(0, 10, 11)
+        np.testing.assert_allclose(
+            exp_difference(-1.0, -3.0, t),
+            (np.exp(-t) - np.exp(-3 * t)) / 2.0)
+        np.testing.assert_allclose(
+            exp_difference(-2.0, -2.0, t), t * np.exp(-2 * t))
+        np.testing.assert_allclose(
+            exp_difference(-1.0, 0.0, t), 1 - np.exp(-t))
+        self.assertTrue(np.all(np.isfinite(exp_difference(-1e3, 0.0, t))))
+
+    def test_matches_matrix_exponential(self):
+        """
+        Tests the modes reproduce expm(A t) q0 for iv and sc models.
+        """
+        t = np.linspace(0, 4, 9)
+        for mode, Ka in [('iv', 1.0), ('sc', 1.0), ('sc', 0.4)]:
+            model = pk.Model(mode, V_c=2.0, CL=1.0, Ka=Ka)
+            model.add_compartment(3.0, 0.7)
+            model.add_compartment(0.5, 2.0)
+            A, b = model.linear_system()
+            q0 = np.arange(1.0, len(b) + 1)
+            expected = np.array([scipy.linalg.expm(A * ti) @ q0 for ti in t])
+            modes = LinearModes.from_model(model)
+            self.assertEqual(modes.num_variables, len(b))
+            np.testing.assert_allclose(
+                modes.evaluate(t, q0)[0].T, expected, atol=1e-12)
+
+    def test_constant_rate(self):
+        """
+        Tests a constant dose rate against the augmented matrix exponential.
+        """
+        t = np.linspace(0, 4, 9)
+        for mode in ['iv', 'sc']:
+            model = pk.Model(mode, V_c=2.0, CL=1.0, Ka=0.5)
+            model.add_compartment(3.0, 0.7)
+            A, b = model.linear_system()
+            n = len(b)
+            augmented = np.zeros((n + 1, n + 1))
+            augmented[:n, :n] = A
+            augmented[:n, n] = 2.5 * b
+            q0 = np.append(np.ones(n), 1.0)
+            expected = np.array(
+                [scipy.linalg.expm(augmented * ti) @ q0 for ti in t])[:, :n]
+            modes = LinearModes.from_model(model)
+            np.testing.assert_allclose(
+                modes.evaluate(t, np.ones(n), rate=2.5)[0].T, expected,
+                atol=1e-12)
+
+    def test_ramp_rate(self):
+        """
+        Tests a linearly changing dose rate against the augmented matrix
+        exponential.
+        """
+        t = np.linspace(0, 4, 9)
+        for mode in ['iv', 'sc']:
+            model = pk.Model(mode, V_c=2.0, CL=1.0, Ka=0.5)
+            model.add_compartment(3.0, 0.7)
+            A, b = model.linear_system()
+            n = len(b)
+            # the state is augmented with the dose rate and its slope
+            augmented = np.zeros((n + 2, n + 2))
+            augmented[:n, :n] = A
+            augmented[:n, n] = b
+            augmented[n, n + 1] = 1.0
+            q0 = np.concatenate([np.ones(n), [2.5, -0.4]])
+            expected = np.array(
+                [scipy.linalg.expm(augmented * ti) @ q0 for ti in t])[:, :n]
+            modes = LinearModes.from_model(model)
+            np.testing.assert_allclose(
+                modes.evaluate(t, np.ones(n), rate=2.5, slope=-0.4)[0].T,
+                expected, atol=1e-12)
+        # a vanishing clearance takes the series for slow modes
+        modes = LinearModes('iv', 1.0, 1e-9, 1.0)
+        np.testing.assert_allclose(
+            modes.evaluate(t, [0.0], slope=2.0)[0, 0], t ** 2, rtol=1e-8)
+
+    def test_invalid(self):
+        """
+        Tests invalid delivery modes and volumes are rejected.
+        """
+        with self.assertRaises(ValueError):
+            LinearModes('oral', 1.0, 1.0, 1.0)
+        with self.assertRaises(ValueError):
+            LinearModes('iv', -1.0, 1.0, 1.0)
+
+    def test_batch(self):
+        """
+        Tests a batch of subjects, evaluated in several blocks, matches the
+        subjects evaluated one by one.
+        """
+        t = np.linspace(0, 4, 9)
+        V_c = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+        V_p = np.array([[2.0, 1.0]])
+        Q_p = np.array([[0.5, 3.0]])
+        block_size = pk.analytic.BLOCK_SIZE
+        pk.analytic.BLOCK_SIZE = 18
+        try:
+            batch = LinearModes('sc', V_c, 1.0, 2.0, V_p, Q_p).evaluate(
+                t, [1.0, 0.5, 0.0, 0.0], rate=0.5)
+        finally:
+            pk.analytic.BLOCK_SIZE = block_size
+        self.assertEqual(batch.shape, (5, 4, 9))
+        for i in range(5):
+            single = LinearModes('sc', V_c[i], 1.0, 2.0, V_p, Q_p).evaluate(
+                t, [1.0, 0.5, 0.0, 0.0], rate=0.5)
+            np.testing.assert_allclose(batch[i], single[0])
@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class ResultCacheTest(unittest.TestCase):
+    """
+    Tests the :class:`ResultCache` class.
+    """
+    def test_create(self):
+        """
+        Tests ResultCache creation.
+        """
+        with self.assertRaises(ValueError):
+            pk.ResultCache(max_bytes=-1)
+        cache = pk.ResultCache()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.misses, 1)
+
+    def test_put_get(self):
+        """
+        Tests cached values are copies of the stored values.
+        """
+        cache = pk.ResultCache()
+        value = np.arange(3.0)
+        cache.put('a', value)
+        value[0] = 10
+        self.assertIn('a', cache)
+        out = cache.get('a')
+        np.testing.assert_array_equal(out, [0.0, 1.0, 2.0])
+        out[1] = 10
+        np.testing.assert_array_equal(cache.get('a'), [0.0, 1.0, 2.0])
+        self.assertEqual(cache.hits, 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_eviction(self):
+        """
+        Tests least recently used values are evicted beyond the budget.
+        """
+        cache = pk.ResultCache(max_bytes=3 * 80)
+        for key in 'abc':
+            cache.put(key, np.zeros(10))
+        self.assertEqual(cache.nbytes, 240)
+        cache.get('a')
+        cache.put('d', np.zeros(10))
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        cache.put('e', np.zeros(100))
+        self.assertNotIn('e', cache)
+        self.assertEqual(len(cache), 3)
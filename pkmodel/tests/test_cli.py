@@ -0,0 +1,143 @@
+import unittest
+import concurrent.futures
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+import numpy as np
+import pkmodel as pk
+from pkmodel import cli
+
+yaml_installed = importlib.util.find_spec('yaml') is not None
+
+SPEC = {
+    'solution': {'backend': 'analytic'},
+    'time_res': 20,
+    'pairs': [
+        {'model': {'delivery_mode': 'iv', 'V_c': 2.0, 'CL': 0.5,
+                   'compartments': [{'V_p': 4.0, 'Q_p': 0.8}]},
+         'protocol': {'initial_dose': 10.0, 'time_span': 12,
+                      'boluses': [{'amount': 5.0, 'time': 6.0}]}},
+        {'model': {'delivery_mode': 'sc', 'Ka': 2.0},
+         'protocol': {'time_span': 24,
+                      'infusions': [{'rate': 1.0, 'start': 2.0,
+                                     'stop': 4.0}],
+                      'rate_tables': [{'times': [4.0, 8.0],
+                                       'rates': [1.0, 0.0]}]}}],
+    'populations': [
+        {'model': {'delivery_mode': 'iv'}, 'protocol': {'time_span': 6},
+         'omega': [0.09, 0.04], 'parameters': ['CL', 'V_c'],
+         'num_subjects': 200, 'seed': 1}]}
+
+
+class CliTest(unittest.TestCase):
+    """
+    Tests the command line interface.
+    """
+    def test_build(self):
+        """
+        Tests building models and protocols from spec entries.
+        """
+        model = cli.build_model(SPEC['pairs'][0]['model'])
+        self.assertEqual(model.name, 'Model-iv-V_c=2.0-CL=0.5-Ka=1.0-'
+                         '1compartments')
+        np.testing.assert_array_equal(model.v_p, [4.0])
+        protocol = cli.build_protocol(SPEC['pairs'][1]['protocol'])
+        self.assertEqual(protocol.time_span, 24)
+        self.assertEqual(protocol.input_rate(3.0), 1.0)
+        self.assertEqual(protocol.input_rate(6.0), 0.5)
+        with self.assertRaises(ValueError):
+            cli.build_model({'delivery_mode': 'iv', 'V_x': 1.0})
+        with self.assertRaises(ValueError):
+            cli.build_protocol({'boluses': [5.0]})
+
+    def test_run(self):
+        """
+        Tests a run writes the pairs and populations, and that a run
+        resumed from its store solves only what is missing.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.npz')
+            store = os.path.join(directory, 'store')
+            partial = dict(SPEC, pairs=SPEC['pairs'][:1], populations=[])
+            cli.run(partial, output, store=store)
+            stored = {name: os.path.getmtime(os.path.join(store, name))
+                      for name in os.listdir(store)}
+            self.assertEqual(len(stored), 2)
+            summary = cli.run(SPEC, output, store=store)
+            self.assertEqual(summary['pairs'], 2)
+            self.assertEqual(summary['populations'], 1)
+            self.assertEqual(len(os.listdir(store)), 6)
+            for name, mtime in stored.items():
+                self.assertEqual(
+                    os.path.getmtime(os.path.join(store, name)), mtime)
+            columns = pk.Solution.import_results(output)
+            self.assertEqual(len(columns['time']), 40)
+            populations = pk.Solution.import_results(
+                os.path.join(directory, 'results.populations.npz'))
+            self.assertEqual(sorted(populations), ['mean', 'p5', 'p50',
+                                                   'p95', 'population',
+                                                   'time'])
+            self.assertTrue(np.all(populations['p5'] <= populations['p95']))
+            # the default store is removed once the outputs are written
+            cli.run(SPEC, os.path.join(directory, 'other.npz'))
+            self.assertNotIn('other.npz.store', os.listdir(directory))
+
+    def test_workers(self):
+        """
+        Tests a run with several workers solves the pairs of every group in
+        a single process pool, and writes the same rows as one worker.
+        """
+        spec = dict(SPEC, pairs=SPEC['pairs'] * 3, populations=[])
+        executor = concurrent.futures.ProcessPoolExecutor
+        with tempfile.TemporaryDirectory() as directory:
+            serial = os.path.join(directory, 'serial.npz')
+            cli.run(spec, serial, group_size=2)
+            output = os.path.join(directory, 'results.npz')
+            with mock.patch('concurrent.futures.ProcessPoolExecutor',
+                            wraps=executor) as pool:
+                summary = cli.run(spec, output, workers=2, group_size=2)
+            self.assertEqual(pool.call_count, 1)
+            self.assertEqual(summary['rows'][output], 120)
+            expected = pk.Solution.import_results(serial)
+            columns = pk.Solution.import_results(output)
+            for name in ['pair', 'time', 'q_c']:
+                np.testing.assert_array_equal(columns[name], expected[name])
+
+    def test_main(self):
+        """
+        Tests the command line, including its errors.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            spec = os.path.join(directory, 'spec.json')
+            with open(spec, 'w') as f:
+                json.dump(SPEC, f)
+            output = os.path.join(directory, 'results.npz')
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                status = cli.main([spec, '-o', output, '--backend', 'compiled',
+                                   '--time-res', '10', '--full-output'])
+            self.assertEqual(status, 0)
+            self.assertIn('Wrote 20 rows', stdout.getvalue())
+            self.assertIn('q_p[0]', pk.Solution.import_results(output))
+            with open(spec, 'w') as f:
+                json.dump({'pairs': [{'model': {'delivery_mode': 'xx'}}]}, f)
+            with contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit) as raised:
+                    cli.main([spec, '-o', output])
+            self.assertEqual(raised.exception.code, 1)
+
+    @unittest.skipUnless(yaml_installed, 'PyYAML is not installed')
+    def test_yaml(self):
+        """
+        Tests reading a YAML spec.
+        """
+        import yaml
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'spec.yaml')
+            with open(path, 'w') as f:
+                yaml.safe_dump(SPEC, f)
+            self.assertEqual(cli.load_spec(path), SPEC)
@@ -0,0 +1,56 @@
+import unittest
+import pickle
+import numpy as np
+import pkmodel as pk
+
+
+class DenseSolutionTest(unittest.TestCase):
+    """
+    Tests the DenseSolution class.
+    """
+    def setUp(self):
+        self.model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=1.5)
+        self.model.add_compartment(4.0, 0.8)
+        self.protocol = pk.Protocol(initial_dose=10.0, time_span=48)
+        self.protocol.add_bolus(5.0, time=12.0, interval=12.0, repeats=3)
+        self.protocol.add_infusion(1.0, 3.0, 7.0)
+        self.time = np.linspace(0, 48, 97)
+
+    def test_evaluate(self):
+        """
+        Tests evaluating at arbitrary times against Solution.solution, for
+        every backend and after pickling.
+        """
+        for backend in ['analytic', 'compiled', 'ode']:
+            solution = pk.Solution(backend=backend, rtol=1e-9, atol=1e-12)
+            dense = pickle.loads(pickle.dumps(
+                solution.dense(self.model, self.protocol)))
+            expected = solution.solution(self.model, self.protocol,
+                                         self.time, full_output=True)
+            self.assertEqual(dense.t_span, (0.0, 48.0))
+            np.testing.assert_allclose(dense(self.time), expected.y,
+                                       atol=1e-12)
+            order = np.random.default_rng(0).permutation(97)
+            np.testing.assert_allclose(dense.central(self.time[order]),
+                                       expected.central[order], atol=1e-12)
+            self.assertEqual(dense(12.0).shape, (3,))
+            self.assertEqual(dense(np.ones((2, 5))).shape, (3, 2, 5))
+            # the bolus at 12 hours is included at 12 hours
+            self.assertAlmostEqual(dense(12.0)[0] - dense(12.0 - 1e-9)[0],
+                                   5.0, places=6)
+
+    def test_time_span(self):
+        """
+        Tests solving over a given time span.
+        """
+        solution = pk.Solution(backend='analytic')
+        dense = solution.dense(self.model, self.protocol, (12.0, 30.0))
+        # pieces start at the initial dose and at the bolus at 24 hours
+        self.assertEqual(len(dense.pieces), 2)
+        np.testing.assert_allclose(dense.starts, [12.0, 24.0])
+        with self.assertRaises(ValueError):
+            dense(40.0)
+        with self.assertRaises(ValueError):
+            solution.dense(self.model, self.protocol, (10.0, 5.0))
+        with self.assertRaises(ValueError):
+            pk.DenseSolution('iv', [], 1.0, [])
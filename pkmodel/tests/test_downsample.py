@@ -0,0 +1,101 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel.downsample import lttb, adaptive_grid
+
+
+class DownsampleTest(unittest.TestCase):
+    """
+    Tests the downsampling of solutions.
+    """
+    def test_lttb(self):
+        """
+        Tests LTTB keeps the ends and a spike of a profile, and keeps every
+        point of a short series.
+        """
+        x = np.linspace(0, 10, 1001)
+        y = np.exp(-x)
+        y[300] = 5.0
+        kept = lttb(x, y, 50)
+        self.assertEqual(len(kept), 50)
+        self.assertEqual(kept[0], 0)
+        self.assertEqual(kept[-1], 1000)
+        self.assertTrue(np.all(np.diff(kept) > 0))
+        self.assertIn(300, kept)
+        np.testing.assert_array_equal(lttb(x[:10], y[:10], 20), np.arange(10))
+        with self.assertRaises(ValueError):
+            lttb(x, y, 2)
+        with self.assertRaises(ValueError):
+            lttb(x, y[:-1], 10)
+
+    def test_adaptive_grid(self):
+        """
+        Tests linear interpolation on an adaptive grid is within the
+        tolerances, and that a bolus gives its time twice.
+        """
+        model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=3.0)
+        model.add_compartment(4.0, 0.8)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=48)
+        protocol.add_bolus(5.0, time=24.0)
+        dense = pk.Solution(backend='analytic').dense(model, protocol)
+        t, y = adaptive_grid(dense, rtol=1e-3, atol=1e-9)
+        self.assertEqual(y.shape, (3, len(t)))
+        self.assertLess(len(t), 10000)
+        self.assertTrue(np.all(np.diff(t) >= 0))
+        self.assertEqual(np.count_nonzero(t == 24.0), 2)
+        # check each side of the bolus, where interpolation is continuous
+        for low, high in [(0.0, 24.0), (24.0, 48.0)]:
+            fine = np.linspace(low, high, 10001)[1:-1]
+            part = (t >= low) & (t <= high)
+            t_part, y_part = t[part], y[:, part]
+            # the state just after, and just before, the bolus
+            keep = slice(1, None) if low > 0 else slice(None, -1)
+            exact = dense(fine)
+            for i in range(3):
+                interpolated = np.interp(fine, t_part[keep], y_part[i, keep])
+                np.testing.assert_allclose(interpolated, exact[i],
+                                           rtol=2e-3, atol=1e-8)
+        t_small, y_small = adaptive_grid(dense, max_points=40)
+        self.assertLessEqual(len(t_small), 40)
+        with self.assertRaises(ValueError):
+            adaptive_grid(dense, max_points=2)
+
+    def test_max_points(self):
+        """
+        Tests a regimen of many doses gives at most max_points points,
+        spanning the whole solution.
+        """
+        model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=3.0)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=720)
+        protocol.add_bolus(10.0, time=8.0, interval=8.0, repeats=89)
+        solution = pk.Solution(backend='analytic')
+        dense = solution.dense(model, protocol)
+        for max_points in [5, 200]:
+            t, y = adaptive_grid(dense, max_points=max_points)
+            self.assertLessEqual(len(t), max_points)
+            self.assertEqual((t[0], t[-1]), (0.0, 720.0))
+            self.assertTrue(np.all(np.diff(t) >= 0))
+            self.assertEqual(y.shape, (2, len(t)))
+        trajectory = solution.adaptive(model, protocol, max_points=200)
+        self.assertLessEqual(len(trajectory.t), 200)
+
+    def test_trajectories(self):
+        """
+        Tests Solution.adaptive and Trajectory.downsample against the
+        solution on an evenly spaced grid.
+        """
+        model = pk.Model('iv', V_c=2.0, CL=0.5)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        solution = pk.Solution(backend='analytic')
+        trajectory = solution.adaptive(model, protocol, rtol=1e-4)
+        self.assertEqual(trajectory.delivery_mode, 'iv')
+        exact = solution.dense(model, protocol)(trajectory.t)
+        np.testing.assert_allclose(trajectory.y, exact, rtol=1e-10)
+        self.assertLess(len(trajectory.t), 1000)
+        full = solution.solution(model, protocol, np.linspace(0, 24, 1000),
+                                 full_output=True)
+        small = full.downsample(100)
+        self.assertEqual(small.data.shape, (2, 100))
+        self.assertEqual(small.t[0], 0.0)
+        self.assertEqual(small.t[-1], 24.0)
+        self.assertEqual(small.delivery_mode, 'iv')
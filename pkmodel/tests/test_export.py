@@ -0,0 +1,119 @@
+import unittest
+import importlib.util
+import os
+import tempfile
+import zipfile
+import numpy as np
+import pkmodel as pk
+
+pyarrow_installed = importlib.util.find_spec('pyarrow') is not None
+
+
+class ExportTest(unittest.TestCase):
+    """
+    Tests the bulk export and import of solutions.
+    """
+    def setUp(self):
+        self.solution = pk.Solution(backend='analytic')
+        model = pk.Model('iv', V_c=2.0, CL=0.5)
+        model.add_compartment(4.0, 0.8)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=12)
+        protocol.add_bolus(5.0, time=6.0)
+        self.solution.add(model, protocol)
+        self.solution.add(pk.Model('sc', V_c=3.0, CL=1.0, Ka=2.0),
+                          pk.Protocol(time_span=24))
+        self.solution.add(pk.Model('iv'), pk.Protocol(time_span=1))
+
+    def check(self, columns, full_output):
+        """
+        Checks the columns of the setUp pairs against their solutions.
+        """
+        self.assertEqual(len(columns['pair']), 3 * 20)
+        results = self.solution.solve_all(time_res=20, workers=1,
+                                          full_output=True)
+        for i, (model, protocol) in enumerate(
+                self.solution.list_compartments):
+            rows = columns['pair'] == i
+            np.testing.assert_array_equal(columns['time'][rows],
+                                          results[i].t)
+            np.testing.assert_array_equal(columns['q_c'][rows],
+                                          results[i].central)
+            self.assertTrue(np.all(columns['model'][rows] == model.name))
+            self.assertTrue(np.all(columns['protocol'][rows]
+                                   == protocol.name))
+            np.testing.assert_array_equal(columns['V_c'][rows], model.v_c)
+            np.testing.assert_array_equal(columns['time_span'][rows],
+                                          protocol.time_span)
+        rows = columns['pair'] == 0
+        np.testing.assert_array_equal(columns['V_p[0]'][rows], 4.0)
+        self.assertTrue(np.all(np.isnan(columns['Q_p[0]'][~rows])))
+        self.assertEqual(full_output, 'q_0' in columns)
+        if full_output:
+            np.testing.assert_array_equal(columns['q_p[0]'][rows],
+                                          results[0].peripheral[0])
+            rows = columns['pair'] == 1
+            np.testing.assert_array_equal(columns['q_0'][rows],
+                                          results[1].data[1])
+            self.assertTrue(np.all(np.isnan(columns['q_0'][~rows])))
+
+    def test_npz(self):
+        """
+        Tests writing and reading back .npz files, in several groups, and
+        that the parameters are stored once per pair.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.npz')
+            for full_output in [False, True]:
+                num_rows = self.solution.export(
+                    path, time_res=20, full_output=full_output,
+                    group_size=2)
+                self.assertEqual(num_rows, 60)
+                self.check(pk.Solution.import_results(path), full_output)
+            # solved in order over one pool, across the groups
+            self.solution.export(path, time_res=20, group_size=1, workers=2)
+            self.check(pk.Solution.import_results(path), False)
+            with np.load(path) as data:
+                self.assertEqual(data['model'].shape, (3,))
+                self.assertEqual(data['time'].shape, (60,))
+            with zipfile.ZipFile(path) as archive:
+                self.assertEqual(archive.testzip(), None)
+            self.assertEqual(os.listdir(directory), ['results.npz'])
+            with self.assertRaises(ValueError):
+                self.solution.export(os.path.join(directory, 'results.csv'))
+            with self.assertRaises(ValueError):
+                self.solution.export(path, group_size=0)
+
+    def test_failure(self):
+        """
+        Tests a failed export leaves no file behind.
+        """
+        protocol = pk.Protocol(time_span=1)
+        # fails once solving, rather than when checked with scalars
+        protocol.add_dose_function(
+            lambda t, y: 0.0 if np.ndim(y) == 0 else 1 / 0)
+        solution = pk.Solution(backend='ode')
+        for model, other in self.solution.list_compartments:
+            solution.add(model, other)
+        solution.add(pk.Model('iv'), protocol)
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ZeroDivisionError):
+                solution.export(os.path.join(directory, 'results.npz'),
+                                time_res=20, group_size=2)
+            self.assertEqual(os.listdir(directory), [])
+
+    @unittest.skipUnless(pyarrow_installed, 'pyarrow is not installed')
+    def test_arrow(self):
+        """
+        Tests writing and reading back Parquet and Arrow IPC files, with a
+        row group per group of pairs.
+        """
+        import pyarrow.parquet
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ['results.parquet', 'results.arrow']:
+                path = os.path.join(directory, name)
+                self.solution.export(path, time_res=20, full_output=True,
+                                     group_size=2)
+                self.check(pk.Solution.import_results(path), True)
+            metadata = pyarrow.parquet.ParquetFile(
+                os.path.join(directory, 'results.parquet')).metadata
+            self.assertEqual(metadata.num_row_groups, 2)
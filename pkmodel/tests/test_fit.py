@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel.fit import fit
+
+
+class FitTest(unittest.TestCase):
+    """
+    Tests fitting models to observed concentrations.
+    """
+    def setUp(self):
+        self.protocol = pk.Protocol(initial_dose=100.0, time_span=48)
+        self.times = np.array([0.25, 0.5, 1, 2, 3, 4, 6, 8, 12, 16, 24, 36,
+                               48])
+        self.model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=1.5)
+        self.model.add_compartment(4.0, 0.8)
+        output = pk.Solution(backend='analytic').solution(
+            self.model, self.protocol, np.concatenate([[0], self.times]))
+        self.observations = output[1:] / 2.0
+
+    def test_fit(self):
+        """
+        Tests recovering the parameters from exact observations.
+        """
+        start = pk.Model('sc', V_c=1.0, CL=1.0, Ka=1.0)
+        start.add_compartment(1.0, 1.0)
+        result = fit(start, self.protocol, self.times, self.observations)
+        self.assertTrue(result['success'])
+        expected = {'V_c': 2.0, 'CL': 0.5, 'Ka': 1.5, 'V_p[0]': 4.0,
+                    'Q_p[0]': 0.8}
+        for name, value in expected.items():
+            self.assertAlmostEqual(result['parameters'][name], value,
+                                   places=6)
+        self.assertEqual(result['model'].list_compartments()[0][0],
+                         result['parameters']['V_p[0]'])
+        self.assertEqual(result['covariance'].shape, (5, 5))
+        # warm starting from the estimates converges at once
+        again = fit(result['model'], self.protocol, self.times,
+                    self.observations)
+        self.assertLessEqual(again['nfev'], 2)
+
+    def test_subset(self):
+        """
+        Tests fitting some parameters, in their natural scale, with
+        weights, and the standard errors of noisy observations.
+        """
+        start = pk.Model('sc', V_c=2.0, CL=1.0, Ka=1.5)
+        start.add_compartment(4.0, 0.8)
+        result = fit(start, self.protocol, self.times, self.observations,
+                     parameters=['CL'], log=False,
+                     sigma=0.1 * self.observations)
+        self.assertEqual(list(result['parameters']), ['CL'])
+        self.assertAlmostEqual(result['parameters']['CL'], 0.5, places=6)
+        self.assertAlmostEqual(result['model'].ka, 1.5)
+        rng = np.random.default_rng(0)
+        noise = 1 + 0.03 * rng.standard_normal(len(self.times))
+        result = fit(start, self.protocol, self.times,
+                     self.observations * noise, parameters=['CL', 'V_p[0]'],
+                     sigma=0.03 * self.observations)
+        for name, value in [('CL', 0.5), ('V_p[0]', 4.0)]:
+            error = result['standard_errors'][name]
+            self.assertGreater(error, 0)
+            self.assertLess(abs(result['parameters'][name] - value),
+                            4 * error)
+
+    def test_validation(self):
+        """
+        Tests the checks of the fitting inputs.
+        """
+        with self.assertRaises(ValueError):
+            fit(self.model, self.protocol, self.times, self.observations[1:])
+        with self.assertRaises(ValueError):
+            fit(self.model, self.protocol, self.times[::-1],
+                self.observations)
+        with self.assertRaises(ValueError):
+            fit(self.model, self.protocol, self.times, self.observations,
+                parameters=['Q_p[1]'])
+        with self.assertRaises(TypeError):
+            fit('model', self.protocol, self.times, self.observations)
@@ -0,0 +1,140 @@
+import unittest
+import gc
+import pickle
+import weakref
+import numpy as np
+import pkmodel as pk
+
+
+def sine_dose(t, y):
+    return np.sin(t) ** 2
+
+
+def failing_dose(t, y):
+    if t > 1:
+        raise RuntimeError('dose failed')
+    return 0
+
+
+class InstrumentationTest(unittest.TestCase):
+    """
+    Tests the Instrumentation class.
+    """
+    def setUp(self):
+        self.model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=1.5)
+        self.model.add_compartment(4.0, 0.8)
+        self.protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        self.protocol.add_bolus(5.0, time=12.0)
+        self.dosed = pk.Protocol(initial_dose=10.0, time_span=24)
+        self.dosed.add_dose_function(sine_dose)
+        self.time = np.linspace(0, 24, 100)
+
+    def test_records(self):
+        """
+        Tests the counts and solver statistics of each solve.
+        """
+        records = []
+        instrumentation = pk.Instrumentation(callback=records.append)
+        for backend in ['ode', 'compiled']:
+            solution = pk.Solution(backend=backend,
+                                   instrumentation=instrumentation)
+            trajectory = solution.solution(self.model, self.dosed,
+                                           self.time, full_output=True)
+            record = instrumentation.records[-1]
+            self.assertEqual(record['backend'], backend)
+            self.assertEqual(record['protocol'], self.dosed.name)
+            self.assertEqual(record['rhs_calls'], trajectory.nfev)
+            self.assertEqual(record['dose_calls'], trajectory.nfev)
+            self.assertEqual(record['nfev'], trajectory.nfev)
+            self.assertGreater(record['steps'], 0)
+            # RK45 makes 6 evaluations per step attempt, and 2 to start
+            self.assertEqual(
+                record['nfev'],
+                2 + 6 * (record['steps'] + record['rejected_steps']))
+            self.assertGreaterEqual(record['seconds'], record['rhs_seconds'])
+            self.assertGreaterEqual(record['rhs_seconds'],
+                                    record['dose_seconds'])
+        self.assertEqual(records, instrumentation.records)
+        solution = pk.Solution(backend='analytic', method='Radau',
+                               instrumentation=instrumentation)
+        solution.solution(self.model, self.protocol, self.time)
+        self.assertEqual(instrumentation.records[-1]['rhs_calls'], 0)
+        solution.solution(self.model, self.dosed, self.time)
+        self.assertIsNone(instrumentation.records[-1]['rejected_steps'])
+        # the dose function is not counted without a dose function
+        solution = pk.Solution(backend='compiled',
+                               instrumentation=instrumentation)
+        solution.solution(self.model, self.protocol, self.time)
+        self.assertEqual(instrumentation.records[-1]['dose_calls'], 0)
+        report = instrumentation.report(slowest=2)
+        self.assertEqual(report['solves'], 5)
+        self.assertEqual(report['rhs_calls'], sum(
+            record['rhs_calls'] for record in instrumentation.records))
+        self.assertEqual(len(report['slowest']), 2)
+        self.assertGreaterEqual(report['slowest'][0]['seconds'],
+                                report['slowest'][1]['seconds'])
+        instrumentation.clear()
+        self.assertEqual(instrumentation.report()['solves'], 0)
+
+    def test_repeated_solves(self):
+        """
+        Tests the instrumentation keeps nothing of the pairs it has solved,
+        other than their records.
+        """
+        instrumentation = pk.Instrumentation()
+        solution = pk.Solution(instrumentation=instrumentation)
+        protocols = []
+        for i in range(20):
+            protocol = pk.Protocol(initial_dose=1.0 + i, time_span=24)
+            protocol.add_dose_function(sine_dose)
+            solution.solution(self.model, protocol, self.time)
+            protocols.append(weakref.ref(protocol))
+        del protocol
+        gc.collect()
+        self.assertEqual(len(instrumentation.records), 20)
+        self.assertTrue(all(protocol() is None for protocol in protocols))
+        self.assertEqual(instrumentation.records[-1]['dose_calls'],
+                         instrumentation.records[-1]['rhs_calls'])
+
+    def test_cache_and_failures(self):
+        """
+        Tests the records of cached and failed solves.
+        """
+        instrumentation = pk.Instrumentation()
+        solution = pk.Solution(cache=pk.ResultCache(),
+                               instrumentation=instrumentation)
+        solution.solution(self.model, self.protocol, self.time)
+        solution.solution(self.model, self.protocol, self.time)
+        first, second = instrumentation.records
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['nfev'], 0)
+        failing = pk.Protocol(initial_dose=10.0, time_span=24)
+        failing.add_dose_function(failing_dose)
+        with self.assertRaises(RuntimeError):
+            solution.solution(self.model, failing, self.time)
+        self.assertEqual(instrumentation.report()['failed'], 1)
+        self.assertIn('dose failed', instrumentation.records[-1]['message'])
+        with self.assertRaises(TypeError):
+            pk.Solution(instrumentation='yes')
+
+    def test_solve_all(self):
+        """
+        Tests that pairs solved in worker processes are recorded.
+        """
+        instrumentation = pk.Instrumentation()
+        solution = pk.Solution(backend='compiled',
+                               instrumentation=instrumentation)
+        for _ in range(3):
+            solution.add(self.model, self.protocol)
+        solution.add(self.model, self.dosed)
+        solution.solve_all(time_res=100, workers=2, chunk_size=1)
+        self.assertEqual(len(instrumentation.records), 4)
+        self.assertTrue(all(record['rhs_calls'] > 0
+                            for record in instrumentation.records))
+        instrumentation.clear()
+        solution.solve_all(time_res=100, workers=1)
+        self.assertEqual(len(instrumentation.records), 4)
+        copy = pickle.loads(pickle.dumps(instrumentation))
+        self.assertEqual(len(copy.records), 4)
+        self.assertIsNone(copy.callback)
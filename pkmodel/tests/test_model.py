@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 import pkmodel as pk
 
 
@@ -97,3 +98,83 @@ class ModelTest(unittest.TestCase):
         self.assertEqual(len(model), 3)
         self.assertEqual(model.list_compartments(), [[1.0, 1.1], [1.2, 1.3]])
 
+    def test_linear_system(self):
+        """
+        Tests Model compilation into a rate matrix and dose vector.
+        """
+        model = pk.Model('iv', V_c=2.0, CL=1.0)
+        model.add_compartment(V_p_new=4.0, Q_p_new=2.0)
+        A, b = model.linear_system()
+        np.testing.assert_allclose(A, [[-1.5, 0.5], [1.0, -0.5]])
+        np.testing.assert_allclose(b, [1.0, 0.0])
+        model = pk.Model('sc', V_c=2.0, CL=1.0, Ka=3.0)
+        A, b = model.linear_system()
+        np.testing.assert_allclose(A, [[-3.0, 0.0], [3.0, -0.5]])
+        np.testing.assert_allclose(b, [1.0, 0.0])
+
+    def test_remove_compartment(self):
+        """
+        Tests removing Model compartments.
+        """
+        model = pk.Model('iv')
+        model.add_compartment(1.0, 1.1)
+        model.add_compartment(1.2, 1.3)
+        with self.assertRaises(ValueError):
+            model.remove_compartment(2)
+        with self.assertRaises(ValueError):
+            model.remove_compartment(-1)
+        model.remove_compartment(0)
+        self.assertEqual(model.list_compartments(), [[1.2, 1.3]])
+        self.assertEqual(model.name,
+                         'Model-iv-V_c=1.0-CL=1.0-Ka=1.0-1compartments')
+
+    def test_cached_values(self):
+        """
+        Tests the name and rate matrix are reused until the Model changes.
+        """
+        model = pk.Model('iv', V_c=2.0, CL=1.0)
+        A, b = model.linear_system()
+        self.assertIs(model.linear_system()[0], A)
+        with self.assertRaises(ValueError):
+            A[0, 0] = 1.0
+        with self.assertRaises(AttributeError):
+            model.extra = 1
+        model.add_compartment(4.0, 2.0)
+        np.testing.assert_allclose(model.linear_system()[0],
+                                   [[-1.5, 0.5], [1.0, -0.5]])
+        np.testing.assert_array_equal(model.v_p, [4.0])
+        np.testing.assert_array_equal(model.q_p, [2.0])
+        self.assertEqual(model.name[-13:], '1compartments')
+        model.remove_compartment(0)
+        np.testing.assert_allclose(model.linear_system()[0], [[-0.5]])
+
+    def test_frozen(self):
+        """
+        Tests FrozenModel immutability, hashing and pickling.
+        """
+        import pickle
+        model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=1.5)
+        model.add_compartment(4.0, 0.8)
+        frozen = model.freeze()
+        self.assertIsInstance(frozen, pk.Model)
+        self.assertIs(frozen.freeze(), frozen)
+        self.assertEqual(frozen.name, model.name)
+        self.assertEqual(frozen, model.freeze())
+        self.assertEqual(hash(frozen), hash(model.freeze()))
+        self.assertEqual({frozen: 1}[model.freeze()], 1)
+        self.assertNotEqual(frozen, pk.FrozenModel('sc', 2.0, 0.5, 1.5))
+        with self.assertRaises(TypeError):
+            frozen.add_compartment(1.0, 1.0)
+        with self.assertRaises(TypeError):
+            frozen.remove_compartment(0)
+        with self.assertRaises(ValueError):
+            pk.FrozenModel('iv', V_p=[1.0], Q_p=[])
+        copy = pickle.loads(pickle.dumps(frozen))
+        self.assertEqual(copy, frozen)
+        self.assertEqual(type(pickle.loads(pickle.dumps(model))), pk.Model)
+        thawed = frozen.thaw()
+        thawed.add_compartment(1.0, 1.0)
+        self.assertEqual(len(thawed), 3)
+        self.assertEqual(len(frozen), 2)
+        solver = pk.Solution()
+        solver.add(frozen, pk.Protocol(initial_dose=1.0, time_span=1.0))
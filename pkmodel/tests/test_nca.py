@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import nca
+
+
+class NCATest(unittest.TestCase):
+    """
+    Tests the non-compartmental analysis.
+    """
+    def setUp(self):
+        self.time = np.linspace(0, 24, 97)
+        self.k = np.array([0.1, 0.25, 0.5])
+        self.profiles = 10.0 * np.exp(-self.k[:, None] * self.time)
+
+    def test_nca(self):
+        """
+        Tests the metrics of mono-exponential profiles, which the log
+        trapezoidal rule integrates exactly.
+        """
+        result = nca.nca(self.time, self.profiles, dose=20.0)
+        np.testing.assert_allclose(result['lambda_z'], self.k)
+        np.testing.assert_allclose(result['r2'], 1.0)
+        np.testing.assert_allclose(result['half_life'], np.log(2) / self.k)
+        np.testing.assert_allclose(result['auc_inf'], 10.0 / self.k)
+        np.testing.assert_allclose(result['aumc_inf'], 10.0 / self.k ** 2)
+        np.testing.assert_allclose(result['mrt'], 1 / self.k)
+        np.testing.assert_allclose(result['cl'], 2.0 * self.k)
+        np.testing.assert_allclose(result['vz'], 2.0)
+        np.testing.assert_array_equal(result['cmax'], 10.0)
+        np.testing.assert_array_equal(result['tmax'], 0.0)
+        # the linear trapezoidal rule overestimates a convex profile
+        linear = nca.nca(self.time, self.profiles, method='linear')
+        self.assertTrue(np.all(linear['auc_last'] > result['auc_last']))
+        self.assertNotIn('cl', linear)
+        with self.assertRaises(ValueError):
+            nca.nca(self.time, self.profiles, method='cubic')
+
+    def test_terminal_slope(self):
+        """
+        Tests the terminal slope of profiles without a declining phase.
+        """
+        lambda_z, r2 = nca.terminal_slope(
+            [0.0, 1.0, 2.0], [[0.0, 0.0, 1.0], [1.0, 2.0, 3.0],
+                              [4.0, 2.0, 1.0]])
+        self.assertTrue(np.isnan(lambda_z[0]))
+        self.assertTrue(np.isnan(lambda_z[1]))
+        self.assertAlmostEqual(lambda_z[2], np.log(2))
+
+    def test_streaming(self):
+        """
+        Tests that metrics over windows of time and chunks of subjects
+        match those over the whole profiles.
+        """
+        time = np.linspace(0, 48, 193)
+        profiles = pk.Solution(backend='analytic').solve_population(
+            'sc', pk.Protocol(initial_dose=10.0, time_span=48), time,
+            V_c=1.0, CL=[0.2, 0.5, 1.0, 2.0], Ka=1.0)
+        expected = nca.nca(time, profiles, dose=10.0)
+        accumulator = nca.Accumulator(4, dose=10.0)
+        for start in range(0, 193, 50):
+            accumulator.update(time[start:start + 50],
+                               profiles[:, start:start + 50])
+        result = accumulator.result()
+        chunks = nca.nca_chunks(
+            ((time, profiles[i:i + 3]) for i in range(0, 4, 3)), dose=10.0)
+        for name in expected:
+            np.testing.assert_allclose(result[name], expected[name])
+            np.testing.assert_allclose(chunks[name], expected[name])
+        self.assertAlmostEqual(result['tmax'][0], time[np.argmax(profiles[0])])
+        with self.assertRaises(ValueError):
+            accumulator.update(time[:10], profiles[:, :10])
+        with self.assertRaises(ValueError):
+            nca.Accumulator(4).result()
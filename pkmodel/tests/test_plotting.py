@@ -0,0 +1,103 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+import matplotlib
+import numpy as np
+import pkmodel as pk
+from pkmodel import plotting
+
+matplotlib.use('Agg')
+import matplotlib.pyplot  # noqa
+
+
+class PlottingTest(unittest.TestCase):
+    """
+    Tests the plotting module.
+    """
+    def test_lazy_import(self):
+        """
+        Tests that importing pkmodel does not import matplotlib, in a new
+        interpreter.
+        """
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; import pkmodel; '
+            'print(any(name.startswith("matplotlib") '
+            'for name in sys.modules))'])
+        self.assertEqual(output.decode().strip(), 'False')
+
+    def test_visualise(self):
+        """
+        Tests plotting without a display.
+        """
+        solution = pk.Solution(backend='analytic')
+        solution.add(pk.Model('iv'), pk.Protocol(time_span=2))
+        solution.add(pk.Model('sc'), pk.Protocol(time_span=2))
+        instrumentation = pk.Instrumentation()
+        solution.instrumentation = instrumentation
+        for layout in ['overlay', 'side_by_side']:
+            solution.visualise(layout=layout, time_res=10)
+            self.assertEqual(
+                len(matplotlib.pyplot.gcf().axes),
+                1 if layout == 'overlay' else 2)
+            matplotlib.pyplot.close('all')
+        self.assertIn('visualise', instrumentation.timings)
+        with self.assertRaises(ValueError):
+            solution.visualise(layout='mosaic')
+        with self.assertRaises(ValueError):
+            solution.visualise(style='points')
+
+    def test_many_pairs(self):
+        """
+        Tests overlaying, gridding, summarising and downsampling many
+        pairs, reusing given results and writing to a file without pyplot.
+        """
+        solution = pk.Solution(backend='analytic')
+        protocol = pk.Protocol(time_span=2)
+        for V_c in np.linspace(1.0, 2.0, 50):
+            solution.add(pk.Model('iv', V_c=float(V_c)), protocol)
+        results = solution.solve_all(time_res=20, workers=1)
+        instrumentation = pk.Instrumentation()
+        solution.instrumentation = instrumentation
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'overlay.png')
+            figure = solution.visualise(time_res=20, results=results,
+                                        filename=filename)
+            self.assertGreater(os.path.getsize(filename), 0)
+        # one collection of all the lines, and no pairs solved again
+        self.assertEqual(len(figure.axes), 1)
+        self.assertEqual(len(figure.axes[0].collections), 1)
+        self.assertEqual(len(figure.axes[0].collections[0].get_paths()), 50)
+        self.assertEqual(instrumentation.records, [])
+        self.assertEqual(len(matplotlib.pyplot.get_fignums()), 0)
+        grid = pk.Solution(backend='analytic')
+        for i in range(5):
+            grid.add(pk.Model('iv'), pk.Protocol(time_span=i + 1))
+        with tempfile.TemporaryDirectory() as directory:
+            figure = grid.visualise(
+                layout='grid', shape=(2, 3), time_res=20,
+                filename=os.path.join(directory, 'grid.png'))
+        self.assertEqual(len(figure.axes), 6)
+        self.assertFalse(figure.axes[5].get_visible())
+        self.assertEqual(figure.axes[4].dataLim.x1, 5.0)
+        with self.assertRaises(ValueError):
+            grid.visualise(layout='grid', shape=(2, 2), time_res=20)
+        with tempfile.TemporaryDirectory() as directory:
+            figure = solution.visualise(
+                style='bands', time_res=20, results=results,
+                filename=os.path.join(directory, 'bands.png'))
+        ax = figure.axes[0]
+        self.assertEqual(len(ax.collections), 1)
+        np.testing.assert_allclose(ax.lines[0].get_ydata(),
+                                   np.percentile(results, 50, axis=0))
+        with self.assertRaises(ValueError):
+            plotting.plot_bands(ax, np.arange(3), np.zeros((2, 3)))
+        with tempfile.TemporaryDirectory() as directory:
+            figure = solution.visualise(
+                time_res=20, results=results, max_points=8,
+                filename=os.path.join(directory, 'downsampled.png'))
+        paths = figure.axes[0].collections[0].get_paths()
+        self.assertEqual(len(paths), 50)
+        self.assertEqual(len(paths[0].vertices), 8)
@@ -0,0 +1,100 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel.population import QuantileSketch
+
+
+def lower_quantiles(values, q):
+    """
+    Returns the quantiles of values along the first axis, taking the value
+    below each quantile rather than interpolating, as numpy's 'lower'
+    method, which needs numpy 1.22 to be selected.
+    """
+    values = np.sort(values, axis=0)
+    return values[np.floor(np.asarray(q) * (len(values) - 1)).astype(int)]
+
+
+class PopulationTest(unittest.TestCase):
+    """
+    Tests the Monte Carlo population simulation.
+    """
+    def test_sketch(self):
+        """
+        Tests the quantile sketch against the exact quantiles, including
+        merging and zero values.
+        """
+        rng = np.random.default_rng(0)
+        values = np.exp(rng.normal(0, 2, size=(3000, 4)))
+        values[:200, 0] = 0.0
+        sketch = QuantileSketch(4, relative_accuracy=0.01)
+        other = QuantileSketch(4, relative_accuracy=0.01)
+        sketch.update(values[:1000])
+        other.update(values[1000:])
+        sketch.merge(other)
+        self.assertEqual(sketch.count, 3000)
+        q = [0.0, 0.05, 0.5, 0.95, 1.0]
+        expected = lower_quantiles(values, q)
+        np.testing.assert_allclose(sketch.quantiles(q), expected, rtol=0.01)
+        self.assertEqual(sketch.quantiles([0.0])[0, 0], 0.0)
+        np.testing.assert_allclose(sketch.mean(), values.mean(axis=0))
+        with self.assertRaises(ValueError):
+            sketch.merge(QuantileSketch(4))
+        with self.assertRaises(ValueError):
+            sketch.update(values[:, :3])
+        with self.assertRaises(ValueError):
+            QuantileSketch(4).quantiles([0.5])
+
+    def test_sample(self):
+        """
+        Tests the subjects are log-normal about the typical values, with
+        the given covariance, and do not depend on the batch size.
+        """
+        model = pk.Model('iv', V_c=2.0, CL=0.5)
+        model.add_compartment(4.0, 0.8)
+        omega = [[0.09, 0.03], [0.03, 0.04]]
+        population = pk.Population(model, omega, parameters=['CL', 'V_c'],
+                                   batch_size=1000)
+        samples = population.sample(20000, seed=1)
+        self.assertEqual(samples['V_p'].shape, (20000, 1))
+        np.testing.assert_array_equal(samples['Ka'], 1.0)
+        np.testing.assert_array_equal(samples['Q_p'], 0.8)
+        eta = np.log([samples['CL'] / 0.5, samples['V_c'] / 2.0])
+        np.testing.assert_allclose(np.cov(eta), omega, atol=0.005)
+        np.testing.assert_allclose(eta.mean(axis=1), 0.0, atol=0.005)
+        other = pk.Population(model, omega, parameters=['CL', 'V_c'],
+                              batch_size=333).sample(20000, seed=1)
+        np.testing.assert_array_equal(other['CL'], samples['CL'])
+        with self.assertRaises(ValueError):
+            pk.Population(model, [0.1], parameters=['V_x'])
+        with self.assertRaises(ValueError):
+            pk.Population(model, [[0.1, 0.2], [0.0, 0.1]],
+                          parameters=['CL', 'V_c'])
+        with self.assertRaises(ValueError):
+            pk.Population(model, [[0.1, 0.2], [0.2, 0.1]],
+                          parameters=['CL', 'V_c'])
+        with self.assertRaises(ValueError):
+            pk.Population(model, [0.1, 0.1])
+
+    def test_run(self):
+        """
+        Tests the percentile bands of a run match the exact percentiles of
+        all the profiles, serially and in parallel.
+        """
+        model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=1.5)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        protocol.add_bolus(5.0, time=12.0)
+        time = np.linspace(0, 24, 25)
+        population = pk.Population(model, [0.09, 0.04, 0.1],
+                                   parameters=['CL', 'V_c', 'Ka'],
+                                   batch_size=300, concentration=True)
+        result = population.run(protocol, time, 2000, seed=2)
+        samples = population.sample(2000, seed=2)
+        profiles = pk.Solution(backend='analytic').solve_population(
+            'sc', protocol, time, **samples) / samples['V_c'][:, None]
+        self.assertEqual(result['num_subjects'], 2000)
+        np.testing.assert_allclose(
+            result['bands'],
+            lower_quantiles(profiles, [0.05, 0.5, 0.95]), rtol=0.005)
+        np.testing.assert_allclose(result['mean'], profiles.mean(axis=0))
+        parallel = population.run(protocol, time, 2000, seed=2, workers=2)
+        np.testing.assert_array_equal(parallel['bands'], result['bands'])
@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 import pkmodel as pk
 
 
@@ -73,10 +74,92 @@ class ProtocolTest(unittest.TestCase):
         protocol = pk.Protocol()
         dose = protocol.dose
         self.assertEqual(str(type(dose)), "<class 'function'>")
+        self.assertFalse(protocol.has_dose_function)
         dose_func_in = lambda y, t: 0
         protocol.add_dose_function(func=dose_func_in)
         dose_func_out = protocol.dose
         self.assertEqual(dose_func_in, dose_func_out)
+        self.assertTrue(protocol.has_dose_function)
         with self.assertRaises(TypeError):
             dose_func = lambda z: 0
             protocol.add_dose_function(func=dose_func)
+
+    def test_regimen(self):
+        """
+        Tests the bolus and infusion regimen.
+        """
+        protocol = pk.Protocol()
+        self.assertFalse(protocol.has_regimen)
+        self.assertEqual(len(protocol.event_times()), 0)
+        with self.assertRaises(TypeError):
+            protocol.add_bolus('a')
+        with self.assertRaises(ValueError):
+            protocol.add_bolus(1.0, time=-1)
+        with self.assertRaises(ValueError):
+            protocol.add_bolus(1.0, repeats=2)
+        with self.assertRaises(ValueError):
+            protocol.add_bolus(1.0, interval=1.0, repeats=0)
+        with self.assertRaises(TypeError):
+            protocol.add_infusion(1.0, 'a', 2.0)
+        with self.assertRaises(ValueError):
+            protocol.add_infusion(1.0, 2.0, 1.0)
+        protocol.add_bolus(2.0, time=1.0, interval=8.0, repeats=3)
+        protocol.add_bolus(5.0, time=4.0)
+        protocol.add_infusion(1.5, 0.0, 2.0, interval=12.0, repeats=2)
+        self.assertTrue(protocol.has_regimen)
+        self.assertEqual(
+            protocol.name, 'Protocol-initial_dose=1.0-time_span=1.0'
+            '-bolus=2.0@1.0every8.0x3-bolus=5.0@4.0everyNonex1'
+            '-infusion=1.5@0.0to2.0every12.0x2')
+        times, amounts = protocol.boluses()
+        np.testing.assert_array_equal(times, [1.0, 4.0, 9.0, 17.0])
+        np.testing.assert_array_equal(amounts, [2.0, 5.0, 2.0, 2.0])
+        starts, stops, rates = protocol.infusions()
+        np.testing.assert_array_equal(starts, [0.0, 12.0])
+        np.testing.assert_array_equal(stops, [2.0, 14.0])
+        np.testing.assert_array_equal(rates, [1.5, 1.5])
+        np.testing.assert_array_equal(
+            protocol.infusion_rate([0.0, 1.0, 2.0, 12.0, 14.0]),
+            [1.5, 1.5, 0.0, 1.5, 0.0])
+        np.testing.assert_array_equal(
+            protocol.event_times(),
+            [0.0, 1.0, 2.0, 4.0, 9.0, 12.0, 14.0, 17.0])
+
+    def test_rate_inputs(self):
+        """
+        Tests piecewise-constant schedules and interpolated rate tables.
+        """
+        protocol = pk.Protocol()
+        with self.assertRaises(ValueError):
+            protocol.add_schedule([0.0, 1.0], [1.0, 2.0])
+        with self.assertRaises(ValueError):
+            protocol.add_schedule([1.0, 0.0], [1.0])
+        with self.assertRaises(ValueError):
+            protocol.add_rate_table([-1.0, 1.0], [1.0, 2.0])
+        with self.assertRaises(ValueError):
+            protocol.add_rate_table([0.0, 1.0], [1.0, np.nan])
+        self.assertFalse(protocol.has_regimen)
+        protocol.add_schedule([1.0, 2.0, 4.0], [3.0, 0.5])
+        self.assertFalse(protocol.has_rate_table)
+        protocol.add_rate_table([0.0, 2.0, 3.0], [0.0, 4.0, 1.0])
+        self.assertTrue(protocol.has_regimen)
+        self.assertTrue(protocol.has_rate_table)
+        self.assertIn('-schedule=', protocol.name)
+        self.assertIn('-table=', protocol.name)
+        starts, stops, rates = protocol.infusions()
+        np.testing.assert_array_equal(starts, [1.0, 2.0])
+        np.testing.assert_array_equal(stops, [2.0, 4.0])
+        np.testing.assert_array_equal(rates, [3.0, 0.5])
+        rate, slope = protocol.table_rate([0.0, 1.0, 2.5, 3.0], slope=True)
+        np.testing.assert_allclose(rate, [0.0, 2.0, 2.5, 0.0])
+        np.testing.assert_allclose(slope, [2.0, 2.0, -3.0, 0.0])
+        # evaluated for a (subjects, time points) array at once
+        np.testing.assert_allclose(
+            protocol.input_rate([[1.0, 2.5], [3.0, 4.0]]),
+            [[5.0, 3.0], [0.5, 0.0]])
+        np.testing.assert_array_equal(protocol.event_times(),
+                                      [0.0, 1.0, 2.0, 3.0, 4.0])
+        other = pk.Protocol()
+        other.add_schedule([1.0, 2.0, 4.0], [3.0, 0.25])
+        other.add_rate_table([0.0, 2.0, 3.0], [0.0, 4.0, 1.0])
+        self.assertNotEqual(other.name, protocol.name)
@@ -1,7 +1,18 @@
 import unittest
+import numpy as np
+import scipy.integrate
 import pkmodel as pk
 
 
+def failing_dose(t, y):
+    """
+    A dose function which fails after the first hour.
+    """
+    if t > 1:
+        raise RuntimeError('dose failed')
+    return 0
+
+
 class SolutionTest(unittest.TestCase):
     """
     Tests the :class:`Solution` class.
@@ -119,7 +130,7 @@ class SolutionTest(unittest.TestCase):
         # Test extra compartment output
         model.add_compartment(V_p_new=2.0, Q_p_new=2.1)
         output = solution.ode_system([3, 4, 5], 1, model, protocol)
-        self.assertEqual(output, [-15, 14.1, -2.1])
+        self.assertEqual(output, [-15, 13.05, -1.05])
 
     def test_solution_method(self):
         """
@@ -139,3 +150,428 @@ class SolutionTest(unittest.TestCase):
             solution2.solution('a')
         # Test length of zeros
         # Test length numerical solution
+
+    def test_compiled_system(self):
+        """
+        Tests the compiled right-hand side matches Solution.ode_system.
+        """
+        solution = pk.Solution()
+        for mode in ['iv', 'sc']:
+            model = pk.Model(mode, V_c=2, CL=1.5, Ka=5)
+            model.add_compartment(V_p_new=2.0, Q_p_new=2.1)
+            model.add_compartment(V_p_new=0.5, Q_p_new=0.3)
+            protocol = pk.Protocol()
+            protocol.add_dose_function(lambda t, y: 2 * t)
+            system = solution.compiled_system(model, protocol)
+            q = np.array([3.0, 4.0, 5.0, 6.0])[:len(model) + (mode == 'sc')]
+            np.testing.assert_allclose(
+                system(1.5, q), solution.ode_system(q, 1.5, model, protocol))
+
+    def test_compiled_backend(self):
+        """
+        Tests the compiled backend gives the same solution as the default.
+        """
+        with self.assertRaises(ValueError):
+            pk.Solution(backend='fast')
+        time = np.linspace(0, 2, 50)
+        for mode in ['iv', 'sc']:
+            model = pk.Model(mode, V_c=2, CL=1.5, Ka=5)
+            model.add_compartment(V_p_new=2.0, Q_p_new=2.1)
+            protocol = pk.Protocol(initial_dose=3)
+            expected = pk.Solution().solution(model, protocol, time)
+            compiled = pk.Solution(backend='compiled')
+            np.testing.assert_allclose(
+                compiled.solution(model, protocol, time), expected,
+                rtol=1e-12, atol=1e-14)
+
+    def test_analytic_backend(self):
+        """
+        Tests the analytic backend against the numerical solution, and its
+        fallback to numerical integration for protocols with a dose function.
+        """
+        time = np.linspace(0, 2, 50)
+        analytic = pk.Solution(backend='analytic')
+        for mode in ['iv', 'sc']:
+            model = pk.Model(mode, V_c=2, CL=1.5, Ka=5)
+            model.add_compartment(V_p_new=2.0, Q_p_new=2.1)
+            protocol = pk.Protocol(initial_dose=3)
+            expected = scipy.integrate.solve_ivp(
+                analytic.compiled_system(model, protocol), [0, 2],
+                [3.0] + [0.0] * (len(model) + (mode == 'sc') - 1),
+                t_eval=time, rtol=1e-10, atol=1e-12).y[int(mode == 'sc')]
+            np.testing.assert_allclose(
+                analytic.solution(model, protocol, time), expected,
+                rtol=1e-7, atol=1e-9)
+            protocol.add_dose_function(lambda t, y: 1.0)
+            np.testing.assert_allclose(
+                analytic.solution(model, protocol, time),
+                pk.Solution().solution(model, protocol, time),
+                rtol=1e-12, atol=1e-14)
+
+    def test_solve_population(self):
+        """
+        Tests the batched population solve against solving each subject.
+        """
+        time = np.linspace(0, 2, 20)
+        V_c = np.array([1.0, 2.0, 3.0])
+        CL = np.array([1.5, 1.0, 0.5])
+        V_p = np.array([[2.0], [1.0], [0.5]])
+        Q_p = np.array([[2.1], [0.3], [1.0]])
+        protocol = pk.Protocol(initial_dose=3)
+        with self.assertRaises(ValueError):
+            pk.Solution().solve_population('oral', protocol, time)
+        with self.assertRaises(TypeError):
+            pk.Solution().solve_population('iv', 'protocol', time)
+        for backend in ['compiled', 'analytic']:
+            solution = pk.Solution(backend=backend)
+            for mode in ['iv', 'sc']:
+                expected = []
+                for i in range(3):
+                    model = pk.Model(mode, V_c=float(V_c[i]), CL=float(CL[i]),
+                                     Ka=2.0)
+                    model.add_compartment(float(V_p[i, 0]), float(Q_p[i, 0]))
+                    expected.append(
+                        pk.Solution(backend='analytic').solution(
+                            model, protocol, time))
+                output = solution.solve_population(
+                    mode, protocol, time, V_c=V_c, CL=CL, Ka=2.0,
+                    V_p=V_p, Q_p=Q_p)
+                self.assertEqual(output.shape, (3, 20))
+                np.testing.assert_allclose(output, expected,
+                                           rtol=1e-2, atol=1e-3)
+        # doses closer together than the time points, so that a segment
+        # between them has no time points
+        protocol.add_bolus(1.0, time=0.8)
+        protocol.add_bolus(1.0, time=0.9)
+        coarse = np.linspace(0, 2, 3)
+        output = pk.Solution(backend='analytic').solve_population(
+            'sc', protocol, coarse, V_c=V_c, CL=CL)
+        np.testing.assert_allclose(
+            output, pk.Solution(backend='compiled').solve_population(
+                'sc', protocol, coarse, V_c=V_c, CL=CL),
+            rtol=1e-2, atol=1e-3)
+        sweep = pk.Sweep('iv', protocol, coarse,
+                         solution=pk.Solution(backend='analytic'))
+        self.assertEqual(sweep.run({'V_c': V_c})['profiles'].shape, (3, 3))
+
+    def test_solve_all(self):
+        """
+        Tests solving all pairs in parallel, in order and with failures
+        reported per pair.
+        """
+        solution = pk.Solution(backend='compiled')
+        for i in range(5):
+            model = pk.Model(['iv', 'sc'][i % 2], V_c=1.0 + i)
+            for j in range(i % 3):
+                model.add_compartment(1.0, 0.5 * j)
+            solution.add(model, pk.Protocol(initial_dose=i, time_span=2))
+        failing = pk.Protocol(time_span=2)
+        failing.add_dose_function(failing_dose)
+        solution.add(pk.Model('iv'), failing)
+        local = pk.Protocol(time_span=2)
+        local.add_dose_function(lambda t, y: 1.0)
+        solution.add(pk.Model('sc'), local)
+        with self.assertRaises(ValueError):
+            solution.solve_all(workers=0)
+        serial = solution.solve_all(time_res=20, workers=1)
+        parallel = solution.solve_all(time_res=20, workers=2, chunk_size=2)
+        self.assertEqual(len(parallel), 7)
+        for i, (model, protocol) in enumerate(solution.list_compartments):
+            if i == 5:
+                self.assertIsInstance(serial[i], RuntimeError)
+                self.assertIsInstance(parallel[i], RuntimeError)
+                continue
+            expected = solution.solution(
+                model, protocol, np.linspace(0, 2, 20))
+            np.testing.assert_allclose(serial[i], expected)
+            np.testing.assert_allclose(parallel[i], expected)
+
+    def test_cache(self):
+        """
+        Tests solutions are cached by their model, protocol, time grid and
+        solver settings.
+        """
+        with self.assertRaises(TypeError):
+            pk.Solution(cache={})
+        cache = pk.ResultCache()
+        solution = pk.Solution(cache=cache)
+        model = pk.Model('sc')
+        protocol = pk.Protocol()
+        time = np.linspace(0, 1, 10)
+        first = solution.solution(model, protocol, time)
+        np.testing.assert_array_equal(
+            solution.solution(model, protocol, time), first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        solution.solution(model, protocol, np.linspace(0, 1, 11))
+        pk.Solution(backend='compiled', cache=cache).solution(
+            model, protocol, time)
+        model.add_compartment(1.0, 1.0)
+        solution.solution(model, protocol, time)
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+        dose = lambda t, y: 1.0
+        protocol.add_dose_function(dose)
+        solution.solution(model, protocol, time)
+        solution.solution(model, protocol, time)
+        self.assertEqual((cache.hits, cache.misses), (2, 5))
+        cache.cache_dose_functions = False
+        solution.solution(model, protocol, time)
+        self.assertEqual((cache.hits, cache.misses), (2, 5))
+        self.assertIsNone(solution.cache_key(model, protocol, time))
+        solution.add(pk.Model('iv'), pk.Protocol())
+        solution.add(model, pk.Protocol())
+        results = solution.solve_all(time_res=10, workers=2)
+        self.assertEqual(len(cache), 6)
+        self.assertEqual(cache.hits, 3)
+        np.testing.assert_array_equal(
+            solution.solve_all(time_res=10, workers=2)[0], results[0])
+        self.assertEqual(cache.hits, 5)
+
+    def test_full_output(self):
+        """
+        Tests full trajectories hold every compartment and solver statistics.
+        """
+        time = np.linspace(0, 2, 20)
+        for backend in ['ode', 'analytic']:
+            solution = pk.Solution(backend=backend, cache=pk.ResultCache())
+            model = pk.Model('sc', V_c=2, CL=1.5, Ka=5)
+            model.add_compartment(V_p_new=2.0, Q_p_new=2.1)
+            protocol = pk.Protocol(initial_dose=3, time_span=2)
+            trajectory = solution.solution(
+                model, protocol, time, full_output=True)
+            self.assertIsInstance(trajectory, pk.Trajectory)
+            self.assertEqual(trajectory.data.shape, (4, 20))
+            self.assertTrue(trajectory.data.flags.c_contiguous)
+            np.testing.assert_array_equal(trajectory.t, time)
+            np.testing.assert_array_equal(
+                trajectory.central, solution.solution(model, protocol, time))
+            np.testing.assert_allclose(
+                trajectory.y.sum(axis=0)[-1],
+                3 - np.sum(np.diff(time) * 0.75 * (
+                    trajectory.central[1:] + trajectory.central[:-1]) / 2),
+                rtol=1e-2)
+            self.assertEqual(trajectory.status, 0)
+            if backend == 'ode':
+                self.assertGreater(trajectory.nfev, 0)
+        points = pk.Solution().solution(
+            model, protocol, time, full_output=True, solver_points=True)
+        self.assertEqual(points.t[0], 0)
+        self.assertEqual(points.t[-1], 2)
+        self.assertNotEqual(len(points.t), 20)
+        results = solution.solve_all(time_res=20, full_output=True)
+        self.assertEqual(results, [])
+        solution.add(model, protocol)
+        results = solution.solve_all(time_res=20, workers=2,
+                                     full_output=True)
+        np.testing.assert_array_equal(results[0].data, trajectory.data)
+
+    def test_solver_settings(self):
+        """
+        Tests the choice of integration method and tolerances, and that
+        implicit methods are given the exact Jacobian.
+        """
+        with self.assertRaises(ValueError):
+            pk.Solution(method='Euler')
+        with self.assertRaises(ValueError):
+            pk.Solution(rtol=0)
+        with self.assertRaises(ValueError):
+            pk.Solution(atol='a')
+        time = np.linspace(0, 1, 20)
+        # a stiff model, with very fast exchange with the peripheral
+        model = pk.Model('sc', V_c=2, CL=1.5, Ka=5)
+        model.add_compartment(V_p_new=0.01, Q_p_new=100.0)
+        protocol = pk.Protocol(initial_dose=3)
+        expected = pk.Solution(backend='analytic').solution(
+            model, protocol, time)
+        explicit = pk.Solution(method='RK45').solution(
+            model, protocol, time, full_output=True)
+        for method in ['Radau', 'BDF', 'LSODA']:
+            for backend in ['ode', 'compiled']:
+                solution = pk.Solution(backend=backend, method=method,
+                                       rtol=1e-8, atol=1e-10)
+                trajectory = solution.solution(
+                    model, protocol, time, full_output=True)
+                np.testing.assert_allclose(trajectory.central, expected,
+                                           rtol=1e-5, atol=1e-8)
+                self.assertLess(trajectory.nfev, explicit.nfev)
+                if method != 'LSODA':
+                    self.assertEqual(trajectory.njev, 0)
+            population = pk.Solution(method=method, rtol=1e-8, atol=1e-10)
+            np.testing.assert_allclose(
+                population.solve_population(
+                    'sc', protocol, time, V_c=[2.0, 2.0], CL=1.5, Ka=5.0,
+                    V_p=[0.01], Q_p=[100.0]),
+                [expected, expected], rtol=1e-5, atol=1e-8)
+
+    def test_regimen(self):
+        """
+        Tests solving a regimen of repeated boluses and infusions, piecewise
+        between the doses.
+        """
+        time = np.linspace(0, 48, 97)
+        protocol = pk.Protocol(initial_dose=0, time_span=48)
+        protocol.add_bolus(10.0, interval=8.0, repeats=6)
+        model = pk.Model('iv', V_c=2.0, CL=0.5)
+        # superposition of the single dose responses
+        expected = np.zeros_like(time)
+        for dose_time in np.arange(0, 48, 8.0):
+            expected += np.where(
+                time >= dose_time,
+                10.0 * np.exp(-0.25 * (time - dose_time)), 0.0)
+        analytic = pk.Solution(backend='analytic')
+        output = analytic.solution(model, protocol, time)
+        np.testing.assert_allclose(output, expected, rtol=1e-12)
+        self.assertAlmostEqual(output[16], 10.0 + 10.0 * np.exp(-2.0))
+        numerical = pk.Solution(backend='compiled', rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(
+            numerical.solution(model, protocol, time), expected, rtol=1e-6)
+        # the depot of a constant infusion approaches rate / Ka
+        protocol = pk.Protocol(initial_dose=0, time_span=48)
+        protocol.add_infusion(2.0, 0.0, 24.0)
+        model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=2.0)
+        model.add_compartment(1.0, 0.5)
+        trajectory = analytic.solution(model, protocol, time,
+                                       full_output=True)
+        self.assertAlmostEqual(trajectory.y[0, 48], 1.0)
+        self.assertAlmostEqual(trajectory.y[0, 96], np.exp(-48.0))
+        for backend in ['ode', 'compiled']:
+            np.testing.assert_allclose(
+                pk.Solution(backend=backend, rtol=1e-8, atol=1e-10).solution(
+                    model, protocol, time, full_output=True).y,
+                trajectory.y, rtol=1e-5, atol=1e-8)
+        population = analytic.solve_population(
+            'sc', protocol, time, V_c=[2.0, 4.0], CL=0.5, Ka=2.0,
+            V_p=[1.0], Q_p=[0.5])
+        np.testing.assert_allclose(population[0], trajectory.central)
+        np.testing.assert_allclose(
+            pk.Solution(rtol=1e-8, atol=1e-10).solve_population(
+                'sc', protocol, time, V_c=[2.0, 4.0], CL=0.5, Ka=2.0,
+                V_p=[1.0], Q_p=[0.5]), population, rtol=1e-5, atol=1e-8)
+
+    def test_rate_inputs(self):
+        """
+        Tests schedules and rate tables are solved by every backend without
+        a dose function, matching a dose function with the same rate.
+        """
+        time = np.linspace(0, 10, 41)
+        protocol = pk.Protocol(initial_dose=1.0, time_span=10)
+        protocol.add_schedule([0.5, 2.0, 3.0], [1.0, 0.25])
+        protocol.add_rate_table([1.0, 4.0, 6.0], [0.0, 2.0, 0.5])
+        protocol.add_bolus(0.5, time=5.0)
+        model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=1.5)
+        model.add_compartment(4.0, 0.8)
+        analytic = pk.Solution(backend='analytic')
+        output = analytic.solution(model, protocol, time)
+        for backend in ['ode', 'compiled']:
+            np.testing.assert_allclose(
+                pk.Solution(backend=backend, rtol=1e-10, atol=1e-12)
+                .solution(model, protocol, time), output, atol=1e-9)
+        reference = pk.Protocol(initial_dose=1.0, time_span=10)
+        reference.add_bolus(0.5, time=5.0)
+        reference.add_dose_function(
+            lambda t, y: float(protocol.input_rate(t)))
+        np.testing.assert_allclose(
+            pk.Solution(backend='compiled', rtol=1e-10, atol=1e-12)
+            .solution(model, reference, time), output, atol=1e-7)
+        population = analytic.solve_population(
+            'sc', protocol, time, V_c=[2.0, 3.0], CL=0.5, Ka=1.5,
+            V_p=[4.0], Q_p=[0.8])
+        np.testing.assert_allclose(population[0], output)
+        np.testing.assert_allclose(
+            pk.Solution(rtol=1e-10, atol=1e-12).solve_population(
+                'sc', protocol, time, V_c=[2.0, 3.0], CL=0.5, Ka=1.5,
+                V_p=[4.0], Q_p=[0.8]), population, atol=1e-9)
+        np.testing.assert_allclose(
+            analytic.dense(model, protocol).central(time), output)
+        with self.assertRaises(ValueError):
+            analytic.superposition(model, protocol, time)
+
+    def test_superposition(self):
+        """
+        Tests multiple dose profiles by superposition, and the steady state
+        of a regimen of repeated boluses.
+        """
+        time = np.linspace(0, 96, 193)
+        protocol = pk.Protocol(initial_dose=5.0, time_span=96)
+        protocol.add_bolus(10.0, time=12.0, interval=12.0, repeats=7)
+        model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=1.5)
+        model.add_compartment(1.0, 0.5)
+        solution = pk.Solution(backend='analytic')
+        np.testing.assert_allclose(
+            solution.superposition(model, protocol, time),
+            solution.solution(model, protocol, time), rtol=1e-10,
+            atol=1e-12)
+        protocol.add_infusion(1.0, 0.0, 1.0)
+        with self.assertRaises(ValueError):
+            solution.superposition(model, protocol, time)
+        # one compartment: trough 10 e^-k tau / (1 - e^-k tau)
+        model = pk.Model('iv', V_c=2.0, CL=0.5)
+        steady = solution.steady_state(model, 10.0, 8.0, time_res=81)
+        decay = np.exp(-0.25 * 8.0)
+        self.assertAlmostEqual(steady['trough'], 10.0 * decay / (1 - decay))
+        self.assertAlmostEqual(steady['peak'], 10.0 / (1 - decay))
+        self.assertAlmostEqual(steady['accumulation_ratio'], 1 / (1 - decay))
+        np.testing.assert_allclose(steady['time'], np.linspace(0, 8, 81))
+        with self.assertRaises(ValueError):
+            solution.steady_state(pk.Model('iv', CL=0.0), 10.0, 8.0)
+        with self.assertRaises(ValueError):
+            solution.steady_state(model, 10.0, -8.0)
+
+    def test_final_bolus(self):
+        """
+        Tests a bolus at the last time point is included there, as by
+        superposition, whichever way the pair is solved.
+        """
+        model = pk.Model('iv', V_c=2.0, CL=0.5)
+        model.add_compartment(4.0, 0.8)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        protocol.add_bolus(3.0, time=12.0, interval=12.0, repeats=2)
+        time = np.linspace(0, 24, 25)
+        expected = pk.Solution(backend='analytic').superposition(
+            model, protocol, time)
+        self.assertGreater(expected[-1], expected[-2])
+        for backend in ['analytic', 'compiled', 'ode']:
+            solution = pk.Solution(backend=backend, rtol=1e-9, atol=1e-12)
+            np.testing.assert_allclose(
+                solution.solution(model, protocol, time), expected,
+                rtol=1e-7)
+            np.testing.assert_allclose(
+                solution.solve_population('iv', protocol, time, V_c=2.0,
+                                          CL=[0.5, 0.5], V_p=[4.0],
+                                          Q_p=[0.8])[:, -1],
+                expected[-1], rtol=1e-7)
+            dense = solution.dense(model, protocol)
+            self.assertAlmostEqual(dense.central(24.0), expected[-1])
+            adaptive = solution.adaptive(model, protocol)
+            self.assertEqual(adaptive.t[-1], 24.0)
+            self.assertAlmostEqual(adaptive.central[-1], expected[-1])
+
+    def test_stream(self):
+        """
+        Tests that streamed windows join into the solution on the whole
+        time grid, with boluses at the boundaries between windows.
+        """
+        model = pk.Model('sc', V_c=2.0, CL=0.5, Ka=1.5)
+        model.add_compartment(4.0, 0.8)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=48)
+        protocol.add_bolus(5.0, time=12.0, interval=12.0, repeats=3)
+        protocol.add_infusion(1.0, 3.0, 7.0)
+        time = np.linspace(0, 48, 97)
+        for backend in ['analytic', 'compiled']:
+            solution = pk.Solution(backend=backend, rtol=1e-9, atol=1e-12)
+            expected = solution.solution(model, protocol, time,
+                                         full_output=True)
+            for window in [1, 24, 25, 200]:
+                windows = list(solution.stream(
+                    model, protocol, time_res=97, window=window,
+                    full_output=True))
+                self.assertEqual(len(windows), -(-96 // window))
+                t = np.concatenate([w[0] for w in windows])
+                y = np.concatenate([w[1] for w in windows], axis=1)
+                np.testing.assert_array_equal(t, time)
+                np.testing.assert_allclose(y, expected.y, atol=1e-8)
+        central = np.concatenate(
+            [y for _, y in solution.stream(model, protocol, time_res=97,
+                                           window=10)])
+        np.testing.assert_allclose(central, expected.central, atol=1e-8)
+        with self.assertRaises(ValueError):
+            next(solution.stream(model, protocol, time_res=1))
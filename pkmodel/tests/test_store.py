@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class ResultStoreTest(unittest.TestCase):
+    """
+    Tests the :class:`ResultStore` class.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'store')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_create(self):
+        """
+        Tests ResultStore creation.
+        """
+        with self.assertRaises(TypeError):
+            pk.ResultStore(1)
+        store = pk.ResultStore(self.path)
+        self.assertTrue(os.path.isdir(self.path))
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(store.get(('a', 1.0)))
+        self.assertEqual(store.misses, 1)
+
+    def test_put_get(self):
+        """
+        Tests stored values are read back memory-mapped, also by another
+        store on the same directory.
+        """
+        store = pk.ResultStore(self.path)
+        store.put(('a', 1.0), np.arange(4.0), {'model': 'm'})
+        self.assertIn(('a', 1.0), store)
+        self.assertNotIn(('a', 2.0), store)
+        value = pk.ResultStore(self.path).get(('a', 1.0))
+        self.assertIsInstance(value, np.memmap)
+        self.assertFalse(value.flags.writeable)
+        np.testing.assert_array_equal(value, np.arange(4.0))
+        digest, = store.digests()
+        self.assertEqual(digest, store.digest(('a', 1.0)))
+        self.assertEqual(store.info(digest),
+                         {'model': 'm', 'shape': [4], 'dtype': 'float64'})
+        store.remove(digest)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_solution(self):
+        """
+        Tests Solution reads solutions back from the store instead of
+        solving them again.
+        """
+        with self.assertRaises(TypeError):
+            pk.Solution(store=self.path)
+        model = pk.Model('sc')
+        model.add_compartment(1.0, 2.0)
+        protocol = pk.Protocol(initial_dose=2.0)
+        time = np.linspace(0, 1, 10)
+        first = pk.Solution(store=pk.ResultStore(self.path)).solution(
+            model, protocol, time)
+        store = pk.ResultStore(self.path)
+        cache = pk.ResultCache()
+        solution = pk.Solution(cache=cache, store=store)
+        np.testing.assert_array_equal(
+            solution.solution(model, protocol, time), first)
+        solution.solution(model, protocol, time)
+        self.assertEqual((store.hits, store.misses), (1, 0))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        info = store.info(store.digests()[0])
+        self.assertEqual(info['model'], model.name)
+        self.assertEqual(info['compartments'], [[1.0, 2.0]])
+        protocol.add_dose_function(lambda t, y: 1.0)
+        solution.solution(model, protocol, time)
+        self.assertEqual(len(store), 1)
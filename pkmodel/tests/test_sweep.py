@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import sweep
+
+
+class SweepTest(unittest.TestCase):
+    """
+    Tests the parameter sweeps and sensitivities.
+    """
+    def test_grid(self):
+        """
+        Tests the full factorial grid of parameter levels.
+        """
+        samples = sweep.grid(V_c=[1.0, 2.0], Q_p=[[0.5], [1.0], [2.0]])
+        np.testing.assert_array_equal(samples['V_c'], [1, 1, 1, 2, 2, 2])
+        self.assertEqual(samples['Q_p'].shape, (6, 1))
+        np.testing.assert_array_equal(samples['Q_p'][:3, 0], [0.5, 1, 2])
+        with self.assertRaises(ValueError):
+            sweep.grid(V_x=[1.0])
+
+    def test_latin_hypercube(self):
+        """
+        Tests that every stratum of every parameter is sampled once.
+        """
+        samples = sweep.latin_hypercube(
+            50, seed=0, CL=(1.0, 2.0), V_p=([1.0, 10.0], [2.0, 100.0]))
+        self.assertEqual(samples['V_p'].shape, (50, 2))
+        strata = np.floor((samples['CL'] - 1.0) * 50)
+        np.testing.assert_array_equal(np.sort(strata), np.arange(50))
+        log = sweep.latin_hypercube(50, seed=0, log=True,
+                                    V_p=([1.0, 10.0], [2.0, 100.0]))
+        strata = np.floor(np.log10(log['V_p'][:, 1] / 10.0) * 50)
+        np.testing.assert_array_equal(np.sort(strata), np.arange(50))
+        again = sweep.latin_hypercube(
+            50, seed=0, CL=(1.0, 2.0), V_p=([1.0, 10.0], [2.0, 100.0]))
+        np.testing.assert_array_equal(again['CL'], samples['CL'])
+        with self.assertRaises(ValueError):
+            sweep.latin_hypercube(10, log=True, CL=(0.0, 1.0))
+
+    def test_run(self):
+        """
+        Tests the exposure of a sweep against single model solutions.
+        """
+        time = np.linspace(0, 24, 97)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        samples = sweep.grid(CL=[0.5, 1.0], Ka=[1.0, 2.0])
+        solution = pk.Solution(backend='analytic')
+        results = pk.Sweep('sc', protocol, time, solution=solution,
+                           batch_size=3, V_c=2.0, V_p=[1.0],
+                           Q_p=[0.5]).run(samples)
+        self.assertEqual(results['profiles'].shape, (4, 97))
+        for i in range(4):
+            model = pk.Model('sc', V_c=2.0, CL=float(samples['CL'][i]),
+                             Ka=float(samples['Ka'][i]))
+            model.add_compartment(1.0, 0.5)
+            output = solution.solution(model, protocol, time)
+            np.testing.assert_allclose(results['profiles'][i], output)
+            self.assertAlmostEqual(results['cmax'][i], output.max())
+            self.assertEqual(results['tmax'][i], time[np.argmax(output)])
+            self.assertAlmostEqual(results['auc'][i], np.sum(
+                np.diff(time) * (output[1:] + output[:-1]) / 2))
+        concentration = pk.Sweep('iv', protocol, time, solution=solution,
+                                 concentration=True).run(
+            {'V_c': np.array([2.0])}, profiles=False)
+        self.assertNotIn('profiles', concentration)
+        self.assertAlmostEqual(concentration['cmax'][0], 5.0)
+
+    def test_sensitivities(self):
+        """
+        Tests the forward sensitivities against finite differences.
+        """
+        time = np.linspace(0, 24, 49)
+        protocol = pk.Protocol(initial_dose=10.0, time_span=24)
+        protocol.add_bolus(5.0, time=6.0)
+        samples = sweep.latin_hypercube(
+            3, seed=1, V_c=(1.0, 3.0), CL=(0.2, 1.0), Ka=(0.5, 2.0),
+            V_p=([1.0], [2.0]), Q_p=([0.1], [1.0]))
+        solver = pk.Sweep('sc', protocol, time, concentration=True,
+                          solution=pk.Solution(rtol=1e-10, atol=1e-12))
+        sensitivities = solver.sensitivities(samples)
+        self.assertEqual(list(sensitivities),
+                         ['V_c', 'CL', 'Ka', 'V_p[0]', 'Q_p[0]'])
+        base = solver.run(samples)['profiles']
+        for name in sweep.PARAMETERS:
+            shifted = dict(samples)
+            shifted[name] = samples[name] + 1e-6
+            difference = (solver.run(shifted)['profiles'] - base) / 1e-6
+            key = name if name in sensitivities else name + '[0]'
+            np.testing.assert_allclose(sensitivities[key], difference,
+                                       atol=1e-4)
+        # an iv bolus into one compartment: q_c = D exp(-CL t / V_c)
+        solver = pk.Sweep('iv', protocol, time, V_c=2.0, CL=0.5)
+        sensitivities = solver.sensitivities({})
+        expected = -time / 2.0 * 10.0 * np.exp(-0.25 * time)
+        np.testing.assert_allclose(sensitivities['CL'][0, :13],
+                                   expected[:13], rtol=1e-2, atol=1e-3)
+        np.testing.assert_array_equal(sensitivities['Ka'], 0.0)
@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class TrajectoryTest(unittest.TestCase):
+    """
+    Tests the :class:`Trajectory` class.
+    """
+    def test_create(self):
+        """
+        Tests Trajectory creation and its views of the data array.
+        """
+        data = np.arange(15.0).reshape(5, 3)
+        with self.assertRaises(ValueError):
+            pk.Trajectory(data, 'oral')
+        trajectory = pk.Trajectory(data, 'sc', nfev=10, status=0)
+        self.assertTrue(np.shares_memory(trajectory.t, data))
+        np.testing.assert_array_equal(trajectory.t, [0.0, 1.0, 2.0])
+        np.testing.assert_array_equal(trajectory.y, data[1:])
+        np.testing.assert_array_equal(trajectory.central, data[2])
+        np.testing.assert_array_equal(trajectory.peripheral, data[3:])
+        self.assertEqual(trajectory.stats,
+                         {'nfev': 10, 'njev': 0, 'nlu': 0, 'status': 0})
+        self.assertEqual(trajectory.nbytes, 120)
+        iv = pk.Trajectory(data, 'iv')
+        np.testing.assert_array_equal(iv.central, data[1])
+        np.testing.assert_array_equal(iv.peripheral, data[2:])
+
+    def test_copy(self):
+        """
+        Tests Trajectory copies own their data.
+        """
+        trajectory = pk.Trajectory(np.zeros((2, 3)), 'iv', nfev=4)
+        copy = trajectory.copy()
+        copy.data[0, 0] = 1.0
+        self.assertEqual(trajectory.data[0, 0], 0.0)
+        self.assertEqual(copy.nfev, 4)
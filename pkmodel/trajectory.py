@@ -0,0 +1,97 @@
+import numpy
+from .downsample import lttb
+
+
+class Trajectory:
+    """The Trajectory class holds the full solution of a model and protocol
+    pair: the time points and the amount of drug in every compartment,
+    together with the statistics of the solver which produced them. Times
+    and amounts share one contiguous array, with the times in row 0 and the
+    state variables q (ordered as in Solution.ode_system) below.
+    """
+    def __init__(self, data, delivery_mode: str, nfev: int = 0,
+                 njev: int = 0, nlu: int = 0, status: int = 0,
+                 message: str = ''):
+        """Initialises a trajectory from its data array and solver statistics.
+
+        Args:
+            data (numpy ndarray): shape (n + 1, T), the T time points in row
+                0 and the n state variables in the following rows
+            delivery_mode (str): the delivery mode of the model, 'iv' or 'sc'
+            nfev (int): the number of right-hand side evaluations
+            njev (int): the number of Jacobian evaluations
+            nlu (int): the number of LU decompositions
+            status (int): the solver status, 0 when it reached the end of
+                the time span
+            message (str): the solver message
+        """
+        if delivery_mode not in ['iv', 'sc']:
+            raise ValueError('delivery_mode must be "iv" or "sc"')
+        self.data = data
+        self.delivery_mode = delivery_mode
+        self.nfev = nfev
+        self.njev = njev
+        self.nlu = nlu
+        self.status = status
+        self.message = message
+
+    @property
+    def t(self):
+        """numpy (ndarray): the time points [hours]
+        """
+        return self.data[0]
+
+    @property
+    def y(self):
+        """numpy (ndarray): the state variables, shape (n, T) [ng]
+        """
+        return self.data[1:]
+
+    @property
+    def central(self):
+        """numpy (ndarray): the central compartment, as returned by
+        Solution.solution
+        """
+        return self.data[1 if self.delivery_mode == 'iv' else 2]
+
+    @property
+    def peripheral(self):
+        """numpy (ndarray): the peripheral compartments, shape (k, T)
+        """
+        return self.data[2 if self.delivery_mode == 'iv' else 3:]
+
+    @property
+    def stats(self) -> dict:
+        """dict: the solver statistics nfev, njev, nlu and status
+        """
+        return {'nfev': self.nfev, 'njev': self.njev, 'nlu': self.nlu,
+                'status': self.status}
+
+    @property
+    def nbytes(self) -> int:
+        """int: the memory held by the data array [bytes]
+        """
+        return self.data.nbytes
+
+    def copy(self):
+        """Returns a copy of the trajectory with its own data array.
+        """
+        return Trajectory(numpy.array(self.data), self.delivery_mode,
+                          self.nfev, self.njev, self.nlu, self.status,
+                          self.message)
+
+    def downsample(self, num_points: int):
+        """Returns a trajectory with at most num_points time points, chosen
+        by LTTB downsampling of the central compartment (see
+        pkmodel.downsample.lttb) so that the shape of the profile is kept.
+        Every state variable is kept at the chosen time points.
+
+        Args:
+            num_points (int): the number of time points, at least 3
+
+        Returns:
+            Trajectory: the downsampled trajectory
+        """
+        kept = lttb(self.t, self.central, num_points)
+        return Trajectory(self.data[:, kept], self.delivery_mode, self.nfev,
+                          self.njev, self.nlu, self.status, self.message)
@@ -80,6 +80,11 @@ setup(
         'six',
         'unittest2==0.5.0'
     ],
+    entry_points={
+        'console_scripts': [
+            'pkmodel=pkmodel.cli:main',
+        ],
+    },
     extras_require={
         'docs': [
             # Sphinx for doc generation. Version 1.7.3 has a bug:
@@ -87,6 +92,14 @@ setup(
             # Nice theme for docs
             'sphinx_rtd_theme',
         ],
+        'parquet': [
+            # pyarrow for Parquet and Arrow export
+            'pyarrow',
+        ],
+        'yaml': [
+            # PyYAML for YAML spec files
+            'pyyaml',
+        ],
         'dev': [
             # Flake8 for code style checking
             'flake8>=3',